@@ -54,6 +54,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'home.db_router.ReadReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -103,6 +104,31 @@ DATABASES = {
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds replica_1, replica_2, ...
+# with the primary's credentials. On SQLite the entries are database file
+# paths instead (e.g. copies kept in sync by litestream). Safe requests
+# read from a healthy replica unless the same client wrote within
+# REPLICA_PIN_SECONDS; writes and everything else use the primary.
+REPLICA_PIN_SECONDS = 5
+REPLICA_HEALTH_CHECK_INTERVAL = 10
+# Seconds a health probe may wait to connect to a PostgreSQL replica
+REPLICA_CONNECT_TIMEOUT = 2
+
+DATABASE_REPLICAS = []
+_replica_sqlite = DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+for _index, _replica in enumerate(filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    if _replica_sqlite:
+        _replica_settings = {'NAME': _replica.strip()}
+    else:
+        _replica_settings = {
+            'HOST': _replica.strip(),
+            'OPTIONS': dict(DATABASES['default'].get('OPTIONS', {}), connect_timeout=REPLICA_CONNECT_TIMEOUT),
+        }
+    DATABASES[f'replica_{_index}'] = dict(DATABASES['default'], TEST={'MIRROR': 'default'}, **_replica_settings)
+    DATABASE_REPLICAS.append(f'replica_{_index}')
+
+DATABASE_ROUTERS = ['home.db_router.ReplicaRouter']
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -211,11 +237,24 @@ LOGIN_URL = '/login-page/'  # Redirect here when login is required
 LOGOUT_REDIRECT_URL = '/login-page/'
 
 # Channel Layer Configuration for WebSocket
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# The in-memory layer only reaches websockets held by the same process, so
+# notifications sent by workers (process_order_queue) are lost with it.
+# Set CHANNEL_LAYER_REDIS_URL wherever those workers run.
+if os.getenv('CHANNEL_LAYER_REDIS_URL'):
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [os.getenv('CHANNEL_LAYER_REDIS_URL')],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
     }
-}
 
 # Redis Cache Configuration
 CACHES = {
@@ -230,6 +269,48 @@ CACHES = {
     }
 }
 
+# Optional in-process L1 cache in front of Redis for small, hot keys
+# (categories, product/category detail, version counters). Each worker keeps
+# its own bounded LRU and drops entries on invalidations broadcast over
+# Redis pub/sub; the TTL bounds staleness if a broadcast is missed.
+CACHE_L1_ENABLED = False
+CACHE_L1_MAX_ENTRIES = 1024
+CACHE_L1_TIMEOUT = 5  # seconds
+
+# Cache the final JSON body of product/category read endpoints and return it
+# as-is on a hit instead of unpickling serializer data and re-rendering it.
+CACHE_RENDERED_RESPONSES = True
+
+# Per-family cache hit/miss/latency counters (see /cache-stats/ and
+# `manage.py test_cache --stats`). Workers flush their deltas to Redis.
+CACHE_METRICS_ENABLED = True
+
+# How CacheManager stores values: 'json' (compact JSON with row tables,
+# for API payloads) or 'pickle'. Payloads above CACHE_COMPRESS_MIN_BYTES are
+# zlib-compressed; encoded payloads above CACHE_MAX_VALUE_BYTES are not
+# cached at all. CACHE_ADAPTIVE_TTL scales TTLs by each family's hit rate.
+CACHE_VALUE_CODEC = 'json'
+CACHE_COMPRESS_MIN_BYTES = 1024
+CACHE_MAX_VALUE_BYTES = 512 * 1024
+CACHE_ADAPTIVE_TTL = True
+
+# Flash-sale mode: products switched on with `manage.py flash_sale enable <id>`
+# keep their stock in Redis counters and skip the DB row lock at checkout.
+# Unsettled reservations go back to stock after FLASH_SALE_RESERVATION_TIMEOUT
+# seconds; run `manage.py flash_sale flush --loop` to write sales to the DB.
+FLASH_SALE_ENABLED = True
+FLASH_SALE_RESERVATION_TIMEOUT = 300
+
+# Websocket notifications are sent by a background thread after commit.
+# At most NOTIFICATIONS_QUEUE_SIZE wait to be sent (newer ones are dropped),
+# and a failed send is retried NOTIFICATIONS_MAX_RETRIES times.
+NOTIFICATIONS_QUEUE_SIZE = 10000
+NOTIFICATIONS_MAX_RETRIES = 3
+
+# `manage.py archive_orders` moves delivered orders older than this into the
+# archive tables; /my-orders/ still returns them after the hot orders.
+ORDER_ARCHIVE_AFTER_DAYS = 180
+
 # Use Redis for session storage as well
 SESSION_ENGINE = 'django.contrib.sessions.backends.cache'
 SESSION_CACHE_ALIAS = 'default'
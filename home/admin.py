@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from .models import *
 
 # Register your models here.
@@ -19,12 +19,30 @@ class OrderAdmin(admin.ModelAdmin):
     actions = ['mark_as_shipped', 'mark_as_delivered']
     
     def mark_as_shipped(self, request, queryset):
-        updated = queryset.update(status='shipped')
-        self.message_user(request, f'{updated} order(s) marked as shipped.')
+        self.transition(request, queryset, 'shipped')
     mark_as_shipped.short_description = "Mark selected orders as shipped"
     
     def mark_as_delivered(self, request, queryset):
-        updated = queryset.update(status='delivered')
-        self.message_user(request, f'{updated} order(s) marked as delivered.')
+        self.transition(request, queryset, 'delivered')
     mark_as_delivered.short_description = "Mark selected orders as delivered"
 
+    def transition(self, request, queryset, status):
+        selected = queryset.count()
+        rejected = queryset.transition(status)
+        self.message_user(request, f'{selected - len(rejected)} order(s) marked as {status}.')
+        if rejected:
+            shown = ', '.join(str(order_id) for order_id in rejected[:20])
+            more = f' and {len(rejected) - 20} more' if len(rejected) > 20 else ''
+            self.message_user(
+                request,
+                f'{len(rejected)} order(s) cannot move to {status}: {shown}{more}.',
+                level=messages.WARNING,
+            )
+
+
+@admin.register(OrderRequest)
+class OrderRequestAdmin(admin.ModelAdmin):
+    list_display = ['id', 'user', 'status', 'order', 'created_at', 'processed_at']
+    list_filter = ['status', 'created_at']
+    search_fields = ['user__username', 'user__email']
+    readonly_fields = ['created_at', 'processed_at']
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.functions import Lower
 
 
 class HomeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'home'
+
+    def ready(self):
+        from .models import Category, Product
+        # name__lower=value.lower() matches the Lower('name') indexes, which
+        # name__iexact (UPPER() on PostgreSQL) can't use. Registered on these
+        # two fields only, not on every CharField in the project.
+        for model in (Category, Product):
+            model._meta.get_field('name').register_lookup(Lower)
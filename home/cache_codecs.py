@@ -0,0 +1,135 @@
+from django.core.serializers.json import DjangoJSONEncoder
+import json
+import pickle
+import struct
+import zlib
+from typing import Any, Dict, Optional
+
+# Marker for a list of same-shaped dicts stored as one column list plus row tuples
+TABLE_MARKER = '__table__'
+
+
+def pack_tables(value: Any) -> Any:
+    """Replace lists of dicts sharing the same keys with {'__table__': [keys, rows]}
+
+    Listing payloads repeat every field name once per row; storing the names
+    once shrinks them considerably before compression even starts.
+    """
+    if isinstance(value, dict):
+        return {key: pack_tables(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        if len(value) > 1 and all(isinstance(item, dict) for item in value):
+            keys = list(value[0])
+            if all(list(item) == keys for item in value):
+                rows = [[pack_tables(item[key]) for key in keys] for item in value]
+                return {TABLE_MARKER: [keys, rows]}
+        return [pack_tables(item) for item in value]
+    return value
+
+
+def unpack_tables(value: Any) -> Any:
+    """Inverse of pack_tables"""
+    if isinstance(value, dict):
+        if len(value) == 1 and TABLE_MARKER in value:
+            keys, rows = value[TABLE_MARKER]
+            return [{key: unpack_tables(item) for key, item in zip(keys, row)} for row in rows]
+        return {key: unpack_tables(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [unpack_tables(item) for item in value]
+    return value
+
+
+class PickleCodec:
+    """Any picklable value; what django-redis would store by default"""
+    tag = b'p'
+
+    def encode(self, value: Any) -> bytes:
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class JSONCodec:
+    """Compact JSON with row tables; API payloads only (no Decimals or dates survive as such)"""
+    tag = b'j'
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(pack_tables(value), cls=DjangoJSONEncoder,
+                          separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def decode(self, data: bytes) -> Any:
+        return unpack_tables(json.loads(data))
+
+
+class RawCodec:
+    """Bytes stored as-is, e.g. pre-rendered response bodies"""
+    tag = b'r'
+
+    def encode(self, value: bytes) -> bytes:
+        return bytes(value)
+
+    def decode(self, data: bytes) -> bytes:
+        return data
+
+
+CODECS = {
+    'pickle': PickleCodec(),
+    'json': JSONCodec(),
+}
+_CODECS_BY_TAG = {codec.tag: codec for codec in list(CODECS.values()) + [RawCodec()]}
+
+# codec tag, compression flag, soft expiry timestamp
+HEADER = struct.Struct('>ccd')
+COMPRESSED = b'z'
+UNCOMPRESSED = b'-'
+ENVELOPE_KEYS = {'value', 'fresh_until'}
+
+
+def encode_entry(entry: Dict, codec_name: str = 'pickle', compress_min_bytes: int = 1024) -> bytes:
+    """Encode a cache envelope ({'value', 'fresh_until'}) into bytes"""
+    value = entry['value']
+    if isinstance(value, (bytes, bytearray)):
+        codec = _CODECS_BY_TAG[RawCodec.tag]
+        payload = codec.encode(value)
+    else:
+        codec = CODECS[codec_name]
+        try:
+            payload = codec.encode(value)
+        except (TypeError, ValueError):
+            codec = CODECS['pickle']
+            payload = codec.encode(value)
+
+    compression = UNCOMPRESSED
+    if compress_min_bytes is not None and len(payload) >= compress_min_bytes:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload, compression = compressed, COMPRESSED
+    return HEADER.pack(codec.tag, compression, entry['fresh_until']) + payload
+
+
+def decode_entry(data: Any) -> Optional[Dict]:
+    """Decode bytes produced by encode_entry back into a cache envelope
+
+    Anything else (a plain value cached by older code under the same key,
+    or bytes with an unknown header) gives None, to be treated as a miss.
+    """
+    if isinstance(data, dict):
+        # Written before values were encoded; only the envelope shape counts
+        if set(data) == ENVELOPE_KEYS:
+            return data
+        return None
+    if not isinstance(data, (bytes, bytearray)) or len(data) < HEADER.size:
+        return None
+    tag, compression, fresh_until = HEADER.unpack_from(data)
+    if tag not in _CODECS_BY_TAG or compression not in (COMPRESSED, UNCOMPRESSED):
+        return None
+    payload = data[HEADER.size:]
+    try:
+        if compression == COMPRESSED:
+            payload = zlib.decompress(payload)
+        value = _CODECS_BY_TAG[tag].decode(payload)
+    except Exception:
+        # Unpickling foreign bytes can fail in many ways; all of them are a miss
+        return None
+    return {'value': value, 'fresh_until': fresh_until}
@@ -0,0 +1,199 @@
+from django.conf import settings
+from django.core.cache import cache
+import bisect
+import logging
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class CacheMetrics:
+    """In-process cache counters and latency histograms, aggregated across workers
+
+    Each worker records into plain dicts under a lock and periodically adds
+    its deltas to a Redis hash, so recording costs no I/O and reads see the
+    sum over all workers.
+    """
+
+    COUNTERS = ('hits', 'l1_hits', 'stale_hits', 'misses', 'sets', 'rejected', 'invalidations', 'bytes_written')
+    LOOKUP_COUNTERS = ('hits', 'l1_hits', 'misses')
+
+    # Local hit rates need this many lookups before they are trusted, and
+    # are halved past LOOKUP_WINDOW so they follow recent traffic
+    MIN_LOOKUPS = 100
+    LOOKUP_WINDOW = 10000
+
+    # Upper bounds of the latency buckets, in milliseconds (last one is +inf)
+    LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250)
+
+    # Key prefix -> family, longest prefixes first
+    FAMILIES = (
+        ('products_by_category_', 'products_by_category'),
+        ('products_list', 'products_list'),
+        ('product_search', 'product_search'),
+        ('product_detail_', 'product_detail'),
+        ('categories_list', 'categories_list'),
+        ('category_detail_', 'category_detail'),
+        ('cache_version_', 'versions'),
+    )
+
+    METRICS_HASH_KEY = 'cache_metrics'
+    FLUSH_INTERVAL = 10
+
+    _lock = threading.Lock()
+    _counters = defaultdict(int)
+    # family -> [hits, lookups] in this worker, never flushed
+    _lookups = defaultdict(lambda: [0, 0])
+    _last_flush = time.monotonic()
+
+    @classmethod
+    def family_for(cls, cache_key: str) -> str:
+        """Key family used to break metrics down"""
+        for prefix, family in cls.FAMILIES:
+            if cache_key.startswith(prefix):
+                return family
+        return 'other'
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return getattr(settings, 'CACHE_METRICS_ENABLED', True)
+
+    @classmethod
+    def incr(cls, family: str, counter: str, amount: int = 1) -> None:
+        """Add to one counter of a family"""
+        if not cls.enabled():
+            return
+        with cls._lock:
+            cls._counters[f"{family}:{counter}"] += amount
+            if counter in cls.LOOKUP_COUNTERS:
+                lookups = cls._lookups[family]
+                if counter != 'misses':
+                    lookups[0] += amount
+                lookups[1] += amount
+                if lookups[1] > cls.LOOKUP_WINDOW:
+                    lookups[0] //= 2
+                    lookups[1] //= 2
+        cls._maybe_flush()
+
+    @classmethod
+    def local_hit_rate(cls, family: str):
+        """Recent hit rate of a family in this worker, or None without enough data"""
+        hits, lookups = cls._lookups.get(family, (0, 0))
+        if lookups < cls.MIN_LOOKUPS:
+            return None
+        return hits / lookups
+
+    @classmethod
+    def observe(cls, family: str, operation: str, seconds: float) -> None:
+        """Record the latency of one cache operation"""
+        if not cls.enabled():
+            return
+        bucket = bisect.bisect_left(cls.LATENCY_BUCKETS_MS, seconds * 1000)
+        with cls._lock:
+            cls._counters[f"{family}:{operation}_latency:{bucket}"] += 1
+            cls._counters[f"{family}:{operation}_latency_us_total"] += int(seconds * 1e6)
+        cls._maybe_flush()
+
+    @classmethod
+    def _take_deltas(cls) -> Dict[str, int]:
+        with cls._lock:
+            deltas = dict(cls._counters)
+            cls._counters.clear()
+            cls._last_flush = time.monotonic()
+        return deltas
+
+    @classmethod
+    def _maybe_flush(cls) -> None:
+        if time.monotonic() - cls._last_flush >= cls.FLUSH_INTERVAL:
+            cls.flush()
+
+    @classmethod
+    def flush(cls) -> None:
+        """Add this worker's deltas to the shared totals"""
+        deltas = cls._take_deltas()
+        if not deltas:
+            return
+        try:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+        except (ImportError, NotImplementedError):
+            client = None
+
+        try:
+            if client is not None:
+                pipeline = client.pipeline(transaction=False)
+                for field, amount in deltas.items():
+                    pipeline.hincrby(cls._hash_key(), field, amount)
+                pipeline.execute()
+            else:
+                totals = cache.get(cls._hash_key()) or {}
+                for field, amount in deltas.items():
+                    totals[field] = totals.get(field, 0) + amount
+                cache.set(cls._hash_key(), totals, None)
+        except Exception as e:
+            logger.warning("Failed to flush cache metrics: %s", e)
+
+    @classmethod
+    def _hash_key(cls) -> str:
+        return f"{settings.CACHES['default'].get('KEY_PREFIX', '')}:{cls.METRICS_HASH_KEY}"
+
+    @classmethod
+    def _read_totals(cls) -> Dict[str, int]:
+        try:
+            from django_redis import get_redis_connection
+            raw = get_redis_connection('default').hgetall(cls._hash_key())
+            return {field.decode(): int(value) for field, value in raw.items()}
+        except (ImportError, NotImplementedError):
+            return dict(cache.get(cls._hash_key()) or {})
+
+    @classmethod
+    def reset(cls) -> None:
+        """Drop local and shared metrics"""
+        cls._take_deltas()
+        try:
+            from django_redis import get_redis_connection
+            get_redis_connection('default').delete(cls._hash_key())
+        except (ImportError, NotImplementedError):
+            cache.delete(cls._hash_key())
+
+    @classmethod
+    def snapshot(cls) -> Dict[str, Any]:
+        """Metrics per key family, summed over every worker"""
+        cls.flush()
+        families = {}
+        for field, value in cls._read_totals().items():
+            family, name = field.split(':', 1)
+            stats = families.setdefault(family, {counter: 0 for counter in cls.COUNTERS})
+            if '_latency:' in name:
+                operation, bucket = name.split('_latency:')
+                histogram = stats.setdefault(f"{operation}_latency_ms", {})
+                histogram[cls._bucket_label(int(bucket))] = value
+            else:
+                stats[name] = value
+
+        for stats in families.values():
+            # stale_hits are a subset of hits: served past their soft expiry
+            lookups = stats['hits'] + stats['l1_hits'] + stats['misses']
+            stats['hit_rate'] = round((lookups - stats['misses']) / lookups, 4) if lookups else None
+            for operation in ('get', 'set'):
+                histogram = stats.get(f"{operation}_latency_ms")
+                total_us = stats.pop(f"{operation}_latency_us_total", 0)
+                if histogram:
+                    stats[f"{operation}_latency_ms"] = dict(
+                        sorted(histogram.items(), key=lambda item: cls._bucket_order(item[0]))
+                    )
+                    stats[f"{operation}_avg_ms"] = round(total_us / sum(histogram.values()) / 1000, 3)
+        return families
+
+    @classmethod
+    def _bucket_label(cls, bucket: int) -> str:
+        if bucket >= len(cls.LATENCY_BUCKETS_MS):
+            return "+inf"
+        return f"<={cls.LATENCY_BUCKETS_MS[bucket]}"
+
+    @classmethod
+    def _bucket_order(cls, label: str) -> float:
+        return float('inf') if label == '+inf' else float(label[2:])
@@ -1,7 +1,91 @@
 from django.core.cache import cache
 from django.conf import settings
+from django.db import transaction
+from .cache_metrics import CacheMetrics
+from .cache_codecs import encode_entry, decode_entry
+from .db_router import use_primary
+import hashlib
 import json
-from typing import List, Dict, Any, Optional
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+
+class LocalCache:
+    """Bounded in-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_entries: int, timeout: float):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        """Get a value, or None if missing or expired"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a value, evicting the least recently used entries over the bound"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete_many(self, keys: List[str]) -> None:
+        """Drop the given keys"""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry"""
+        with self._lock:
+            self._data.clear()
+
+
+class InvalidationBatch:
+    """De-duplicated set of cache keys to delete and version counters to bump"""
+
+    def __init__(self):
+        self.delete_keys = set()
+        self.version_keys = set()
+        self.on_commit = None
+        # Set once the on_commit flush has run; later invalidations need a new batch
+        self.flushed = False
+
+    def add(self, delete_keys: List[str], version_keys: List[str]) -> None:
+        self.delete_keys.update(delete_keys)
+        self.version_keys.update(version_keys)
+
+    def update(self, other: 'InvalidationBatch') -> None:
+        self.add(other.delete_keys, other.version_keys)
+
+    def is_empty(self) -> bool:
+        return not self.delete_keys and not self.version_keys
+
+    def clear(self) -> None:
+        self.delete_keys.clear()
+        self.version_keys.clear()
+
+
+_invalidation_state = threading.local()
+
 
 class CacheManager:
     """Cache manager for products and categories"""
@@ -12,154 +96,635 @@ class CacheManager:
     CATEGORIES_CACHE_KEY = 'categories_list'
     CATEGORY_DETAIL_CACHE_KEY = 'category_detail_{}'
     PRODUCTS_BY_CATEGORY_CACHE_KEY = 'products_by_category_{}'
+    PRODUCT_SEARCH_CACHE_KEY = 'product_search'
+
+    # Version counters baked into the list keys. Bumping a counter orphans
+    # every key built with the old value, so one INCR invalidates all filter
+    # combinations of a family without scanning or deleting keys.
+    PRODUCTS_VERSION_KEY = 'cache_version_products'
+    CATEGORIES_VERSION_KEY = 'cache_version_categories'
+    CATEGORY_VERSION_KEY = 'cache_version_category_{}'
+    # Moves only when searchable catalog text may have changed, not on
+    # stock or price updates; the in-process search index follows it
+    SEARCH_INDEX_VERSION_KEY = 'cache_version_search_index'
+    # Version counter -> key family it invalidates, for metrics
+    VERSION_FAMILIES = {
+        PRODUCTS_VERSION_KEY: 'products_list',
+        CATEGORIES_VERSION_KEY: 'categories_list',
+        SEARCH_INDEX_VERSION_KEY: 'search_index',
+    }
     
     # Cache timeout (1 hour)
     CACHE_TIMEOUT = 3600
+
+    # Product listing pagination. Only the first pages of each
+    # filter/ordering/page-size family are cached so deep crawls can't
+    # flood Redis with single-use keys.
+    PRODUCTS_PAGE_SIZE = 10
+    PRODUCTS_MAX_CACHED_PAGES = 20
+
+    # Stale-while-revalidate: entries older than SOFT_TIMEOUT are still
+    # served, but the first reader to notice takes a short lock and
+    # recomputes them before the hard CACHE_TIMEOUT expiry.
+    SOFT_TIMEOUT = 3000
+    LOCK_TIMEOUT = 10
+    # How long a reader with nothing to serve waits for the lock holder
+    LOCK_WAIT = 2.0
+    LOCK_POLL_INTERVAL = 0.05
+
+    # Range of the TTL multiplier applied with CACHE_ADAPTIVE_TTL, from a
+    # 0% to a 100% hit rate
+    MIN_TTL_FACTOR = 0.5
+    MAX_TTL_FACTOR = 2.0
+
+    # Keys small and hot enough to keep in the optional per-worker L1 cache
+    # (CACHE_L1_ENABLED). Everything else always goes to Redis.
+    L1_KEY_PREFIXES = ('categories_list', 'category_detail_', 'product_detail_', 'cache_version_')
+    INVALIDATION_CHANNEL = 'cache_invalidation'
+    _local_cache = None
+    _local_cache_lock = threading.Lock()
+    _pubsub_enabled = False
+
+    @classmethod
+    def _get_local_cache(cls) -> Optional[LocalCache]:
+        """Get this worker's L1 cache, creating it on first use"""
+        if not getattr(settings, 'CACHE_L1_ENABLED', False):
+            return None
+        if cls._local_cache is None:
+            with cls._local_cache_lock:
+                if cls._local_cache is None:
+                    cls._local_cache = LocalCache(
+                        getattr(settings, 'CACHE_L1_MAX_ENTRIES', 1024),
+                        getattr(settings, 'CACHE_L1_TIMEOUT', 5),
+                    )
+                    cls._start_invalidation_listener()
+        return cls._local_cache
+
+    @classmethod
+    def _local_cache_for(cls, cache_key: str) -> Optional[LocalCache]:
+        """Get the L1 cache if this key is allowed to live in it"""
+        if not cache_key.startswith(cls.L1_KEY_PREFIXES):
+            return None
+        return cls._get_local_cache()
+
+    @classmethod
+    def _invalidation_channel(cls) -> str:
+        return f"{settings.CACHES['default'].get('KEY_PREFIX', '')}:{cls.INVALIDATION_CHANNEL}"
+
+    @classmethod
+    def _start_invalidation_listener(cls) -> None:
+        """Subscribe this worker to L1 invalidations published by the others"""
+        try:
+            from django_redis import get_redis_connection
+            get_redis_connection('default')
+        except (ImportError, NotImplementedError) as e:
+            # Not on django-redis: L1 entries just live out their short TTL
+            logger.info("L1 cache invalidation listener disabled: %s", e)
+            return
+        cls._pubsub_enabled = True
+
+        def listen():
+            while True:
+                try:
+                    pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(cls._invalidation_channel())
+                    # Anything published while we were disconnected is lost
+                    cls._local_cache.clear()
+                    for message in pubsub.listen():
+                        keys = json.loads(message['data'])
+                        if keys is None:
+                            cls._local_cache.clear()
+                        else:
+                            cls._local_cache.delete_many(keys)
+                except Exception as e:
+                    logger.warning("L1 cache invalidation listener error: %s", e)
+                    time.sleep(1)
+
+        threading.Thread(target=listen, name='cache-l1-invalidation', daemon=True).start()
+
+    @classmethod
+    def _broadcast_invalidation(cls, keys: Optional[List[str]]) -> None:
+        """Drop keys from every worker's L1 cache (None drops everything)"""
+        local_cache = cls._get_local_cache()
+        if local_cache is None:
+            return
+        if keys is None:
+            local_cache.clear()
+        else:
+            local_cache.delete_many(keys)
+        if not cls._pubsub_enabled:
+            return
+        try:
+            from django_redis import get_redis_connection
+            get_redis_connection('default').publish(cls._invalidation_channel(), json.dumps(keys))
+        except Exception as e:
+            logger.warning("Failed to broadcast cache invalidation: %s", e)
+
+    @classmethod
+    def _initial_version(cls) -> int:
+        """Starting value for a missing counter"""
+        # Millisecond clock instead of 1, so a counter that was evicted and
+        # recreated never reuses a version that may still have live keys.
+        return int(time.time() * 1000)
+
+    @classmethod
+    def get_version(cls, version_key: str) -> int:
+        """Get the current value of a version counter, creating it if missing"""
+        local_cache = cls._local_cache_for(version_key)
+        version = local_cache.get(version_key) if local_cache else None
+        if version is not None:
+            CacheMetrics.incr('versions', 'l1_hits')
+            return version
+
+        start = time.perf_counter()
+        version = cache.get(version_key)
+        CacheMetrics.observe('versions', 'get', time.perf_counter() - start)
+        CacheMetrics.incr('versions', 'hits' if version is not None else 'misses')
+        if version is None:
+            version = cls._initial_version()
+            # add() so concurrent workers agree on a single initial value
+            if not cache.add(version_key, version, None):
+                version = cache.get(version_key, version)
+        if local_cache:
+            local_cache.set(version_key, version)
+        return version
+
+    @classmethod
+    def bump_version(cls, version_key: str, broadcast: bool = True) -> None:
+        """Increment a version counter, orphaning every key built from it"""
+        try:
+            cache.incr(version_key)
+        except ValueError:
+            # Counter was never read or got evicted; any fresh value works
+            cache.add(version_key, cls._initial_version(), None)
+        if broadcast:
+            cls._broadcast_invalidation([version_key])
     
     @classmethod
-    def get_products_cache_key(cls, filters: Dict[str, Any] = None) -> str:
-        """Generate cache key for products with filters"""
-        if not filters:
-            return cls.PRODUCTS_CACHE_KEY
-        
-        # Create a sorted string of filters for consistent cache keys
-        filter_str = '_'.join([f"{k}_{v}" for k, v in sorted(filters.items()) if v])
-        return f"{cls.PRODUCTS_CACHE_KEY}_{filter_str}"
+    def _get_entry(cls, cache_key: str) -> Optional[Dict]:
+        """Get the raw cache envelope ({'value', 'fresh_until'})"""
+        family = CacheMetrics.family_for(cache_key)
+        local_cache = cls._local_cache_for(cache_key)
+        if local_cache:
+            entry = local_cache.get(cache_key)
+            # A soft-expired L1 copy may already be refreshed in Redis
+            if entry is not None and time.time() < entry['fresh_until']:
+                CacheMetrics.incr(family, 'l1_hits')
+                return entry
+
+        start = time.perf_counter()
+        raw = cache.get(cache_key)
+        CacheMetrics.observe(family, 'get', time.perf_counter() - start)
+        entry = decode_entry(raw) if raw is not None else None
+        CacheMetrics.incr(family, 'hits' if entry is not None else 'misses')
+        if local_cache and entry is not None:
+            local_cache.set(cache_key, entry)
+        return entry
+
+    @classmethod
+    def _get(cls, cache_key: str) -> Any:
+        """Get a cached value, ignoring its soft expiry"""
+        entry = cls._get_entry(cache_key)
+        return entry['value'] if entry is not None else None
+
+    @classmethod
+    def _set(cls, cache_key: str, value: Any, timeout: int = None, soft_timeout: int = None) -> None:
+        """Cache a value wrapped with its soft expiry time"""
+        cls.set_many({cache_key: value}, timeout, soft_timeout)
+
+    @classmethod
+    def _ttl_factor(cls, family: str) -> float:
+        """Scale TTLs by how often a family is actually re-read
+
+        Families nobody re-reads expire sooner and free memory; hot ones
+        live longer. Versioned keys and explicit deletes keep this safe.
+        """
+        if not getattr(settings, 'CACHE_ADAPTIVE_TTL', False):
+            return 1.0
+        hit_rate = CacheMetrics.local_hit_rate(family)
+        if hit_rate is None:
+            return 1.0
+        return cls.MIN_TTL_FACTOR + (cls.MAX_TTL_FACTOR - cls.MIN_TTL_FACTOR) * hit_rate
+
+    @classmethod
+    def set_many(cls, values: Dict[str, Any], timeout: int = None, soft_timeout: int = None) -> None:
+        """Cache several values, encoded and size-checked, in one pipelined write per TTL"""
+        codec = getattr(settings, 'CACHE_VALUE_CODEC', 'pickle')
+        compress_min_bytes = getattr(settings, 'CACHE_COMPRESS_MIN_BYTES', None)
+        max_bytes = getattr(settings, 'CACHE_MAX_VALUE_BYTES', None)
+        timeout = cls.CACHE_TIMEOUT if timeout is None else timeout
+        soft_timeout = cls.SOFT_TIMEOUT if soft_timeout is None else soft_timeout
+        now = time.time()
+
+        # Adaptive TTLs differ per family, so group writes by timeout
+        batches = {}
+        entries = {}
+        for cache_key, value in values.items():
+            family = CacheMetrics.family_for(cache_key)
+            factor = cls._ttl_factor(family)
+            entry = {'value': value, 'fresh_until': now + soft_timeout * factor}
+            data = encode_entry(entry, codec, compress_min_bytes)
+            if max_bytes and len(data) > max_bytes:
+                CacheMetrics.incr(family, 'rejected')
+                logger.debug("Not caching %s: %d bytes over the %d byte limit", cache_key, len(data), max_bytes)
+                continue
+            entries[cache_key] = entry
+            batches.setdefault(int(timeout * factor), {})[cache_key] = data
+            CacheMetrics.incr(family, 'sets')
+            CacheMetrics.incr(family, 'bytes_written', len(data))
+
+        for batch_timeout, batch in batches.items():
+            start = time.perf_counter()
+            cache.set_many(batch, batch_timeout)
+            elapsed = (time.perf_counter() - start) / len(batch)
+            for cache_key in batch:
+                CacheMetrics.observe(CacheMetrics.family_for(cache_key), 'set', elapsed)
+
+        for cache_key, entry in entries.items():
+            local_cache = cls._local_cache_for(cache_key)
+            if local_cache:
+                local_cache.set(cache_key, entry)
+
+    @classmethod
+    def get_rendered_cache_key(cls, cache_key: str) -> str:
+        """Key holding the pre-rendered JSON body of a cached payload"""
+        return f"{cache_key}_json"
+
+    @classmethod
+    def get_or_compute(cls, cache_key: str, compute: Callable[[], Any], timeout: int = None,
+                       soft_timeout: int = None, cacheable: Callable[[Any], bool] = None) -> Any:
+        """Get a value from cache, recomputing it in a single worker on miss or soft expiry
+
+        Only the worker holding the short lock calls ``compute``; the others
+        serve the stale entry if there is one, or wait up to LOCK_WAIT for
+        the fresh value. ``cacheable`` can veto storing a computed value.
+        """
+        entry = cls._get_entry(cache_key)
+        if entry is not None and time.time() < entry['fresh_until']:
+            return entry['value']
+
+        lock_key = f"{cache_key}_lock"
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, cls.LOCK_TIMEOUT):
+            try:
+                # A lagging replica would be cached for the whole TTL; fill from the primary
+                with use_primary():
+                    value = compute()
+                if cacheable is None or cacheable(value):
+                    cls._set(cache_key, value, timeout, soft_timeout)
+                return value
+            finally:
+                # Don't release a lock that expired and was taken by someone else
+                if cache.get(lock_key) == token:
+                    cache.delete(lock_key)
+
+        if entry is not None:
+            CacheMetrics.incr(CacheMetrics.family_for(cache_key), 'stale_hits')
+            return entry['value']
+
+        deadline = time.time() + cls.LOCK_WAIT
+        while time.time() < deadline:
+            time.sleep(cls.LOCK_POLL_INTERVAL)
+            entry = cls._get_entry(cache_key)
+            if entry is not None:
+                return entry['value']
+
+        # Lock holder is slow or failed; don't keep the request waiting
+        return compute()
+
+    @classmethod
+    def get_products_cache_key(cls, filters: Dict[str, Any] = None, ordering: List[str] = None,
+                               page: int = 1, page_size: int = None, fields: List[str] = None) -> str:
+        """Generate cache key for one page of products with filters, ordering and sparse fields"""
+        version = cls.get_version(cls.PRODUCTS_VERSION_KEY)
+        key = f"{cls.PRODUCTS_CACHE_KEY}_v{version}"
+        if filters:
+            # Create a sorted string of filters for consistent cache keys
+            filter_str = '_'.join([f"{k}_{v}" for k, v in sorted(filters.items()) if v])
+            if filter_str:
+                key = f"{key}_{filter_str}"
+        if ordering:
+            key = f"{key}_o_{','.join(ordering)}"
+        if fields:
+            key = f"{key}_f_{','.join(fields)}"
+        return f"{key}_p_{page}_s_{page_size or cls.PRODUCTS_PAGE_SIZE}"
+
+    @classmethod
+    def get_product_search_cache_key(cls, query: str, page: int = 1, page_size: int = None,
+                                     fields: List[str] = None) -> str:
+        """Generate cache key for one page of search results; any product change invalidates it"""
+        version = cls.get_version(cls.PRODUCTS_VERSION_KEY)
+        # Hash the normalized query: it is user input of any length and alphabet
+        digest = hashlib.sha1(' '.join(query.lower().split()).encode()).hexdigest()
+        key = f"{cls.PRODUCT_SEARCH_CACHE_KEY}_v{version}_{digest}"
+        if fields:
+            key = f"{key}_f_{','.join(fields)}"
+        return f"{key}_p_{page}_s_{page_size or cls.PRODUCTS_PAGE_SIZE}"
+
+    @classmethod
+    def get_categories_cache_key(cls, fields: List[str] = None) -> str:
+        """Generate cache key for the categories list, optionally with sparse fields"""
+        version = cls.get_version(cls.CATEGORIES_VERSION_KEY)
+        key = f"{cls.CATEGORIES_CACHE_KEY}_v{version}"
+        return f"{key}_f_{','.join(fields)}" if fields else key
+
+    @classmethod
+    def get_products_by_category_cache_key(cls, category_id: int) -> str:
+        """Generate cache key for the products of one category"""
+        version = cls.get_version(cls.CATEGORY_VERSION_KEY.format(category_id))
+        return f"{cls.PRODUCTS_BY_CATEGORY_CACHE_KEY.format(category_id)}_v{version}"
     
     @classmethod
-    def get_products(cls, filters: Dict[str, Any] = None) -> Optional[List[Dict]]:
+    def get_product_detail_cache_key(cls, product_id: int) -> str:
+        """Generate cache key for a single product"""
+        return cls.PRODUCT_DETAIL_CACHE_KEY.format(product_id)
+
+    @classmethod
+    def get_category_detail_cache_key(cls, category_id: int) -> str:
+        """Generate cache key for a single category"""
+        return cls.CATEGORY_DETAIL_CACHE_KEY.format(category_id)
+    
+    @classmethod
+    def get_products(cls, filters: Dict[str, Any] = None, ordering: List[str] = None,
+                     page: int = 1, page_size: int = None) -> Optional[List[Dict]]:
         """Get products from cache"""
-        cache_key = cls.get_products_cache_key(filters)
-        return cache.get(cache_key)
+        if page > cls.PRODUCTS_MAX_CACHED_PAGES:
+            return None
+        cache_key = cls.get_products_cache_key(filters, ordering, page, page_size)
+        return cls._get(cache_key)
     
     @classmethod
-    def set_products(cls, products: List[Dict], filters: Dict[str, Any] = None) -> None:
+    def set_products(cls, products: List[Dict], filters: Dict[str, Any] = None, ordering: List[str] = None,
+                     page: int = 1, page_size: int = None) -> None:
         """Cache products"""
-        cache_key = cls.get_products_cache_key(filters)
-        cache.set(cache_key, products, cls.CACHE_TIMEOUT)
-        print(f"Cached products with key: {cache_key}")
+        if page > cls.PRODUCTS_MAX_CACHED_PAGES:
+            return
+        cache_key = cls.get_products_cache_key(filters, ordering, page, page_size)
+        cls._set(cache_key, products)
     
     @classmethod
     def get_product_detail(cls, product_id: int) -> Optional[Dict]:
         """Get product detail from cache"""
         cache_key = cls.PRODUCT_DETAIL_CACHE_KEY.format(product_id)
-        return cache.get(cache_key)
+        return cls._get(cache_key)
     
     @classmethod
     def set_product_detail(cls, product_id: int, product_data: Dict) -> None:
         """Cache product detail"""
         cache_key = cls.PRODUCT_DETAIL_CACHE_KEY.format(product_id)
-        cache.set(cache_key, product_data, cls.CACHE_TIMEOUT)
-        print(f"Cached product detail with key: {cache_key}")
+        cls._set(cache_key, product_data)
+    
+    @classmethod
+    def get_product_details(cls, product_ids: List[int]) -> Dict[int, Dict]:
+        """Get several product details from cache in one round trip
+
+        Returns only the ids that were cached; L1 hits never touch Redis.
+        """
+        found = {}
+        keys = {}
+        for product_id in product_ids:
+            cache_key = cls.get_product_detail_cache_key(product_id)
+            local_cache = cls._local_cache_for(cache_key)
+            entry = local_cache.get(cache_key) if local_cache else None
+            if entry is not None:
+                found[product_id] = entry['value']
+            else:
+                keys[cache_key] = product_id
+
+        if found:
+            CacheMetrics.incr('product_detail', 'l1_hits', len(found))
+        if keys:
+            start = time.perf_counter()
+            entries = cache.get_many(list(keys))
+            CacheMetrics.observe('product_detail', 'get', time.perf_counter() - start)
+            entries = {cache_key: decode_entry(raw) for cache_key, raw in entries.items()}
+            entries = {cache_key: entry for cache_key, entry in entries.items() if entry is not None}
+            CacheMetrics.incr('product_detail', 'hits', len(entries))
+            CacheMetrics.incr('product_detail', 'misses', len(keys) - len(entries))
+            for cache_key, entry in entries.items():
+                found[keys[cache_key]] = entry['value']
+                local_cache = cls._local_cache_for(cache_key)
+                if local_cache:
+                    local_cache.set(cache_key, entry)
+        return found
+
+    @classmethod
+    def set_product_details(cls, products: Dict[int, Dict]) -> None:
+        """Cache several product details in one pipelined write"""
+        cls.set_many({
+            cls.get_product_detail_cache_key(product_id): data
+            for product_id, data in products.items()
+        })
     
     @classmethod
     def get_categories(cls) -> Optional[List[Dict]]:
         """Get categories from cache"""
-        return cache.get(cls.CATEGORIES_CACHE_KEY)
+        return cls._get(cls.get_categories_cache_key())
     
     @classmethod
     def set_categories(cls, categories: List[Dict]) -> None:
         """Cache categories"""
-        cache.set(cls.CATEGORIES_CACHE_KEY, categories, cls.CACHE_TIMEOUT)
-        print(f"Cached categories with key: {cls.CATEGORIES_CACHE_KEY}")
+        cache_key = cls.get_categories_cache_key()
+        cls._set(cache_key, categories)
     
     @classmethod
     def get_category_detail(cls, category_id: int) -> Optional[Dict]:
         """Get category detail from cache"""
         cache_key = cls.CATEGORY_DETAIL_CACHE_KEY.format(category_id)
-        return cache.get(cache_key)
+        return cls._get(cache_key)
     
     @classmethod
     def set_category_detail(cls, category_id: int, category_data: Dict) -> None:
         """Cache category detail"""
         cache_key = cls.CATEGORY_DETAIL_CACHE_KEY.format(category_id)
-        cache.set(cache_key, category_data, cls.CACHE_TIMEOUT)
-        print(f"Cached category detail with key: {cache_key}")
+        cls._set(cache_key, category_data)
     
     @classmethod
     def get_products_by_category(cls, category_id: int) -> Optional[List[Dict]]:
         """Get products by category from cache"""
-        cache_key = cls.PRODUCTS_BY_CATEGORY_CACHE_KEY.format(category_id)
-        return cache.get(cache_key)
+        cache_key = cls.get_products_by_category_cache_key(category_id)
+        return cls._get(cache_key)
     
     @classmethod
     def set_products_by_category(cls, category_id: int, products: List[Dict]) -> None:
         """Cache products by category"""
-        cache_key = cls.PRODUCTS_BY_CATEGORY_CACHE_KEY.format(category_id)
-        cache.set(cache_key, products, cls.CACHE_TIMEOUT)
-        print(f"Cached products by category with key: {cache_key}")
+        cache_key = cls.get_products_by_category_cache_key(category_id)
+        cls._set(cache_key, products)
     
     @classmethod
-    def invalidate_product_cache(cls, product_id: int = None) -> None:
-        """Invalidate product-related cache"""
+    def bump_versions(cls, version_keys: List[str]) -> None:
+        """Increment several version counters in one round trip"""
+        try:
+            from django_redis import get_redis_connection
+            client = get_redis_connection('default')
+        except (ImportError, NotImplementedError):
+            for version_key in version_keys:
+                cls.bump_version(version_key, broadcast=False)
+            return
+
+        pipeline = client.pipeline(transaction=False)
+        for version_key in version_keys:
+            pipeline.incr(cache.make_key(version_key))
+        for version_key, version in zip(version_keys, pipeline.execute()):
+            if version == 1:
+                # INCR created a missing counter; move it off low values
+                cache.set(version_key, cls._initial_version(), None)
+
+    @classmethod
+    def _current_invalidation_batch(cls) -> Optional['InvalidationBatch']:
+        """Batch that should collect invalidations right now, if any
+
+        Inside a transaction this is a batch flushed by on_commit, so nothing
+        is invalidated before the data is visible and a rollback drops it.
+        """
+        batch = getattr(_invalidation_state, 'batch', None)
+        if batch is not None:
+            return batch
+
+        connection = transaction.get_connection()
+        if not connection.in_atomic_block:
+            return None
+        batch = getattr(_invalidation_state, 'transaction_batch', None)
+        # A rollback discards the on_commit callback, and a callback run early
+        # (captureOnCommitCallbacks(execute=True)) stays listed after it ran;
+        # either way invalidations added to that batch would never be applied
+        if (batch is None or batch.flushed
+                or not any(item[1] is batch.on_commit for item in connection.run_on_commit)):
+            batch = InvalidationBatch()
+            batch.on_commit = lambda batch=batch: cls._flush_transaction_batch(batch)
+            _invalidation_state.transaction_batch = batch
+            transaction.on_commit(batch.on_commit)
+        return batch
+
+    @classmethod
+    def _flush_transaction_batch(cls, batch: 'InvalidationBatch') -> None:
+        batch.flushed = True
+        cls._apply_invalidation(batch)
+
+    @classmethod
+    @contextmanager
+    def batched_invalidation(cls):
+        """Collect every invalidation in the block and apply them once at the end
+
+        Meant for bulk writes; inside a transaction the batch is handed over to
+        the transaction's on_commit flush instead.
+        """
+        if getattr(_invalidation_state, 'batch', None) is not None:
+            yield
+            return
+        batch = InvalidationBatch()
+        _invalidation_state.batch = batch
+        try:
+            yield
+        finally:
+            _invalidation_state.batch = None
+        transaction_batch = cls._current_invalidation_batch()
+        if transaction_batch is not None:
+            transaction_batch.update(batch)
+        else:
+            cls._apply_invalidation(batch)
+
+    @classmethod
+    def _invalidate(cls, delete_keys: List[str], version_keys: List[str]) -> None:
+        """Delete keys and bump versions now, or queue them on the current batch"""
+        batch = cls._current_invalidation_batch()
+        if batch is None:
+            batch = InvalidationBatch()
+            batch.add(delete_keys, version_keys)
+            cls._apply_invalidation(batch)
+        else:
+            batch.add(delete_keys, version_keys)
+
+    @classmethod
+    def _apply_invalidation(cls, batch: 'InvalidationBatch') -> None:
+        """Apply a batch: one delete_many, one pipelined version bump, one broadcast"""
+        if batch.is_empty():
+            return
+        delete_keys = sorted(batch.delete_keys)
+        version_keys = sorted(batch.version_keys)
+        batch.clear()
+        if delete_keys:
+            cache.delete_many(delete_keys)
+        if version_keys:
+            cls.bump_versions(version_keys)
+        cls._broadcast_invalidation(delete_keys + version_keys)
+
+        for cache_key in delete_keys:
+            CacheMetrics.incr(CacheMetrics.family_for(cache_key), 'invalidations')
+        for version_key in version_keys:
+            CacheMetrics.incr(cls.VERSION_FAMILIES.get(version_key, 'products_by_category'), 'invalidations')
+        logger.debug("Invalidated %d cache keys and %d versions", len(delete_keys), len(version_keys))
+
+    @classmethod
+    def invalidate_product_cache(cls, product_id: int = None, category_id: int = None,
+                                 content_changed: bool = True) -> None:
+        """Invalidate product-related cache
+
+        Pass the product's ``category_id`` when known; otherwise it is looked up.
+        Pass ``content_changed=False`` for stock-only updates, which leave the
+        search index alone.
+        """
+        delete_keys = []
+        # Invalidate every products list, with and without filters
+        version_keys = [cls.PRODUCTS_VERSION_KEY]
+        if content_changed:
+            version_keys.append(cls.SEARCH_INDEX_VERSION_KEY)
         if product_id:
-            # Invalidate specific product cache
-            cache_key = cls.PRODUCT_DETAIL_CACHE_KEY.format(product_id)
-            cache.delete(cache_key)
-            print(f"Invalidated product detail cache: {cache_key}")
-        
-        # Invalidate all products list cache (with and without filters)
-        cache.delete(cls.PRODUCTS_CACHE_KEY)
+            # Invalidate specific product cache, both data and rendered body
+            cache_key = cls.get_product_detail_cache_key(product_id)
+            delete_keys += [cache_key, cls.get_rendered_cache_key(cache_key)]
+
+            if category_id is None:
+                from .models import Product
+                category_id = Product.objects.filter(id=product_id).values_list('category_id', flat=True).first()
         
         # Invalidate products by category cache
-        from .models import Product
-        if product_id:
-            try:
-                product = Product.objects.get(id=product_id)
-                category_cache_key = cls.PRODUCTS_BY_CATEGORY_CACHE_KEY.format(product.category.id)
-                cache.delete(category_cache_key)
-                print(f"Invalidated products by category cache: {category_cache_key}")
-            except Product.DoesNotExist:
-                pass
-        
-        # Clear common filter patterns manually
-        common_filters = [
-            {'category': '1'}, {'category': '2'}, {'category': '3'},
-            {'min_price': '100'}, {'max_price': '500'},
-            {'category': '1', 'min_price': '100'}, {'category': '1', 'max_price': '500'},
-            {'min_price': '100', 'max_price': '500'}
-        ]
-        
-        for filters in common_filters:
-            cache_key = cls.get_products_cache_key(filters)
-            cache.delete(cache_key)
-        
-        print("Invalidated all product-related cache")
+        if category_id:
+            version_keys.append(cls.CATEGORY_VERSION_KEY.format(category_id))
+
+        cls._invalidate(delete_keys, version_keys)
     
+    @classmethod
+    def invalidate_product_details(cls, product_ids: List[int]) -> None:
+        """Drop the cached details of several products, leaving list versions alone"""
+        delete_keys = []
+        for product_id in product_ids:
+            cache_key = cls.get_product_detail_cache_key(product_id)
+            delete_keys += [cache_key, cls.get_rendered_cache_key(cache_key)]
+        cls._invalidate(delete_keys, [])
+
     @classmethod
     def invalidate_category_cache(cls, category_id: int = None) -> None:
         """Invalidate category-related cache"""
+        delete_keys = []
+        # Invalidate the categories list, and every products list since
+        # products embed their category name; deleting a category also
+        # deletes its products without Product.delete
+        version_keys = [cls.CATEGORIES_VERSION_KEY, cls.PRODUCTS_VERSION_KEY, cls.SEARCH_INDEX_VERSION_KEY]
         if category_id:
             # Invalidate specific category cache
-            cache_key = cls.CATEGORY_DETAIL_CACHE_KEY.format(category_id)
-            cache.delete(cache_key)
-            print(f"Invalidated category detail cache: {cache_key}")
+            cache_key = cls.get_category_detail_cache_key(category_id)
+            delete_keys += [cache_key, cls.get_rendered_cache_key(cache_key)]
             
             # Invalidate products by this category
-            category_products_key = cls.PRODUCTS_BY_CATEGORY_CACHE_KEY.format(category_id)
-            cache.delete(category_products_key)
-            print(f"Invalidated products by category cache: {category_products_key}")
-        
-        # Invalidate all categories list cache
-        cache.delete(cls.CATEGORIES_CACHE_KEY)
-        
-        # Invalidate all product cache since category changes affect products
-        cls.invalidate_product_cache()
-        
-        print("Invalidated all category-related cache")
+            version_keys.append(cls.CATEGORY_VERSION_KEY.format(category_id))
+
+        cls._invalidate(delete_keys, version_keys)
     
     @classmethod
     def clear_all_cache(cls) -> None:
         """Clear all cache"""
         cache.clear()
-        print("Cleared all cache")
+        cls._broadcast_invalidation(None)
+        logger.info("Cleared all cache")
     
     @classmethod
     def get_cache_stats(cls) -> Dict[str, Any]:
-        """Get cache statistics"""
-        # This is a simple implementation - in production you might want more detailed stats
+        """Get cache statistics, with hit/miss/latency metrics per key family"""
         return {
             'cache_backend': settings.CACHES['default']['BACKEND'],
             'cache_timeout': cls.CACHE_TIMEOUT,
-            'cache_prefix': settings.CACHES['default']['KEY_PREFIX']
+            'cache_prefix': settings.CACHES['default']['KEY_PREFIX'],
+            'l1_enabled': getattr(settings, 'CACHE_L1_ENABLED', False),
+            'families': CacheMetrics.snapshot(),
         } 
\ No newline at end of file
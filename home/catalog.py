@@ -0,0 +1,167 @@
+from functools import reduce
+from operator import or_
+from django.db import connections, transaction
+from django.db.models import Q
+from rest_framework import serializers
+from .cache_utils import CacheManager
+from .models import Category, Product
+
+PRODUCT_FIELDS = ['name', 'description', 'price', 'stock', 'category_id']
+
+
+class BulkProductRowSerializer(serializers.Serializer):
+    """Field-level validation of one bulk row; the DB checks run once per batch"""
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    stock = serializers.IntegerField(min_value=0)
+    category_name = serializers.CharField(max_length=100)
+
+
+@transaction.atomic
+def upsert_products(rows, match_by_name=False, create_categories=False, batch_size=1000, invalidate=True):
+    """Create and update many products with a fixed number of queries
+
+    Rows with an ``id`` update that product; rows without one create a
+    product, or with ``match_by_name`` update the product of that name
+    (case-insensitive). Category names are resolved in one query and,
+    with ``create_categories``, missing ones are created. Rows that fail
+    are skipped and reported as {'index', 'errors'}; the rest are written
+    with bulk_create/bulk_update and the cache is invalidated once, unless
+    ``invalidate`` is False and the caller takes care of it.
+    """
+    errors = []
+    valid = []
+    # One serializer for every row; building its fields per row cost more than the writes
+    row_serializer = BulkProductRowSerializer()
+    for index, row in enumerate(rows):
+        try:
+            valid.append((index, row_serializer.run_validation(row)))
+        except serializers.ValidationError as exc:
+            errors.append({'index': index, 'errors': serializers.as_serializer_error(exc)})
+
+    categories, categories_created = resolve_categories(
+        {data['category_name'] for _, data in valid}, create_categories)
+
+    # One query finds both the products to update by id and every name in use
+    ids = {data['id'] for _, data in valid if 'id' in data}
+    names = {data['name'].lower() for _, data in valid}
+    existing = {}
+    by_name = {}
+    if valid:
+        conditions = [Q(name__lower__in=names)] + ([Q(id__in=ids)] if ids else [])
+        for product in Product.objects.filter(reduce(or_, conditions)).only('id', 'name', 'category_id'):
+            existing[product.id] = product
+            by_name.setdefault(product.name.lower(), product.id)
+
+    to_create, to_update = [], []
+    created_rows, updated_rows = [], []
+    seen_names, seen_ids = set(), set()
+    for index, data in valid:
+        name_key = data['name'].lower()
+        category_id = categories.get(data['category_name'].lower())
+        product_id = data.get('id')
+        if product_id is None and match_by_name:
+            product_id = by_name.get(name_key)
+
+        row_errors = {}
+        if category_id is None:
+            row_errors['category_name'] = ["Category with this name does not exist."]
+        if product_id is not None and product_id not in existing:
+            row_errors['id'] = ["Product does not exist."]
+        elif product_id is not None and product_id in seen_ids:
+            row_errors['id'] = ["Duplicate product id in this request."]
+        elif name_key in seen_names:
+            row_errors['name'] = ["Duplicate product name in this request."]
+        elif by_name.get(name_key, product_id) != product_id:
+            row_errors['name'] = ["Product with this name already exists."]
+        if row_errors:
+            errors.append({'index': index, 'errors': row_errors})
+            continue
+        seen_names.add(name_key)
+        seen_ids.add(product_id)
+
+        values = {
+            'name': data['name'],
+            'description': data['description'],
+            'price': data['price'],
+            'stock': data['stock'],
+            'category_id': category_id,
+        }
+        if product_id is None:
+            to_create.append(Product(**values))
+            created_rows.append(index)
+        else:
+            to_update.append((existing[product_id].category_id, Product(id=product_id, **values)))
+            updated_rows.append(index)
+
+    created = Product.objects.bulk_create(to_create, batch_size=batch_size)
+    update_products([product for _, product in to_update], batch_size=batch_size)
+
+    # bulk writes skip Product.save/Category.save; one invalidation covers the whole batch
+    if invalidate:
+        with CacheManager.batched_invalidation():
+            if categories_created:
+                CacheManager.invalidate_category_cache()
+            for category_id in {product.category_id for product in created}:
+                CacheManager.invalidate_product_cache(category_id=category_id)
+            for previous_category_id, product in to_update:
+                CacheManager.invalidate_product_cache(product.id, product.category_id)
+                if previous_category_id != product.category_id:
+                    CacheManager.invalidate_product_cache(category_id=previous_category_id)
+
+    return {
+        'created': [{'index': index, 'id': product.id} for index, product in zip(created_rows, created)],
+        'updated': [{'index': index, 'id': product.id} for index, (_, product) in zip(updated_rows, to_update)],
+        'errors': sorted(errors, key=lambda error: error['index']),
+    }
+
+
+def update_products(products, batch_size=1000):
+    """Write PRODUCT_FIELDS of many products with one UPDATE ... FROM (VALUES ...) per batch
+
+    Does what Product.objects.bulk_update does, without building a CASE
+    expression per row and field, which dominated large imports.
+    """
+    if not products:
+        return
+    connection = connections[Product.objects.db]
+    quote = connection.ops.quote_name
+    columns = [Product._meta.get_field(field).column for field in PRODUCT_FIELDS]
+    assignments = ', '.join(f'{quote(column)} = v.column{position}' for position, column in enumerate(columns, 2))
+    placeholders = '(' + ', '.join(['%s'] * (len(columns) + 1)) + ')'
+    with connection.cursor() as cursor:
+        for start in range(0, len(products), batch_size):
+            batch = products[start:start + batch_size]
+            params = []
+            for product in batch:
+                params.append(product.id)
+                params += [getattr(product, field) for field in PRODUCT_FIELDS]
+            cursor.execute(
+                f'UPDATE {quote(Product._meta.db_table)} SET {assignments} '
+                f'FROM (VALUES {", ".join([placeholders] * len(batch))}) AS v '
+                f'WHERE {quote(Product._meta.db_table)}.{quote(Product._meta.pk.column)} = v.column1',
+                params,
+            )
+
+
+def resolve_categories(names, create_missing=False):
+    """Map lowercased category names to ids in one query, optionally creating the missing ones
+
+    Returns the mapping and whether any category was created.
+    """
+    categories = {}
+    if not names:
+        return categories, False
+    lowered = {name.lower(): name for name in names}
+    for category_id, name in Category.objects.filter(name__lower__in=list(lowered)).order_by('id')\
+            .values_list('id', 'name'):
+        categories.setdefault(name.lower(), category_id)
+
+    missing = [name for key, name in lowered.items() if key not in categories]
+    if not (missing and create_missing):
+        return categories, False
+    for category in Category.objects.bulk_create([Category(name=name) for name in missing]):
+        categories[category.name.lower()] = category.id
+    return categories, True
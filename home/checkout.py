@@ -0,0 +1,327 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Case, When, F, Q, PositiveIntegerField
+from django.utils import timezone
+from .cache_utils import CacheManager
+from .flash_sale import FlashSaleManager, FlashSaleError, FlashSaleModeChanged
+from .models import CartItem, Order, OrderItem, OrderRequest, Product
+from .notifications import notify_user
+from .rollups import record_orders
+from .serializers import order_snapshot
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CheckoutError(Exception):
+    """The cart can't be turned into an order; the message is user-facing"""
+
+
+def decrement_stock(quantities, products):
+    """Take stock for {product_id: quantity} in one conditional UPDATE
+
+    ``products`` are the locked rows; they supply names for errors and the
+    category ids for cache invalidation. Raises CheckoutError on shortfall.
+    """
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
+        if product is None:
+            raise CheckoutError("A product in your cart is no longer available")
+        if product.stock < quantity:
+            raise CheckoutError(f"Not enough stock for {product.name}")
+
+    # The stock__gte guards keep this correct even where row locks are a no-op
+    updated = Product.objects.filter(
+        reduce(or_, [Q(id=product_id, stock__gte=quantity) for product_id, quantity in quantities.items()])
+    ).update(stock=Case(
+        *[When(id=product_id, then=F('stock') - quantity) for product_id, quantity in quantities.items()],
+        default=F('stock'),
+        output_field=PositiveIntegerField(),
+    ))
+    if updated != len(quantities):
+        short = Product.objects.filter(
+            reduce(or_, [Q(id=product_id, stock__lt=quantity) for product_id, quantity in quantities.items()])
+        ).values_list('name', flat=True).first()
+        raise CheckoutError(f"Not enough stock for {short}")
+
+    # update() skips Product.save, so invalidate here (applied on commit)
+    with CacheManager.batched_invalidation():
+        for product_id in quantities:
+            CacheManager.invalidate_product_cache(product_id, products[product_id].category_id, content_changed=False)
+
+
+def lock_products(product_ids):
+    """Lock the given products in id order (avoids deadlocks) and key them by id"""
+    return {
+        product.id: product
+        for product in Product.objects.select_for_update()
+        .filter(id__in=product_ids)
+        .only('id', 'name', 'stock', 'category_id')
+        .order_by('id')
+    }
+
+
+def reserve_flash_stock(quantities, database_ids=()):
+    """Reserve flash-sale lines in Redis; settled when the transaction commits
+
+    ``database_ids`` are the locked products taken from Product.stock; the
+    same Redis call checks that no product changed flash-sale mode since
+    enabled_products() was read. Returns the reservation token, or None if
+    there is nothing to reserve.
+    """
+    if not quantities and not (database_ids and FlashSaleManager.active()):
+        return None
+    try:
+        token = FlashSaleManager.reserve(quantities, database_ids)
+    except FlashSaleModeChanged as e:
+        name = Product.objects.filter(id=e.product_ids[0]).values_list('name', flat=True).first()
+        raise CheckoutError(f"Stock for {name} changed while the order was being placed, please try again")
+    except FlashSaleError as e:
+        name = Product.objects.filter(id=e.product_id).values_list('name', flat=True).first()
+        raise CheckoutError(f"Not enough stock for {name}")
+    if token:
+        transaction.on_commit(lambda: commit_flash_stock(token, quantities))
+    return token
+
+
+def commit_flash_stock(token, quantities):
+    """Commit a reservation once its order is saved; a Redis error must not fail the request"""
+    try:
+        FlashSaleManager.commit(token, quantities)
+    except Exception:
+        # The order stands; the reservation expires and its units go back on sale
+        logger.exception("Could not commit flash-sale reservation %s for %s", token, quantities)
+
+
+def cart_snapshot(user, lock=False):
+    """The user's cart items as plain dicts
+
+    With ``lock`` the rows stay locked until the transaction ends, so a
+    concurrent checkout of the same cart waits and then finds it empty.
+    """
+    cart_items = CartItem.objects.filter(user=user)
+    if lock:
+        cart_items = cart_items.select_for_update().order_by('id')
+    return list(cart_items.values('id', 'product_id', 'quantity', 'price', 'total_price'))
+
+
+def lock_cart_items(carts):
+    """Lock the cart rows behind {key: cart_items} and return the keys whose rows are all still there
+
+    A queued snapshot whose rows were deleted has been ordered (or emptied)
+    since; placing it again would charge the user twice.
+    """
+    item_ids = sorted({item['id'] for cart_items in carts.values() for item in cart_items})
+    existing = set(CartItem.objects.select_for_update().filter(id__in=item_ids).order_by('id')
+                   .values_list('id', flat=True))
+    return {key for key, cart_items in carts.items() if all(item['id'] in existing for item in cart_items)}
+
+
+def cart_quantities(cart_items):
+    """{product_id: quantity} over cart items, summing duplicate products"""
+    quantities = defaultdict(int)
+    for item in cart_items:
+        quantities[item['product_id']] += item['quantity']
+    return quantities
+
+
+def place_order(user):
+    """Turn the user's cart into an order with a constant number of queries
+
+    Must run inside transaction.atomic; on CheckoutError the caller rolls back.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("place_order() must run inside transaction.atomic")
+
+    cart_items = cart_snapshot(user, lock=True)
+    if not cart_items:
+        raise CheckoutError("Cart is empty")
+    quantities = cart_quantities(cart_items)
+
+    # Flash-sale products are reserved in Redis instead of locking their rows
+    flash_ids = set(FlashSaleManager.enabled_products(list(quantities)))
+    db_quantities = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in flash_ids}
+    products = lock_products(db_quantities) if db_quantities else {}
+
+    # enable() switches a product while holding its row, so the reservation
+    # checks the now-locked products are still on database stock
+    token = reserve_flash_stock({product_id: quantities[product_id] for product_id in flash_ids}, db_quantities)
+    try:
+        if db_quantities:
+            decrement_stock(db_quantities, products)
+        return create_orders([(user.id, cart_items)])[0]
+    except Exception:
+        # Django has no rollback hook; anything missed here expires on its own
+        if token:
+            FlashSaleManager.release(token)
+        raise
+
+
+def create_orders(carts):
+    """Write orders and their items for [(user_id, cart_items)] and clear those cart items
+
+    Each order stores its history snapshot in the same INSERT. The cart
+    rows must be locked by the caller; if any of them is already gone the
+    cart was ordered elsewhere and CheckoutError is raised.
+    """
+    product_names = dict(Product.objects.filter(
+        id__in={item['product_id'] for _, cart_items in carts for item in cart_items}
+    ).values_list('id', 'name'))
+    orders = []
+    for user_id, cart_items in carts:
+        total_amount = sum(
+            (item['total_price'] if item['total_price'] is not None else item['price'] * item['quantity']
+             for item in cart_items),
+            Decimal(0),
+        )
+        orders.append(Order(user_id=user_id, total_amount=total_amount,
+                            snapshot=order_snapshot(total_amount, cart_items, product_names)))
+    orders = Order.objects.bulk_create(orders)
+    order_items = OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=item['product_id'], quantity=item['quantity'], price=item['price'])
+        for order, (_, cart_items) in zip(orders, carts)
+        for item in cart_items
+    ])
+    record_orders(orders, order_items)
+
+    # Clear cart
+    item_ids = [item['id'] for _, cart_items in carts for item in cart_items]
+    deleted, _ = CartItem.objects.filter(id__in=item_ids).delete()
+    if deleted != len(item_ids):
+        raise CheckoutError("Your cart changed while the order was being placed")
+    return orders
+
+
+def enqueue_order(user):
+    """Queue the user's cart for `manage.py process_order_queue`
+
+    Carts that obviously can't be filled are refused here without locking
+    anything; the worker makes the final decision. A user with a request
+    still queued gets that request back instead of a second one.
+    """
+    cart_items = cart_snapshot(user)
+    if not cart_items:
+        raise CheckoutError("Cart is empty")
+
+    queued = OrderRequest.objects.filter(user=user, status='queued').first()
+    if queued is not None:
+        return queued
+
+    quantities = cart_quantities(cart_items)
+    flash_ids = set(FlashSaleManager.enabled_products(list(quantities)))
+    for product_id, name, stock in Product.objects.filter(id__in=quantities).values_list('id', 'name', 'stock'):
+        if product_id in flash_ids:
+            stock = FlashSaleManager.available(product_id) or 0
+        if stock < quantities[product_id]:
+            raise CheckoutError(f"Not enough stock for {name}")
+    return OrderRequest.objects.create(user=user, cart_items=cart_items)
+
+
+def _load_cart_items(order_request):
+    # JSON gives decimals back as strings
+    return [
+        dict(item,
+             price=Decimal(item['price']),
+             total_price=Decimal(item['total_price']) if item['total_price'] is not None else None)
+        for item in order_request.cart_items
+    ]
+
+
+def place_queued_orders(order_requests):
+    """Place a batch of locked, queued OrderRequests in the current transaction
+
+    Every product in the batch is locked in one pass and stock is taken in
+    one UPDATE; requests that can't be filled are rejected on their own
+    without failing the rest, including those whose cart rows are gone
+    because the cart was ordered since it was queued. Users are notified
+    once the batch commits. Returns (placed, rejected) lists of requests.
+    """
+    if not transaction.get_connection().in_atomic_block:
+        raise RuntimeError("place_queued_orders() must run inside transaction.atomic")
+
+    carts = {order_request.id: _load_cart_items(order_request) for order_request in order_requests}
+    # Cart rows are locked before products, in the same order as place_order()
+    still_in_cart = lock_cart_items(carts)
+    product_ids = set()
+    for cart_items in carts.values():
+        product_ids.update(item['product_id'] for item in cart_items)
+
+    flash_ids = set(FlashSaleManager.enabled_products(list(product_ids)))
+    products = lock_products(product_ids - flash_ids)
+    # enable() switches a product while holding its row: requests for one
+    # switched since flash_ids was read are rejected below
+    switched = set()
+    if products and FlashSaleManager.active():
+        try:
+            FlashSaleManager.reserve({}, products)
+        except FlashSaleModeChanged as e:
+            switched.update(e.product_ids)
+    remaining = {product_id: product.stock for product_id, product in products.items()}
+    taken = defaultdict(int)
+    tokens = []
+    placed, rejected = [], []
+
+    for order_request in order_requests:
+        quantities = cart_quantities(carts[order_request.id])
+        db_quantities = {product_id: quantity for product_id, quantity in quantities.items() if product_id not in flash_ids}
+        try:
+            if not carts[order_request.id]:
+                raise CheckoutError("Cart is empty")
+            if order_request.id not in still_in_cart:
+                raise CheckoutError("Your cart was already ordered or changed")
+            for product_id, quantity in db_quantities.items():
+                if product_id not in products:
+                    raise CheckoutError("A product in your cart is no longer available")
+                if product_id in switched:
+                    raise CheckoutError(f"Stock for {products[product_id].name} changed "
+                                        "while the order was being placed, please try again")
+                if remaining[product_id] < quantity:
+                    raise CheckoutError(f"Not enough stock for {products[product_id].name}")
+            token = reserve_flash_stock({product_id: quantities[product_id] for product_id in quantities if product_id in flash_ids})
+        except CheckoutError as e:
+            order_request.status = 'rejected'
+            order_request.error = str(e)
+            rejected.append(order_request)
+            continue
+
+        if token:
+            tokens.append(token)
+        for product_id, quantity in db_quantities.items():
+            remaining[product_id] -= quantity
+            taken[product_id] += quantity
+        order_request.status = 'placed'
+        placed.append(order_request)
+
+    try:
+        if taken:
+            decrement_stock(taken, products)
+        orders = create_orders([(order_request.user_id, carts[order_request.id]) for order_request in placed])
+    except Exception:
+        for token in tokens:
+            FlashSaleManager.release(token)
+        raise
+
+    now = timezone.now()
+    for order_request, order in zip(placed, orders):
+        order_request.order = order
+    for order_request in order_requests:
+        order_request.processed_at = now
+    OrderRequest.objects.bulk_update(order_requests, ['status', 'order', 'error', 'processed_at'])
+
+    messages = [
+        (order_request.user_id, f"✅ Your order #{order_request.order.id} has been placed!")
+        for order_request in placed
+    ] + [
+        (order_request.user_id, f"❌ Your order request #{order_request.id} was rejected: {order_request.error}")
+        for order_request in rejected
+    ]
+
+    def notify():
+        for user_id, message in messages:
+            notify_user(user_id, message)
+
+    transaction.on_commit(notify)
+    return placed, rejected
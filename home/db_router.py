@@ -0,0 +1,166 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+import hashlib
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Whether reads in the current request/task may go to a replica
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_aliases():
+    return list(getattr(settings, 'DATABASE_REPLICAS', []))
+
+
+@contextmanager
+def use_replicas(enabled=True):
+    """Allow (or forbid) replica reads for the enclosed code"""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def use_primary():
+    """Force reads in the enclosed code to the primary"""
+    return use_replicas(False)
+
+
+class ReplicaHealth:
+    """Remembers which replicas answered a `SELECT 1` recently
+
+    A replica is probed at most once per REPLICA_HEALTH_CHECK_INTERVAL
+    seconds per process; a failed probe takes it out of rotation until the
+    next probe succeeds. Only one thread probes at a time; the others keep
+    using the last known status instead of waiting on it, and the replica
+    connections' short connect_timeout (REPLICA_CONNECT_TIMEOUT) bounds
+    how long that one thread waits on a dead host.
+    """
+
+    CHECK_INTERVAL = getattr(settings, 'REPLICA_HEALTH_CHECK_INTERVAL', 10)
+
+    _lock = threading.Lock()
+    # alias -> (healthy, checked_at)
+    _status = {}
+
+    @classmethod
+    def is_healthy(cls, alias: str) -> bool:
+        healthy, checked_at = cls._status.get(alias, (True, None))
+        if checked_at is not None and time.monotonic() - checked_at < cls.CHECK_INTERVAL:
+            return healthy
+        if not cls._lock.acquire(blocking=False):
+            # Another thread is probing
+            return healthy
+        try:
+            healthy, checked_at = cls._status.get(alias, (True, None))
+            if checked_at is None or time.monotonic() - checked_at >= cls.CHECK_INTERVAL:
+                healthy = cls._probe(alias)
+                cls._status[alias] = (healthy, time.monotonic())
+        finally:
+            cls._lock.release()
+        return healthy
+
+    @classmethod
+    def _probe(cls, alias: str) -> bool:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception as e:
+            logger.warning("Replica %s is unavailable, reading from the primary: %s", alias, e)
+            connections[alias].close()
+            return False
+
+
+class ReplicaRouter:
+    """Send reads to healthy replicas when the request allows it; everything else to the primary
+
+    Reads only leave the primary inside use_replicas(), which
+    ReadReplicaMiddleware sets up for safe requests from clients that have
+    not written recently. Code can opt back out with use_primary().
+    """
+
+    def __init__(self):
+        # next() on a count is atomic, so threads share the rotation without a lock
+        self._reads = itertools.count()
+
+    def db_for_read(self, model, **hints):
+        if not _replica_reads.get():
+            return 'default'
+        replicas = replica_aliases()
+        if not replicas:
+            return 'default'
+        # Each read starts one replica further along and falls through to the next healthy one
+        start = next(self._reads) % len(replicas)
+        for alias in replicas[start:] + replicas[:start]:
+            if ReplicaHealth.is_healthy(alias):
+                return alias
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReadReplicaMiddleware:
+    """Route safe requests' reads to replicas, with read-your-writes pinning
+
+    After a client sends a write, its reads stay on the primary for
+    REPLICA_PIN_SECONDS so it never sees a replica that hasn't caught up with
+    its own change. Clients are told apart by their Authorization header,
+    session cookie or address, since JWT users are only authenticated later
+    in the view.
+    """
+
+    PIN_SECONDS = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not replica_aliases():
+            return self.get_response(request)
+
+        pin_key = self.pin_key(request)
+        if request.method not in SAFE_METHODS:
+            # Pin before the write so concurrent reads from the same client also stay on the primary
+            self.pin(pin_key)
+            with use_primary():
+                response = self.get_response(request)
+            self.pin(pin_key)
+            return response
+
+        with use_replicas(not self.is_pinned(pin_key)):
+            return self.get_response(request)
+
+    def pin(self, pin_key):
+        # The deadline is stored and checked here; the cache TTL only cleans the key up
+        cache.set(pin_key, time.time() + self.PIN_SECONDS, self.PIN_SECONDS)
+
+    def is_pinned(self, pin_key):
+        pinned_until = cache.get(pin_key)
+        return isinstance(pinned_until, float) and pinned_until > time.time()
+
+    def pin_key(self, request):
+        identity = (
+            request.META.get('HTTP_AUTHORIZATION')
+            or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+            or request.META.get('REMOTE_ADDR', '')
+        )
+        return f"db_primary_pin_{hashlib.sha1(identity.encode()).hexdigest()}"
@@ -0,0 +1,107 @@
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+from .models import Product, Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+import csv
+import io
+import itertools
+import json
+
+EXPORT_CHUNK_SIZE = 2000
+
+PRODUCT_COLUMNS = ['id', 'name', 'description', 'price', 'stock', 'category_id', 'category_name']
+ORDER_COLUMNS = ['id', 'user_id', 'username', 'status', 'total_amount', 'created_at', 'updated_at']
+ITEM_COLUMNS = ['product_id', 'product_name', 'quantity', 'price']
+
+
+def export_products(category_id=None):
+    """Product rows as dicts, read through a chunked cursor"""
+    queryset = Product.objects.order_by('id')
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    return queryset.values(
+        'id', 'name', 'description', 'price', 'stock', 'category_id', category_name=F('category__name'),
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def export_orders(status=None, archived=False):
+    """Order rows as dicts with their 'items' list
+
+    Orders are read through a chunked cursor and the items of each chunk of
+    orders are fetched with one query, so only one chunk is held at a time.
+    """
+    order_model, item_model = (ArchivedOrder, ArchivedOrderItem) if archived else (Order, OrderItem)
+    orders = order_model.objects.order_by('id')
+    if status:
+        orders = orders.filter(status=status)
+    orders = orders.values(
+        'id', 'user_id', 'status', 'total_amount', 'created_at', 'updated_at', username=F('user__username'),
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+    while True:
+        chunk = list(itertools.islice(orders, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        chunk_items = item_model.objects.filter(order_id__in=[order['id'] for order in chunk]).order_by('id')
+        if archived:
+            chunk_items = chunk_items.values('order_id', 'product_id', 'product_name', 'quantity', 'price')
+        else:
+            chunk_items = chunk_items.values('order_id', 'product_id', 'quantity', 'price',
+                                             product_name=F('product__name'))
+        items = {}
+        for item in chunk_items:
+            items.setdefault(item.pop('order_id'), []).append(item)
+        for order in chunk:
+            order['items'] = items.get(order['id'], [])
+            yield order
+
+
+def ndjson_lines(rows):
+    """One JSON document per line, yielded a chunk of rows at a time"""
+    while True:
+        chunk = list(itertools.islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            return
+        yield ''.join(json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in chunk)
+
+
+def csv_lines(rows, columns):
+    """CSV with a header row, yielded a chunk of rows at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction='ignore')
+    writer.writeheader()
+    while True:
+        chunk = list(itertools.islice(rows, EXPORT_CHUNK_SIZE))
+        if not chunk:
+            break
+        writer.writerows(chunk)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Empty export: still send the header
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def order_item_rows(orders):
+    """Flatten orders to one CSV row per item; orders without items keep one row"""
+    for order in orders:
+        items = order.pop('items')
+        for item in items or [{}]:
+            yield {**order, **item}
+
+
+async def async_lines(lines):
+    """Stream a sync line generator from an async response, one chunk at a time
+
+    Under ASGI a sync StreamingHttpResponse is drained into a list before
+    anything is sent. Each chunk is pulled through sync_to_async instead,
+    on the request's thread so the chunked cursor stays on one connection.
+    """
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    try:
+        while (chunk := await next_chunk(lines, None)) is not None:
+            yield chunk
+    finally:
+        await sync_to_async(lines.close, thread_sensitive=True)()
+
@@ -0,0 +1,302 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, When, F, Value, PositiveIntegerField
+from django.db.models.functions import Greatest
+from .cache_utils import CacheManager
+import logging
+import time
+import uuid
+from typing import Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# KEYS: stock counters..., reservation hash, reservations zset, flash-sale products set
+# ARGV: token, expires_at, quantities..., the counters' product ids..., product ids taken from Product.stock...
+# Returns {0}, {1, i} when the i-th counter is short, or {2, product ids...} for
+# products whose flash-sale mode no longer matches how the caller takes their stock
+RESERVE_SCRIPT = """
+local n = #KEYS - 3
+local switched = {2}
+for i = n + 3, #ARGV do
+    local enabled = redis.call('SISMEMBER', KEYS[n + 3], ARGV[i]) == 1
+    if enabled ~= (i <= 2 * n + 2) then
+        table.insert(switched, ARGV[i])
+    end
+end
+if #switched > 1 then
+    return switched
+end
+for i = 1, n do
+    local stock = tonumber(redis.call('GET', KEYS[i]) or '-1')
+    if stock < tonumber(ARGV[i + 2]) then
+        return {1, i}
+    end
+end
+if n == 0 then
+    return {0}
+end
+for i = 1, n do
+    redis.call('DECRBY', KEYS[i], ARGV[i + 2])
+    redis.call('HSET', KEYS[n + 1], KEYS[i], ARGV[i + 2])
+end
+redis.call('ZADD', KEYS[n + 2], ARGV[2], ARGV[1])
+return {0}
+"""
+
+# KEYS: reservation hash, reservations zset, pending hash
+# ARGV: token, mode ('commit' moves quantities to pending, 'release' returns them to stock)
+# Returns the number of lines, or -1 if the reservation no longer exists.
+# Lines zeroed by DISABLE_SCRIPT were already counted as sold and are skipped.
+SETTLE_SCRIPT = """
+local lines = redis.call('HGETALL', KEYS[1])
+if #lines == 0 then
+    return -1
+end
+for i = 1, #lines, 2 do
+    if tonumber(lines[i + 1]) == 0 then
+        -- settled when its product left flash-sale mode
+    elseif ARGV[2] == 'commit' then
+        redis.call('HINCRBY', KEYS[3], lines[i], lines[i + 1])
+    else
+        redis.call('INCRBY', lines[i], lines[i + 1])
+    end
+end
+redis.call('DEL', KEYS[1])
+redis.call('ZREM', KEYS[2], ARGV[1])
+return #lines / 2
+"""
+
+# KEYS: pending hash. Atomically takes and clears every pending decrement.
+TAKE_PENDING_SCRIPT = """
+local pending = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return pending
+"""
+
+
+# KEYS: stock counter, flash-sale products set, reservations zset, pending hash
+# ARGV: product id, reservation hash key prefix
+# Counts every outstanding reservation line for the product as sold, zeroes
+# those lines, then takes the product out of flash-sale mode. Returns the
+# number of reservations settled.
+DISABLE_SCRIPT = """
+local settled = 0
+for _, token in ipairs(redis.call('ZRANGE', KEYS[3], 0, -1)) do
+    local reservation = ARGV[2] .. token
+    local quantity = tonumber(redis.call('HGET', reservation, KEYS[1]) or '0')
+    if quantity > 0 then
+        redis.call('HINCRBY', KEYS[4], KEYS[1], quantity)
+        redis.call('HSET', reservation, KEYS[1], 0)
+        settled = settled + 1
+    end
+end
+redis.call('SREM', KEYS[2], ARGV[1])
+redis.call('DEL', KEYS[1])
+return settled
+"""
+
+
+class FlashSaleError(Exception):
+    """A flash-sale reservation could not be made; carries the short product id"""
+
+    def __init__(self, product_id):
+        super().__init__(f"Not enough flash-sale stock for product {product_id}")
+        self.product_id = product_id
+
+
+class FlashSaleModeChanged(Exception):
+    """Products went in or out of flash-sale mode after the caller read enabled_products()"""
+
+    def __init__(self, product_ids):
+        super().__init__(f"Flash-sale mode changed for products {product_ids}")
+        self.product_ids = product_ids
+
+
+class FlashSaleManager:
+    """Redis-held stock for hot products, reserved at checkout without DB row locks
+
+    While a product is in flash-sale mode its available stock lives in an
+    atomic Redis counter. Checkout reserves against the counter, commits the
+    reservation once its order commits, and `manage.py flash_sale flush`
+    applies the committed quantities to Product.stock in batches. Reservations
+    that are never settled expire and go back to the counter.
+    """
+
+    RESERVATION_TIMEOUT = getattr(settings, 'FLASH_SALE_RESERVATION_TIMEOUT', 300)
+
+    @classmethod
+    def _client(cls):
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+
+    @classmethod
+    def _key(cls, name: str) -> str:
+        return f"{settings.CACHES['default'].get('KEY_PREFIX', '')}:flash:{name}"
+
+    @classmethod
+    def _stock_key(cls, product_id: int) -> str:
+        return cls._key(f"stock:{product_id}")
+
+    @classmethod
+    def _product_id(cls, stock_key) -> int:
+        if isinstance(stock_key, bytes):
+            stock_key = stock_key.decode()
+        return int(stock_key.rsplit(':', 1)[1])
+
+    @classmethod
+    def _script(cls, name: str, source: str):
+        # register_script caches the SHA and falls back to EVAL on NOSCRIPT
+        scripts = cls.__dict__.get('_scripts')
+        if scripts is None:
+            scripts = cls._scripts = {}
+        if name not in scripts:
+            scripts[name] = cls._client().register_script(source)
+        return scripts[name]
+
+    @classmethod
+    def active(cls) -> bool:
+        """Whether flash sales are switched on and the cache backend can hold them"""
+        if not getattr(settings, 'FLASH_SALE_ENABLED', False):
+            return False
+        try:
+            cls._client()
+        except (ImportError, NotImplementedError):
+            # Flash sales need the Redis cache backend
+            return False
+        return True
+
+    @classmethod
+    def enabled_products(cls, product_ids: Optional[List[int]] = None) -> List[int]:
+        """Ids in flash-sale mode, optionally restricted to ``product_ids``"""
+        if not cls.active():
+            return []
+        members = {int(member) for member in cls._client().smembers(cls._key('products'))}
+        if product_ids is None:
+            return sorted(members)
+        return [product_id for product_id in product_ids if product_id in members]
+
+    @classmethod
+    def enable(cls, product_id: int) -> int:
+        """Put a product in flash-sale mode, seeding its counter from Product.stock"""
+        from .models import Product
+        with transaction.atomic():
+            # Hold the row so no DB-path checkout slips in between seed and switch
+            product = Product.objects.select_for_update().get(id=product_id)
+            client = cls._client()
+            client.set(cls._stock_key(product_id), product.stock)
+            client.sadd(cls._key('products'), product_id)
+        return product.stock
+
+    @classmethod
+    def disable(cls, product_id: int) -> int:
+        """Take a product out of flash-sale mode and write its sold units to the DB
+
+        Expired reservations go back to the counter first; reservations still
+        live are counted as sold before the product leaves the enabled set,
+        and their later commit or release skips it. The row stays locked
+        until the product is back on database stock, so no DB-path checkout
+        reads Product.stock before the flush lands. Returns how many live
+        reservations were settled.
+        """
+        from .models import Product
+        with transaction.atomic():
+            Product.objects.select_for_update().get(id=product_id)
+            cls.sweep_expired(product_id=product_id)
+            keys = [cls._stock_key(product_id), cls._key('products'), cls._key('reservations'), cls._key('pending')]
+            settled = cls._script('disable', DISABLE_SCRIPT)(keys=keys, args=[product_id, cls._key('reservation:')])
+            cls.flush()
+        return settled
+
+    @classmethod
+    def available(cls, product_id: int) -> Optional[int]:
+        """Units still available in the counter"""
+        stock = cls._client().get(cls._stock_key(product_id))
+        return int(stock) if stock is not None else None
+
+    @classmethod
+    def reserve(cls, quantities: Dict[int, int], database_ids: Iterable[int] = ()) -> Optional[str]:
+        """Atomically reserve {product_id: quantity}; raises FlashSaleError on shortfall
+
+        ``database_ids`` are the products the caller takes from Product.stock
+        under a row lock. If any of them, or of the reserved products, changed
+        mode since the caller read enabled_products(), nothing is reserved and
+        FlashSaleModeChanged is raised. Returns None if nothing was reserved.
+        """
+        token = uuid.uuid4().hex
+        product_ids = sorted(quantities)
+        keys = [cls._stock_key(product_id) for product_id in product_ids]
+        keys += [cls._key(f"reservation:{token}"), cls._key('reservations'), cls._key('products')]
+        args = [token, time.time() + cls.RESERVATION_TIMEOUT]
+        args += [quantities[product_id] for product_id in product_ids]
+        args += product_ids + sorted(database_ids)
+        status, *details = cls._script('reserve', RESERVE_SCRIPT)(keys=keys, args=args)
+        if status == 2:
+            raise FlashSaleModeChanged([int(product_id) for product_id in details])
+        if status == 1:
+            raise FlashSaleError(product_ids[details[0] - 1])
+        return token if product_ids else None
+
+    @classmethod
+    def _settle(cls, token: str, mode: str) -> int:
+        keys = [cls._key(f"reservation:{token}"), cls._key('reservations'), cls._key('pending')]
+        return cls._script('settle', SETTLE_SCRIPT)(keys=keys, args=[token, mode])
+
+    @classmethod
+    def commit(cls, token: str, quantities: Dict[int, int] = None) -> None:
+        """Mark a reservation as sold; it will be flushed to Product.stock"""
+        if cls._settle(token, 'commit') >= 0 or not quantities:
+            return
+        # Swept before its order committed: its units went back to the
+        # counter, so take them again even if that oversells slightly
+        logger.warning("Flash-sale reservation %s expired before commit", token)
+        client = cls._client()
+        for product_id, quantity in quantities.items():
+            client.decrby(cls._stock_key(product_id), quantity)
+            client.hincrby(cls._key('pending'), cls._stock_key(product_id), quantity)
+
+    @classmethod
+    def release(cls, token: str) -> None:
+        """Return a reservation's units to the counters, skipping products since disabled"""
+        cls._settle(token, 'release')
+
+    @classmethod
+    def sweep_expired(cls, now: float = None, product_id: int = None) -> int:
+        """Release reservations past their expiry, or only those holding ``product_id``; returns how many"""
+        now = time.time() if now is None else now
+        client = cls._client()
+        tokens = [token.decode() if isinstance(token, bytes) else token
+                  for token in client.zrangebyscore(cls._key('reservations'), '-inf', now)]
+        if product_id is not None:
+            stock_key = cls._stock_key(product_id)
+            tokens = [token for token in tokens if client.hexists(cls._key(f"reservation:{token}"), stock_key)]
+        for token in tokens:
+            cls.release(token)
+        return len(tokens)
+
+    @classmethod
+    def flush(cls) -> Dict[int, int]:
+        """Apply committed flash-sale units to Product.stock in one UPDATE"""
+        from .models import Product
+        raw = cls._script('take_pending', TAKE_PENDING_SCRIPT)(keys=[cls._key('pending')])
+        pending = {cls._product_id(raw[i]): int(raw[i + 1]) for i in range(0, len(raw), 2)}
+        pending = {product_id: quantity for product_id, quantity in pending.items() if quantity}
+        if not pending:
+            return {}
+
+        try:
+            with transaction.atomic(), CacheManager.batched_invalidation():
+                # A reservation committed after its expiry may oversell; stock stops at zero
+                Product.objects.filter(id__in=pending).update(stock=Greatest(Case(
+                    *[When(id=product_id, then=F('stock') - quantity) for product_id, quantity in pending.items()],
+                    default=F('stock'),
+                    output_field=PositiveIntegerField(),
+                ), Value(0), output_field=PositiveIntegerField()))
+                for product_id, category_id in Product.objects.filter(id__in=pending).values_list('id', 'category_id'):
+                    CacheManager.invalidate_product_cache(product_id, category_id, content_changed=False)
+        except Exception:
+            # Put the units back so the next flush retries them
+            client = cls._client()
+            for product_id, quantity in pending.items():
+                client.hincrby(cls._key('pending'), cls._stock_key(product_id), quantity)
+            raise
+        return pending
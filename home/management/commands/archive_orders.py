@@ -0,0 +1,77 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from home.models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem
+import time
+
+class Command(BaseCommand):
+    help = 'Move old delivered orders and their items into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', 180),
+                            help='Archive delivered orders created more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=500, help='Orders moved per transaction')
+        parser.add_argument('--sleep', type=float, default=0.5, help='Seconds to pause between batches')
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would be archived')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        candidates = Order.objects.filter(status='delivered', created_at__lt=cutoff)
+        if options['dry_run']:
+            self.stdout.write(f'{candidates.count()} delivered orders older than {cutoff:%Y-%m-%d} would be archived')
+            return
+
+        start_time = time.time()
+        archived = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            moved = self.archive_batch(candidates, options['batch_size'])
+            if not moved:
+                break
+            archived += moved
+            batches += 1
+            self.stdout.write(f'Archived {archived} orders so far')
+            time.sleep(options['sleep'])
+
+        elapsed = time.time() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(f'Archived {archived} orders in {batches} batches in {elapsed:.2f} seconds')
+        )
+
+    def archive_batch(self, candidates, batch_size):
+        """Copy one batch into the archive and delete it from the hot tables, atomically
+
+        Each batch commits on its own, so an interrupted run simply resumes
+        with the orders that are still in the hot table. ignore_conflicts
+        keeps re-copying an already archived id harmless.
+        """
+        with transaction.atomic():
+            orders = list(
+                candidates.select_for_update(skip_locked=True).order_by('id')
+                .values('id', 'user_id', 'total_amount', 'status', 'created_at', 'updated_at', 'snapshot')
+                [:batch_size]
+            )
+            if not orders:
+                return 0
+            order_ids = [order['id'] for order in orders]
+            items = OrderItem.objects.filter(order_id__in=order_ids)\
+                .values('id', 'order_id', 'product_id', 'product__name', 'quantity', 'price')
+
+            ArchivedOrder.objects.bulk_create([ArchivedOrder(**order) for order in orders], ignore_conflicts=True)
+            ArchivedOrderItem.objects.bulk_create([
+                ArchivedOrderItem(
+                    id=item['id'],
+                    order_id=item['order_id'],
+                    product_id=item['product_id'],
+                    product_name=item['product__name'],
+                    quantity=item['quantity'],
+                    price=item['price'],
+                )
+                for item in items
+            ], ignore_conflicts=True)
+
+            # Items go with their orders through the cascade
+            Order.objects.filter(id__in=order_ids).delete()
+        return len(orders)
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+from home.models import Product
+from home.serializers import ProductSerializer
+from home.cache_utils import CacheManager
+import time
+
+class Command(BaseCommand):
+    help = 'Compare cache hits that re-render serializer data with cache hits that return pre-rendered JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000, help='Cache hits per path')
+        parser.add_argument('--page-size', type=int, default=10, help='Products per cached payload')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        products = Product.objects.select_related('category').order_by('id')[:options['page_size']]
+        data = {
+            'count': len(products),
+            'next': False,
+            'previous': False,
+            'page': 1,
+            'results': ProductSerializer(products, many=True).data,
+        }
+        self.stdout.write(f'Benchmarking {iterations} hits on a payload of {len(data["results"])} products')
+
+        data_key = 'bench_cache_render_data'
+        rendered_key = 'bench_cache_render_json'
+        CacheManager.get_or_compute(data_key, lambda: data)
+        CacheManager.get_or_compute(rendered_key, lambda: JSONRenderer().render(data))
+
+        def data_hit():
+            return JSONRenderer().render(CacheManager.get_or_compute(data_key, lambda: data))
+
+        def rendered_hit():
+            return CacheManager.get_or_compute(rendered_key, lambda: JSONRenderer().render(data))
+
+        # Both paths must produce the same response body
+        if data_hit() != rendered_hit():
+            self.stdout.write(self.style.ERROR('Rendered body differs from re-rendered data'))
+            return
+
+        results = {}
+        for name, hit in [('serializer data + JSONRenderer', data_hit), ('pre-rendered JSON bytes', rendered_hit)]:
+            start_time = time.perf_counter()
+            for _ in range(iterations):
+                hit()
+            elapsed = time.perf_counter() - start_time
+            results[name] = elapsed
+            self.stdout.write(
+                f'{name}: {elapsed:.3f}s total, {elapsed / iterations * 1e6:.1f}us/hit, '
+                f'{iterations / elapsed:.0f} hits/s'
+            )
+
+        data_time, rendered_time = results.values()
+        self.stdout.write(self.style.SUCCESS(f'Pre-rendered path is {data_time / rendered_time:.2f}x faster'))
+
+        cache.delete_many([data_key, rendered_key])
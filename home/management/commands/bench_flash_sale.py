@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from home.models import Category, Product, CartItem, CustomUser
+from home.checkout import place_order, CheckoutError
+from home.flash_sale import FlashSaleManager
+import time
+import uuid
+
+class Command(BaseCommand):
+    help = 'Measure checkout throughput on one hot product with and without flash-sale mode'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16, help='Concurrent buyers')
+        parser.add_argument('--orders', type=int, default=50, help='Orders per buyer and mode')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            raise CommandError('SQLite serializes all writes; run this against PostgreSQL')
+        try:
+            FlashSaleManager._client()
+        except (ImportError, NotImplementedError):
+            raise CommandError('Flash-sale mode needs the Redis cache backend')
+
+        threads, orders = options['threads'], options['orders']
+        run_id = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'bench-flash-{run_id}')
+        product = Product.objects.create(
+            name=f'bench-flash-{run_id}', price=Decimal('9.99'), stock=threads * orders * 2, category=category
+        )
+        users = [
+            CustomUser.objects.create(username=f'bench-flash-{run_id}-{i}', email=f'bench-flash-{run_id}-{i}@example.com')
+            for i in range(threads)
+        ]
+        self.stdout.write(f'{threads} buyers placing {orders} orders each on product {product.id}')
+
+        try:
+            results = {'row lock': self.run(users, product, orders)}
+            FlashSaleManager.enable(product.id)
+            try:
+                results['flash sale'] = self.run(users, product, orders)
+            finally:
+                FlashSaleManager.disable(product.id)
+
+            product.refresh_from_db()
+            expected = threads * orders * 2 - sum(placed for placed, _ in results.values())
+            if product.stock != expected:
+                self.stdout.write(self.style.ERROR(f'Stock is {product.stock}, expected {expected}'))
+
+            for name, (placed, elapsed) in results.items():
+                self.stdout.write(f'{name}: {placed} orders in {elapsed:.2f}s ({placed / elapsed:.1f} orders/sec)')
+            speedup = (results['flash sale'][0] / results['flash sale'][1]) / (results['row lock'][0] / results['row lock'][1])
+            self.stdout.write(self.style.SUCCESS(f'Flash-sale mode: {speedup:.1f}x orders/sec'))
+        finally:
+            # Orders and cart items cascade from the users
+            CustomUser.objects.filter(id__in=[user.id for user in users]).delete()
+            category.delete()
+
+    def run(self, users, product, orders):
+        """Every user buys one unit ``orders`` times concurrently; returns (placed, seconds)"""
+        def buy(user):
+            placed = 0
+            try:
+                for _ in range(orders):
+                    CartItem.objects.create(user=user, product=product, price=product.price, quantity=1)
+                    try:
+                        with transaction.atomic():
+                            place_order(user)
+                        placed += 1
+                    except CheckoutError:
+                        CartItem.objects.filter(user=user).delete()
+            finally:
+                connection.close()
+            return placed
+
+        start_time = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(users)) as executor:
+            placed = sum(executor.map(buy, users))
+        return placed, time.perf_counter() - start_time
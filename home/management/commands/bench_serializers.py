@@ -0,0 +1,64 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from home.models import Category, Product
+from home.serializers import ProductSerializer, ValuesSerializer
+import time
+
+class Command(BaseCommand):
+    help = ('Compare ProductSerializer over model instances with the values() fast path, '
+            'for full and sparse (?fields=) listings. Seed rows are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=10000, help='Products to seed and serialize')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per path; the best one is reported')
+        parser.add_argument('--fields', default='id,name,price', help='Sparse fieldset to compare as well')
+
+    def handle(self, *args, **options):
+        sparse_fields = [name.strip() for name in options['fields'].split(',') if name.strip()]
+        with transaction.atomic():
+            self.seed(options['products'])
+            queryset = Product.objects.select_related('category').order_by('id')
+            self.stdout.write(f'Serializing {queryset.count()} products, best of {options["repeat"]} runs')
+
+            results = {}
+            for label, fields in [('all fields', None), (f'fields={",".join(sparse_fields)}', sparse_fields)]:
+                values_serializer = ValuesSerializer.compile(ProductSerializer, fields)
+                paths = [
+                    ('ModelSerializer', lambda: ProductSerializer(queryset.all(), many=True, fields=fields).data),
+                    ('values() fast path', lambda: values_serializer.serialize(values_serializer.values(queryset))),
+                ]
+                # Both paths must produce the same payload
+                if [dict(row) for row in paths[0][1]()] != paths[1][1]():
+                    self.stdout.write(self.style.ERROR(f'{label}: fast path output differs from the serializer'))
+                    transaction.set_rollback(True)
+                    return
+
+                for name, run in paths:
+                    elapsed = min(self.time(run) for _ in range(options['repeat']))
+                    rows = len(run())
+                    results[(label, name)] = rows / elapsed
+                    self.stdout.write(f'{label}, {name}: {elapsed:.3f}s, {rows / elapsed:,.0f} rows/sec')
+
+                speedup = results[(label, 'values() fast path')] / results[(label, 'ModelSerializer')]
+                self.stdout.write(self.style.SUCCESS(f'{label}: fast path is {speedup:.1f}x faster'))
+
+            transaction.set_rollback(True)
+
+    def seed(self, count):
+        categories = Category.objects.bulk_create([Category(name=f'Bench category {i}') for i in range(20)])
+        Product.objects.bulk_create([
+            Product(
+                name=f'Bench product {i}',
+                description=f'Description of bench product {i}',
+                price=Decimal(i % 500) + Decimal('0.99'),
+                stock=i % 100,
+                category=categories[i % len(categories)],
+            )
+            for i in range(count)
+        ], batch_size=1000)
+
+    def time(self, run):
+        start_time = time.perf_counter()
+        run()
+        return time.perf_counter() - start_time
@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+from home.models import Product
+from home.flash_sale import FlashSaleManager
+import time
+
+class Command(BaseCommand):
+    help = 'Switch products in and out of flash-sale mode and flush flash-sale sales to Product.stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['enable', 'disable', 'status', 'flush'])
+        parser.add_argument('product_ids', nargs='*', type=int, help='Products to enable or disable')
+        parser.add_argument('--loop', action='store_true', help='Keep flushing every --interval seconds')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between flushes with --loop')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action in ('enable', 'disable') and not options['product_ids']:
+            raise CommandError(f'{action} needs at least one product id')
+
+        if action == 'enable':
+            for product_id in options['product_ids']:
+                try:
+                    stock = FlashSaleManager.enable(product_id)
+                except Product.DoesNotExist:
+                    raise CommandError(f'Product {product_id} does not exist')
+                self.stdout.write(self.style.SUCCESS(f'Product {product_id} in flash-sale mode with {stock} units'))
+        elif action == 'disable':
+            for product_id in options['product_ids']:
+                try:
+                    settled = FlashSaleManager.disable(product_id)
+                except Product.DoesNotExist:
+                    raise CommandError(f'Product {product_id} does not exist')
+                self.stdout.write(self.style.SUCCESS(
+                    f'Product {product_id} back on database stock, {settled} live reservations counted as sold'
+                ))
+        elif action == 'status':
+            product_ids = FlashSaleManager.enabled_products()
+            if not product_ids:
+                self.stdout.write('No products in flash-sale mode')
+            names = dict(Product.objects.filter(id__in=product_ids).values_list('id', 'name'))
+            for product_id in product_ids:
+                self.stdout.write(
+                    f'{product_id} {names.get(product_id, "?")}: {FlashSaleManager.available(product_id)} available'
+                )
+        else:
+            self.flush(options['loop'], options['interval'])
+
+    def flush(self, loop, interval):
+        while True:
+            expired = FlashSaleManager.sweep_expired()
+            flushed = FlashSaleManager.flush()
+            if flushed or expired or not loop:
+                self.stdout.write(
+                    f'Flushed {sum(flushed.values())} units for {len(flushed)} products, '
+                    f'released {expired} expired reservations'
+                )
+            if not loop:
+                return
+            time.sleep(interval)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from home.rollups import fold_deltas
+import time
+
+class Command(BaseCommand):
+    help = 'Apply the rollup deltas queued by checkouts and status changes to the rollup tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Deltas applied per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep folding new deltas')
+        parser.add_argument('--interval', type=float, default=5, help='Seconds to wait when nothing is pending')
+
+    def handle(self, *args, **options):
+        while True:
+            start_time = time.time()
+            folded = fold_deltas(options['batch_size'])
+            if folded:
+                self.stdout.write(f'Folded {folded} rollup deltas in {time.time() - start_time:.2f} seconds')
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,117 @@
+from django.core.management.base import BaseCommand, CommandError
+from home.cache_utils import CacheManager
+from home.catalog import upsert_products
+from home.models import Category
+import csv
+import itertools
+import json
+import os
+import time
+
+class Command(BaseCommand):
+    help = ('Upsert categories and products from a CSV or JSONL file, streamed in chunks. '
+            'Columns/keys: name, description, price, stock, category_name (or category), optional id.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSONL file to import')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default=None,
+                            help='File format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows upserted per transaction')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Checkpoint file (default: <path>.checkpoint)')
+        parser.add_argument('--resume', action='store_true',
+                            help='Skip the rows committed by a previous, interrupted run')
+        parser.add_argument('--no-match-by-name', dest='match_by_name', action='store_false',
+                            help='Always create rows without an id instead of updating the product of that name')
+        parser.add_argument('--max-errors', type=int, default=20, help='Row errors printed (all are counted)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+        file_format = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        checkpoint_path = options['checkpoint'] or f'{path}.checkpoint'
+        chunk_size = max(1, options['chunk_size'])
+
+        skip = self.load_checkpoint(checkpoint_path, path) if options['resume'] else 0
+        if skip:
+            self.stdout.write(f'Resuming after row {skip}')
+
+        start_time = time.time()
+        rows = itertools.islice(self.read_rows(path, file_format), skip, None)
+        position = skip
+        created = updated = failed = 0
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            # Per-product invalidation is skipped; list versions are bumped once below
+            report = upsert_products(chunk, match_by_name=options['match_by_name'],
+                                     create_categories=True, invalidate=False)
+            # Detail keys are not versioned, so updated products are dropped as their chunk commits
+            CacheManager.invalidate_product_details([row['id'] for row in report['updated']])
+
+            for error in report['errors']:
+                if failed < options['max_errors']:
+                    self.stderr.write(f"Row {position + error['index'] + 1}: {json.dumps(error['errors'])}")
+                failed += 1
+            created += len(report['created'])
+            updated += len(report['updated'])
+            position += len(chunk)
+            self.save_checkpoint(checkpoint_path, path, position)
+
+            elapsed = time.time() - start_time
+            self.stdout.write(f'{position} rows processed ({(position - skip) / elapsed:.0f} rows/sec)')
+
+        with CacheManager.batched_invalidation():
+            CacheManager.invalidate_category_cache()
+            for category_id in Category.objects.values_list('id', flat=True).iterator(chunk_size=2000):
+                CacheManager.invalidate_product_cache(category_id=category_id)
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+
+        elapsed = time.time() - start_time
+        processed = position - skip
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {processed} rows in {elapsed:.2f} seconds ({processed / elapsed if elapsed else 0:.0f} rows/sec): '
+            f'{created} created, {updated} updated, {failed} failed'
+        ))
+
+    def read_rows(self, path, file_format):
+        """Yield one dict per row without loading the file"""
+        with open(path, newline='', encoding='utf-8') as f:
+            if file_format == 'jsonl':
+                for line in f:
+                    if line.strip():
+                        yield self.normalize(json.loads(line))
+            else:
+                for row in csv.DictReader(f):
+                    yield self.normalize(row)
+
+    def normalize(self, row):
+        if not isinstance(row, dict):
+            return row
+        if 'category_name' not in row and 'category' in row:
+            row['category_name'] = row.pop('category')
+        # Blank CSV cells mean "not given"
+        if row.get('id') in ('', None):
+            row.pop('id', None)
+        return row
+
+    def load_checkpoint(self, checkpoint_path, path):
+        if not os.path.exists(checkpoint_path):
+            return 0
+        with open(checkpoint_path) as f:
+            checkpoint = json.load(f)
+        if checkpoint.get('size') != os.path.getsize(path):
+            raise CommandError(f'{path} changed since the checkpoint was written; delete {checkpoint_path} '
+                               'to start over')
+        return checkpoint['rows']
+
+    def save_checkpoint(self, checkpoint_path, path, rows):
+        """Record the rows committed so far; written atomically so a crash never leaves half a file"""
+        tmp_path = f'{checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'path': os.path.abspath(path), 'size': os.path.getsize(path), 'rows': rows}, f)
+        os.replace(tmp_path, checkpoint_path)
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from home.models import OrderRequest
+from home.checkout import place_queued_orders
+import time
+
+class Command(BaseCommand):
+    help = ('Turn queued order requests into orders, several per transaction. Users are only notified '
+            'over websockets when CHANNEL_LAYER_REDIS_URL configures a shared channel layer.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Order requests per transaction')
+        parser.add_argument('--loop', action='store_true', help='Keep polling the queue')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_batch(options['batch_size'])
+            if not processed:
+                if not options['loop']:
+                    return
+                time.sleep(options['interval'])
+
+    def process_batch(self, batch_size):
+        """Place one batch; returns how many requests it handled"""
+        start_time = time.time()
+        with transaction.atomic():
+            # skip_locked lets several workers drain the queue side by side
+            order_requests = list(
+                OrderRequest.objects.select_for_update(skip_locked=True)
+                .filter(status='queued')
+                .order_by('id')[:batch_size]
+            )
+            if not order_requests:
+                return 0
+            placed, rejected = place_queued_orders(order_requests)
+
+        elapsed = time.time() - start_time
+        self.stdout.write(
+            f'Placed {len(placed)} and rejected {len(rejected)} order requests in {elapsed:.2f} seconds'
+        )
+        return len(order_requests)
@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from home.models import Product, Category
 from home.cache_utils import CacheManager
+from home.cache_metrics import CacheMetrics
 import time
 
 class Command(BaseCommand):
@@ -9,6 +10,7 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--clear', action='store_true', help='Clear all cache')
         parser.add_argument('--stats', action='store_true', help='Show cache stats')
+        parser.add_argument('--reset-stats', action='store_true', help='Reset cache hit/miss metrics')
         parser.add_argument('--test-products', action='store_true', help='Test product caching')
         parser.add_argument('--test-categories', action='store_true', help='Test category caching')
 
@@ -20,11 +22,35 @@ class Command(BaseCommand):
             )
             return
 
+        if options['reset_stats']:
+            CacheMetrics.reset()
+            self.stdout.write(
+                self.style.SUCCESS('Cache metrics reset successfully')
+            )
+            return
+
         if options['stats']:
             stats = CacheManager.get_cache_stats()
+            families = stats.pop('families')
             self.stdout.write(
                 self.style.SUCCESS(f'Cache Stats: {stats}')
             )
+            if not families:
+                self.stdout.write('No cache activity recorded yet')
+            for family, metrics in sorted(families.items()):
+                hit_rate = metrics['hit_rate']
+                self.stdout.write(
+                    f"{family}: hit rate {'n/a' if hit_rate is None else f'{hit_rate:.1%}'}, "
+                    f"hits {metrics['hits']} (L1 {metrics['l1_hits']}, stale {metrics['stale_hits']}), "
+                    f"misses {metrics['misses']}, sets {metrics['sets']} (rejected {metrics['rejected']}), "
+                    f"invalidations {metrics['invalidations']}, bytes written {metrics['bytes_written']}"
+                )
+                for operation in ('get', 'set'):
+                    if f'{operation}_latency_ms' in metrics:
+                        self.stdout.write(
+                            f"  {operation} avg {metrics[f'{operation}_avg_ms']}ms, "
+                            f"histogram {metrics[f'{operation}_latency_ms']}"
+                        )
             return
 
         if options['test_products']:
@@ -0,0 +1,124 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.renderers import JSONRenderer
+from home.models import Product, Category, ProductSales
+from home.serializers import ProductSerializer, CategorySerializer
+from home.cache_utils import CacheManager
+from home.views import build_products_page
+import time
+
+class Command(BaseCommand):
+    help = 'Pre-populate the product and category cache after a deploy or cache clear'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=5, help='Product listing pages to warm')
+        parser.add_argument('--top-products', type=int, default=500, help='Best-selling product details to warm')
+        parser.add_argument('--concurrency', type=int, default=4,
+                            help='Worker threads (each holds one DB connection)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows per query chunk and cache write')
+
+    def handle(self, *args, **options):
+        self.chunk_size = options['chunk_size']
+        start_time = time.time()
+
+        tasks = [self.warm_categories, self.warm_category_details]
+        pages = min(options['pages'], CacheManager.PRODUCTS_MAX_CACHED_PAGES)
+        tasks += [lambda page=page: self.warm_products_page(page) for page in range(1, pages + 1)]
+        # Page 1 of each category's listing (?category=<id>), the way category pages open
+        tasks += [
+            lambda category_id=category_id: self.warm_products_page(1, category_id)
+            for category_id in Category.objects.values_list('id', flat=True)
+        ]
+        tasks.append(lambda: self.warm_top_products(options['top_products']))
+
+        keys_written = 0
+        failures = 0
+        with ThreadPoolExecutor(max_workers=max(1, options['concurrency'])) as executor:
+            futures = [executor.submit(self.run_task, task) for task in tasks]
+            for future in as_completed(futures):
+                try:
+                    keys_written += future.result()
+                except Exception as e:
+                    failures += 1
+                    self.stdout.write(self.style.ERROR(f'Warm-up task failed: {e}'))
+
+        elapsed = time.time() - start_time
+        self.stdout.write(
+            self.style.SUCCESS(f'Warmed {keys_written} cache keys with {len(tasks)} tasks in {elapsed:.2f} seconds')
+        )
+        if failures:
+            self.stdout.write(self.style.WARNING(f'{failures} task(s) failed'))
+
+    def run_task(self, task):
+        """Run one warm-up task and release its thread's DB connection"""
+        try:
+            return task()
+        finally:
+            connection.close()
+
+    def write(self, values):
+        """Cache payloads the way the read views expect them, in one pipelined write"""
+        if getattr(settings, 'CACHE_RENDERED_RESPONSES', False):
+            renderer = JSONRenderer()
+            values = dict(values, **{
+                CacheManager.get_rendered_cache_key(cache_key): renderer.render(data)
+                for cache_key, data in values.items()
+            })
+        CacheManager.set_many(values)
+        return len(values)
+
+    def warm_categories(self):
+        categories = Category.objects.all().order_by('id')
+        return self.write({CacheManager.get_categories_cache_key(): CategorySerializer(categories, many=True).data})
+
+    def warm_category_details(self):
+        written = 0
+        chunk = {}
+        for category in Category.objects.order_by('id').iterator(chunk_size=self.chunk_size):
+            chunk[CacheManager.get_category_detail_cache_key(category.id)] = CategorySerializer(category).data
+            if len(chunk) >= self.chunk_size:
+                written += self.write(chunk)
+                chunk = {}
+        if chunk:
+            written += self.write(chunk)
+        return written
+
+    def warm_products_page(self, page, category_id=None):
+        """One page of the product listing, under the key ProductViewSet.list looks up"""
+        queryset = Product.objects.select_related('category').order_by('id')
+        cache_filters = {}
+        if category_id is not None:
+            queryset = queryset.filter(category_id=category_id)
+            cache_filters['category'] = str(category_id)
+        page_size = CacheManager.PRODUCTS_PAGE_SIZE
+        data = build_products_page(queryset, page, page_size)
+        if data['page'] != page:
+            return 0
+        return self.write({CacheManager.get_products_cache_key(cache_filters, [], page, page_size): data})
+
+    def warm_top_products(self, limit):
+        # Read from the rollup (product_sales_units_idx) rather than aggregating every order item
+        product_ids = list(
+            ProductSales.objects.filter(units_sold__gt=0).order_by('-units_sold')
+            .values_list('product_id', flat=True)[:limit]
+        )
+        if len(product_ids) < limit:
+            # Not enough sales history; fill up with the start of the catalog
+            product_ids += list(
+                Product.objects.exclude(id__in=product_ids).order_by('id')
+                .values_list('id', flat=True)[:limit - len(product_ids)]
+            )
+
+        written = 0
+        queryset = Product.objects.select_related('category').filter(id__in=product_ids).order_by('id')
+        chunk = {}
+        for product in queryset.iterator(chunk_size=self.chunk_size):
+            chunk[CacheManager.get_product_detail_cache_key(product.id)] = ProductSerializer(product).data
+            if len(chunk) >= self.chunk_size:
+                written += self.write(chunk)
+                chunk = {}
+        if chunk:
+            written += self.write(chunk)
+        return written
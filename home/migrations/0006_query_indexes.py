@@ -0,0 +1,34 @@
+# Generated by Django 5.2.4 on 2026-10-17 21:53
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0005_archivedorder'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cartitem',
+            index=models.Index(fields=['user', '-id'], name='cartitem_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='category_name_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at'], name='order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='product_name_lower_idx'),
+        ),
+    ]
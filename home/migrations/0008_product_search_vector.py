@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# A generated tsvector column keeps itself in sync with name and description;
+# other databases fall back to home.search.InvertedIndex.
+FORWARD_SQL = [
+    """
+    ALTER TABLE home_product ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX product_search_vector_idx ON home_product USING GIN (search_vector)",
+]
+REVERSE_SQL = [
+    "DROP INDEX IF EXISTS product_search_vector_idx",
+    "ALTER TABLE home_product DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def add_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in FORWARD_SQL:
+            schema_editor.execute(sql)
+
+
+def remove_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for sql in REVERSE_SQL:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0007_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
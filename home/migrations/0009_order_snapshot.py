@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:09
+
+from collections import defaultdict
+from django.db import migrations, models
+from django.db.models import F
+from rest_framework import serializers
+
+BATCH_SIZE = 1000
+
+# Frozen copy of home.serializers.order_snapshot's format
+_amount_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+
+
+def backfill(order_model, item_model, product_name):
+    """Snapshot existing orders in id order, one batch of orders and their items at a time"""
+    last_id = 0
+    while True:
+        orders = list(order_model.objects.filter(snapshot__isnull=True, id__gt=last_id)
+                      .order_by('id').only('id', 'total_amount')[:BATCH_SIZE])
+        if not orders:
+            return
+        items = defaultdict(list)
+        for item in item_model.objects.filter(order_id__in=[order.id for order in orders]).order_by('id')\
+                .values('order_id', 'quantity', 'price', name=F(product_name)):
+            items[item['order_id']].append({
+                'product': {'name': item['name']},
+                'quantity': item['quantity'],
+                'price': _amount_field.to_representation(item['price']),
+            })
+        for order in orders:
+            order.snapshot = {
+                'total_amount': _amount_field.to_representation(order.total_amount),
+                'items': items[order.id],
+            }
+        order_model.objects.bulk_update(orders, ['snapshot'])
+        last_id = orders[-1].id
+
+
+def backfill_snapshots(apps, schema_editor):
+    # Existing orders get today's product names; new ones keep the names they were placed with
+    backfill(apps.get_model('home', 'Order'), apps.get_model('home', 'OrderItem'), 'product__name')
+    backfill(apps.get_model('home', 'ArchivedOrder'), apps.get_model('home', 'ArchivedOrderItem'), 'product_name')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedorder',
+            name='snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='snapshot',
+            field=models.JSONField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_snapshots, migrations.RunPython.noop),
+    ]
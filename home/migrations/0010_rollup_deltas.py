@@ -0,0 +1,87 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:20
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count, Sum, Max, F
+from django.db.models.functions import TruncDate
+
+STATUS_COUNTERS = {
+    'pending': 'pending_count',
+    'shipped': 'shipped_count',
+    'delivered': 'delivered_count',
+}
+
+
+def rebuild_rollups(apps, schema_editor):
+    """Recount the rollups from every order (frozen copy of `manage.py rebuild_rollups`)
+
+    Until now only checkout orders were counted, so orders from the admin or
+    placed before 0007 had no counters and their status changes underflowed.
+    """
+    UserOrderSummary = apps.get_model('home', 'UserOrderSummary')
+    DailyRevenue = apps.get_model('home', 'DailyRevenue')
+    ProductSales = apps.get_model('home', 'ProductSales')
+
+    users = defaultdict(lambda: {'order_count': 0, 'total_spent': Decimal(0), 'last_order_at': None,
+                                 **{counter: 0 for counter in STATUS_COUNTERS.values()}})
+    days = defaultdict(lambda: {'order_count': 0, 'revenue': Decimal(0)})
+    products = defaultdict(lambda: {'units_sold': 0, 'revenue': Decimal(0)})
+
+    for name in ('Order', 'ArchivedOrder'):
+        orders = apps.get_model('home', name).objects.order_by()
+        for row in orders.values('user_id', 'status')\
+                .annotate(count=Count('id'), spent=Sum('total_amount'), last=Max('created_at')):
+            summary = users[row['user_id']]
+            summary['order_count'] += row['count']
+            summary['total_spent'] += row['spent'] or 0
+            summary[STATUS_COUNTERS[row['status']]] += row['count']
+            if summary['last_order_at'] is None or row['last'] > summary['last_order_at']:
+                summary['last_order_at'] = row['last']
+        for row in orders.annotate(day=TruncDate('created_at')).values('day')\
+                .annotate(count=Count('id'), revenue=Sum('total_amount')):
+            days[row['day']]['order_count'] += row['count']
+            days[row['day']]['revenue'] += row['revenue'] or 0
+
+    items = [apps.get_model('home', 'OrderItem').objects.order_by(),
+             apps.get_model('home', 'ArchivedOrderItem').objects.order_by().exclude(product=None)]
+    for queryset in items:
+        for row in queryset.values('product_id')\
+                .annotate(units=Sum('quantity'), revenue=Sum(F('price') * F('quantity'))):
+            products[row['product_id']]['units_sold'] += row['units'] or 0
+            products[row['product_id']]['revenue'] += row['revenue'] or 0
+
+    UserOrderSummary.objects.all().delete()
+    DailyRevenue.objects.all().delete()
+    ProductSales.objects.all().delete()
+    UserOrderSummary.objects.bulk_create(
+        [UserOrderSummary(user_id=user_id, **values) for user_id, values in users.items()], batch_size=1000,
+    )
+    DailyRevenue.objects.bulk_create(
+        [DailyRevenue(date=date, **values) for date, values in days.items()], batch_size=1000,
+    )
+    ProductSales.objects.bulk_create(
+        [ProductSales(product_id=product_id, **values) for product_id, values in products.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0009_order_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupDelta',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table', models.CharField(choices=[('user', 'User order summary'), ('day', 'Daily revenue'), ('product', 'Product sales')], max_length=10)),
+                ('key', models.CharField(max_length=32)),
+                ('values', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(rebuild_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.4 on 2026-10-17 22:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('home', '0010_rollup_deltas'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='archivedorder',
+            name='home_archiv_user_id_5435f1_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='order',
+            name='order_user_created_idx',
+        ),
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='home_archiv_user_id_437285_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+    ]
@@ -1,10 +1,14 @@
 # home/models.py
 
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from django.db import models, transaction
+from django.db.models.functions import Lower
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from collections import defaultdict
+from functools import partial
 from .cache_utils import CacheManager
+from .notifications import notify_user
 
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
@@ -20,13 +24,13 @@ class Category(models.Model):
 
     def __str__(self):
         return self.name
+
+    class Meta:
+        indexes = [models.Index(Lower('name'), name='category_name_lower_idx')]
     
     def save(self, *args, **kwargs):
-        # Invalidate cache before saving
-        if self.pk:
-            CacheManager.invalidate_category_cache(self.pk)
         super().save(*args, **kwargs)
-        # Invalidate cache after saving
+        # Invalidate cache after saving (deferred to commit inside a transaction)
         CacheManager.invalidate_category_cache(self.pk)
     
     def delete(self, *args, **kwargs):
@@ -43,18 +47,34 @@ class Product(models.Model):
 
     def __str__(self):
         return self.name
+
+    class Meta:
+        indexes = [
+            # Listing filters: category, price range, ordered by id
+            models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+            models.Index(Lower('name'), name='product_name_lower_idx'),
+        ]
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded category so a move invalidates both categories
+        instance._loaded_category_id = instance.__dict__.get('category_id')
+        return instance
     
     def save(self, *args, **kwargs):
-        # Invalidate cache before saving
-        if self.pk:
-            CacheManager.invalidate_product_cache(self.pk)
         super().save(*args, **kwargs)
-        # Invalidate cache after saving
-        CacheManager.invalidate_product_cache(self.pk)
+        # Invalidate cache after saving (deferred to commit inside a transaction)
+        with CacheManager.batched_invalidation():
+            CacheManager.invalidate_product_cache(self.pk, self.category_id)
+            loaded_category_id = getattr(self, '_loaded_category_id', None)
+            if loaded_category_id and loaded_category_id != self.category_id:
+                CacheManager.invalidate_product_cache(category_id=loaded_category_id)
+            self._loaded_category_id = self.category_id
     
     def delete(self, *args, **kwargs):
         # Invalidate cache before deleting
-        CacheManager.invalidate_product_cache(self.pk)
+        CacheManager.invalidate_product_cache(self.pk, self.category_id)
         super().delete(*args, **kwargs)
 
 class CartItem(models.Model):
@@ -71,8 +91,49 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
 
-from asgiref.sync import async_to_sync
-from channels.layers import get_channel_layer
+    class Meta:
+        indexes = [models.Index(fields=['user', '-id'], name='cartitem_user_id_idx')]
+
+class OrderQuerySet(models.QuerySet):
+    def transition(self, status):
+        """Move every order in the queryset to ``status`` with one UPDATE
+
+        Orders whose current status doesn't allow the move are left alone and
+        their ids returned; orders already in ``status`` are skipped. Owners of
+        the moved orders are notified once per user after commit.
+        """
+        allowed_from = [
+            current for current, targets in self.model.ALLOWED_TRANSITIONS.items() if status in targets
+        ]
+        with transaction.atomic():
+            rejected = list(self.exclude(status__in=allowed_from + [status]).values_list('id', flat=True))
+            moved = list(
+                self.filter(status__in=allowed_from).select_for_update().order_by('id')
+                .values_list('id', 'user_id', 'status')
+            )
+            if moved:
+                from .rollups import record_status_changes  # rollups imports this module
+                self.model.objects.filter(id__in=[order_id for order_id, _, _ in moved])\
+                    .update(status=status, updated_at=timezone.now())
+                record_status_changes([(user_id, previous_status, status) for _, user_id, previous_status in moved])
+
+                by_user = defaultdict(list)
+                for order_id, user_id, previous_status in moved:
+                    by_user[user_id].append((order_id, previous_status))
+                transaction.on_commit(partial(self._notify_transition, by_user, status))
+        return rejected
+
+    @staticmethod
+    def _notify_transition(by_user, status):
+        for user_id, orders in by_user.items():
+            if len(orders) == 1:
+                order_id, previous_status = orders[0]
+                message = f"Your order #{order_id} status changed from {previous_status.capitalize()} to {status.capitalize()}."
+            else:
+                numbers = ', '.join(f"#{order_id}" for order_id, _ in orders)
+                message = f"Your orders {numbers} are now {status.capitalize()}."
+            notify_user(user_id, message)
+
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -80,6 +141,11 @@ class Order(models.Model):
         ('shipped', 'Shipped'),
         ('delivered', 'Delivered'),
     ]
+    ALLOWED_TRANSITIONS = {
+        'pending': ['shipped', 'delivered'],
+        'shipped': ['delivered'],
+        'delivered': [],
+    }
 
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     products = models.ManyToManyField(Product, through='OrderItem')
@@ -87,51 +153,61 @@ class Order(models.Model):
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Total and lines as shown in the order history, frozen at placement (see order_snapshot)
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
+
+    objects = OrderQuerySet.as_manager()
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the loaded status and total so save() can check the
+        # transition and update the rollups without a query
+        instance._loaded_status = instance.__dict__.get('status')
+        instance._loaded_total_amount = instance.__dict__.get('total_amount')
+        return instance
+
     def save(self, *args, **kwargs):
-        is_status_changed = False
-        previous_status = None
-
-        if self.pk:
-            try:
-                previous = Order.objects.get(pk=self.pk)
-                previous_status = previous.status
-                allowed_transitions = {
-                    'pending': ['shipped', 'delivered'],
-                    'shipped': ['delivered'],
-                    'delivered': [],
-                }
-
-                if self.status != previous_status:
-                    is_status_changed = True
-                    if self.status not in allowed_transitions[previous_status]:
-                        raise ValueError(f"Invalid status transition from {previous_status} to {self.status}")
-            except Order.DoesNotExist:
-                pass
+        adding = self._state.adding
+        previous_status = previous_total = None
 
-        super().save(*args, **kwargs)
+        if self.pk and not adding:
+            previous_status = getattr(self, '_loaded_status', None)
+            previous_total = getattr(self, '_loaded_total_amount', None)
+            if previous_status is None or previous_total is None:
+                # Built by hand or loaded with status/total deferred
+                previous_status, previous_total = Order.objects.filter(pk=self.pk)\
+                    .values_list('status', 'total_amount').first() or (None, None)
+            if previous_status and self.status != previous_status \
+                    and self.status not in self.ALLOWED_TRANSITIONS[previous_status]:
+                raise ValueError(f"Invalid status transition from {previous_status} to {self.status}")
 
-        # Send notification if status changed
-        if is_status_changed and previous_status:
-            try:
-                channel_layer = get_channel_layer()
-                if channel_layer:
-                    async_to_sync(channel_layer.group_send)(
-                        f"user_{self.user.id}",
-                        {
-                            "type": "send_notification",
-                            "message": f"Your order #{self.id} status changed from {previous_status.capitalize()} to {self.status.capitalize()}."
-                        }
-                    )
-                    print(f"Notification sent to user {self.user.id} for order {self.id}")
-            except Exception as e:
-                print(f"Failed to send notification: {e}")
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            from .rollups import record_orders, record_status_changes, record_total_changes
+            if adding:
+                record_orders([self], [])
+            if previous_status and self.status != previous_status:
+                record_status_changes([(self.user_id, previous_status, self.status)])
+            if previous_total is not None and self.total_amount != previous_total:
+                record_total_changes([(self.user_id, self.created_at, self.total_amount - previous_total)])
+        self._loaded_status = self.status
+        self._loaded_total_amount = self.total_amount
+
+        # Notify once the change is committed, without waiting on the channel layer
+        if previous_status and self.status != previous_status:
+            transaction.on_commit(partial(
+                notify_user,
+                self.user_id,
+                f"Your order #{self.id} status changed from {previous_status.capitalize()} to {self.status.capitalize()}."
+            ))
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx')]
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE,related_name='items')
@@ -142,3 +218,148 @@ class OrderItem(models.Model):
     def __str__(self):
         return f"{self.product.name} x {self.quantity} in Order {self.order.id}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_line = (
+            instance.__dict__.get('product_id'), instance.__dict__.get('quantity'), instance.__dict__.get('price'),
+        )
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Bulk-created items (checkout) are recorded by create_orders instead
+        previous = None
+        if not self._state.adding:
+            previous = getattr(self, '_loaded_line', None)
+            if previous is None or None in previous:
+                previous = OrderItem.objects.filter(pk=self.pk).values_list('product_id', 'quantity', 'price').first()
+        current = (self.product_id, self.quantity, self.price)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous != current:
+                from .rollups import record_orders
+                lines = [{'product_id': self.product_id, 'quantity': self.quantity, 'price': self.price}]
+                if previous is not None:
+                    product_id, quantity, price = previous
+                    lines.append({'product_id': product_id, 'quantity': -quantity, 'price': price})
+                record_orders([], lines)
+        self._loaded_line = current
+
+
+class ArchivedOrder(models.Model):
+    """A delivered order moved out of the hot Order table by `manage.py archive_orders`
+
+    Keeps the original order id so links and tickets stay valid.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_orders')
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=10, choices=Order.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived order {self.id} by user {self.user_id}"
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['user', '-created_at', '-id'])]
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    # The product may be deleted long after the order, so keep its name
+    product = models.ForeignKey(Product, null=True, on_delete=models.SET_NULL, related_name='+')
+    product_name = models.CharField(max_length=100)
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity} in archived order {self.order_id}"
+
+
+class OrderRequest(models.Model):
+    """A queued checkout: the cart as it was when the user placed the order
+
+    The async place-order endpoint writes these; `manage.py
+    process_order_queue` turns queued requests into orders in batches.
+    """
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('placed', 'Placed'),
+        ('rejected', 'Rejected'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='order_requests')
+    # [{id, product_id, quantity, price, total_price}] of the cart items
+    cart_items = models.JSONField(encoder=DjangoJSONEncoder)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    order = models.OneToOneField(Order, null=True, blank=True, on_delete=models.SET_NULL, related_name='request')
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Order request {self.id} by user {self.user_id} ({self.status})"
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
+
+
+class UserOrderSummary(models.Model):
+    """Per-user order totals, kept up to date by home.rollups"""
+    user = models.OneToOneField(CustomUser, primary_key=True, on_delete=models.CASCADE, related_name='order_summary')
+    order_count = models.PositiveIntegerField(default=0)
+    total_spent = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    pending_count = models.PositiveIntegerField(default=0)
+    shipped_count = models.PositiveIntegerField(default=0)
+    delivered_count = models.PositiveIntegerField(default=0)
+    last_order_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['-total_spent'], name='summary_total_spent_idx')]
+
+class DailyRevenue(models.Model):
+    """Orders and revenue per day (UTC), kept up to date by home.rollups"""
+    date = models.DateField(primary_key=True)
+    order_count = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['-date']
+
+class ProductSales(models.Model):
+    """Units sold and revenue per product, kept up to date by home.rollups"""
+    product = models.OneToOneField(Product, primary_key=True, on_delete=models.CASCADE, related_name='sales')
+    units_sold = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [models.Index(fields=['-units_sold'], name='product_sales_units_idx')]
+
+
+class RollupDelta(models.Model):
+    """A pending change to one rollup row, folded in by home.rollups.fold_deltas
+
+    Transactions that place or change orders only append these, so they
+    never wait on the rows every checkout touches (today's DailyRevenue,
+    popular products' ProductSales).
+    """
+    TABLE_CHOICES = [
+        ('user', 'User order summary'),
+        ('day', 'Daily revenue'),
+        ('product', 'Product sales'),
+    ]
+
+    table = models.CharField(max_length=10, choices=TABLE_CHOICES)
+    # Primary key of the rollup row, as text
+    key = models.CharField(max_length=32)
+    # {field: amount to add}, plus an optional 'last_order_at' kept at its maximum
+    values = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_table_display()} {self.key}: {self.values}"
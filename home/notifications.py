@@ -0,0 +1,140 @@
+from django.conf import settings
+from asgiref.sync import SyncToAsync
+from channels.layers import get_channel_layer
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class NotificationDispatcher:
+    """Sends websocket notifications from a background thread
+
+    Callers only put (user_id, message) on a bounded queue, so saving an
+    order never waits on the channel layer. The worker thread sends whatever
+    has queued up concurrently, retrying failed sends with backoff; when the
+    queue is full new notifications are dropped rather than blocking the
+    caller.
+
+    Sends queued from a request run on the ASGI server's event loop, the
+    loop the InMemoryChannelLayer consumers wait on; a group_send from any
+    other loop would never wake them. Sends from outside the server
+    (management commands, process_order_queue) use the worker's own loop
+    and only reach websockets through a shared layer such as
+    RedisChannelLayer.
+    """
+
+    QUEUE_SIZE = getattr(settings, 'NOTIFICATIONS_QUEUE_SIZE', 10000)
+    MAX_RETRIES = getattr(settings, 'NOTIFICATIONS_MAX_RETRIES', 3)
+    RETRY_DELAY = 0.5  # seconds, doubled on every retry
+    BATCH_SIZE = 100
+    DRAIN_TIMEOUT = 5.0
+
+    _queue = queue.Queue(maxsize=QUEUE_SIZE)
+    _thread = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def send(cls, user_id, message: str) -> bool:
+        """Queue a notification for the user's group; False if it was dropped"""
+        cls._ensure_started()
+        try:
+            cls._queue.put_nowait((server_loop(), user_id, message))
+            return True
+        except queue.Full:
+            logger.warning("Notification queue full, dropping notification for user %s", user_id)
+            return False
+
+    @classmethod
+    def drain(cls, timeout: float = None) -> bool:
+        """Wait until queued notifications are sent; False on timeout"""
+        deadline = time.monotonic() + (cls.DRAIN_TIMEOUT if timeout is None else timeout)
+        while cls._queue.unfinished_tasks:
+            if cls._thread is None or time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    @classmethod
+    def _ensure_started(cls) -> None:
+        if cls._thread is not None:
+            return
+        with cls._lock:
+            if cls._thread is None:
+                thread = threading.Thread(target=cls._run, name='notification-dispatcher', daemon=True)
+                thread.start()
+                cls._thread = thread
+                # Short-lived processes (management commands) send before exiting
+                atexit.register(cls.drain)
+
+    @classmethod
+    def _run(cls) -> None:
+        own_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(own_loop)
+        while True:
+            batch = [cls._queue.get()]
+            while len(batch) < cls.BATCH_SIZE:
+                try:
+                    batch.append(cls._queue.get_nowait())
+                except queue.Empty:
+                    break
+            by_loop = {}
+            for loop, user_id, message in batch:
+                if loop is None or loop.is_closed() or not loop.is_running():
+                    loop = own_loop
+                by_loop.setdefault(loop, []).append((user_id, message))
+            for loop, notifications in by_loop.items():
+                try:
+                    if loop is own_loop:
+                        loop.run_until_complete(cls._send_batch(notifications))
+                    else:
+                        asyncio.run_coroutine_threadsafe(cls._send_batch(notifications), loop).result()
+                except Exception as e:
+                    logger.warning("Failed to send %d notifications: %s", len(notifications), e)
+            for _ in batch:
+                cls._queue.task_done()
+
+    @classmethod
+    async def _send_batch(cls, batch) -> None:
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            return
+        pending = batch
+        for attempt in range(cls.MAX_RETRIES + 1):
+            if attempt:
+                await asyncio.sleep(cls.RETRY_DELAY * 2 ** (attempt - 1))
+            results = await asyncio.gather(*[
+                channel_layer.group_send(
+                    f"user_{user_id}",
+                    {
+                        "type": "send_notification",
+                        "message": message,
+                    }
+                )
+                for user_id, message in pending
+            ], return_exceptions=True)
+            pending = [item for item, result in zip(pending, results) if isinstance(result, Exception)]
+            if not pending:
+                return
+        logger.warning("Gave up on %d notifications after %d retries", len(pending), cls.MAX_RETRIES)
+
+
+def server_loop():
+    """The ASGI server's event loop when called from it or one of its sync_to_async threads, else None"""
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    if getattr(SyncToAsync.threadlocal, 'main_event_loop_pid', None) != os.getpid():
+        return None
+    return getattr(SyncToAsync.threadlocal, 'main_event_loop', None)
+
+
+def notify_user(user_id, message):
+    """Push a message to the user's NotificationConsumer group without waiting for it"""
+    NotificationDispatcher.send(user_id, message)
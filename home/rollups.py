@@ -0,0 +1,166 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, When, F, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from .models import UserOrderSummary, DailyRevenue, ProductSales, RollupDelta
+import logging
+
+logger = logging.getLogger(__name__)
+
+STATUS_COUNTERS = {
+    'pending': 'pending_count',
+    'shipped': 'shipped_count',
+    'delivered': 'delivered_count',
+}
+
+ROLLUP_MODELS = {
+    'user': UserOrderSummary,
+    'day': DailyRevenue,
+    'product': ProductSales,
+}
+
+
+def _increment(model, deltas, latest=None):
+    """Add {pk: {field: amount}} to rollup rows, creating missing rows first
+
+    An INSERT that ignores rows that already exist, a lock of the touched
+    rows in pk order (so concurrent folds can't deadlock) and one UPDATE
+    with a CASE per field. Counters never go below zero. ``latest`` is an
+    optional (field, {pk: value}) kept at its maximum.
+    """
+    deltas = {pk: fields for pk, fields in deltas.items() if any(fields.values())}
+    if not deltas:
+        return
+    pk_name = model._meta.pk.attname
+    model.objects.bulk_create([model(**{pk_name: pk}) for pk in deltas], ignore_conflicts=True)
+    rows = model.objects.filter(**{f'{pk_name}__in': list(deltas)})
+    list(rows.select_for_update().order_by(pk_name).values_list(pk_name, flat=True))
+
+    field_names = {field for fields in deltas.values() for field in fields}
+    updates = {}
+    for field in field_names:
+        output_field = model._meta.get_field(field)
+        updates[field] = Greatest(
+            F(field) + Case(
+                *[When(**{pk_name: pk}, then=Value(fields[field], output_field=output_field))
+                  for pk, fields in deltas.items() if fields.get(field)],
+                default=Value(0, output_field=output_field),
+                output_field=output_field,
+            ),
+            Value(0, output_field=output_field),
+            output_field=output_field,
+        )
+    if latest is not None:
+        field, values = latest
+        output_field = model._meta.get_field(field)
+        updates[field] = Case(
+            *[When(**{pk_name: pk, f'{field}__isnull': True}, then=Value(value, output_field=output_field))
+              for pk, value in values.items()],
+            *[When(**{pk_name: pk, f'{field}__lt': value}, then=Value(value, output_field=output_field))
+              for pk, value in values.items()],
+            default=F(field),
+            output_field=output_field,
+        )
+    rows.update(**updates)
+
+
+def _queue(table, deltas, latest=None):
+    """RollupDelta rows for {pk: {field: amount}} (and {pk: last_order_at}) of one rollup table"""
+    latest = latest or {}
+    queued = []
+    for pk, fields in deltas.items():
+        values = {field: str(amount) if isinstance(amount, Decimal) else amount
+                  for field, amount in fields.items() if amount}
+        if pk in latest:
+            values['last_order_at'] = latest[pk].isoformat()
+        if values:
+            queued.append(RollupDelta(table=table, key=str(pk), values=values))
+    return queued
+
+
+def record_orders(orders, items):
+    """Queue newly placed orders and their items for the rollups
+
+    Call in the transaction that creates them: it only appends RollupDelta
+    rows, so the shared DailyRevenue/ProductSales rows are never locked by
+    a checkout. fold_deltas() applies them. ``items`` are OrderItem
+    instances or dicts with product_id, quantity and price.
+    """
+    users = defaultdict(lambda: defaultdict(int))
+    last_order_at = {}
+    days = defaultdict(lambda: defaultdict(int))
+    for order in orders:
+        created_at = order.created_at or timezone.now()
+        summary = users[order.user_id]
+        summary['order_count'] += 1
+        summary['total_spent'] += order.total_amount
+        summary[STATUS_COUNTERS[order.status]] += 1
+        last_order_at[order.user_id] = max(created_at, last_order_at.get(order.user_id, created_at))
+        day = days[timezone.localtime(created_at).date()]
+        day['order_count'] += 1
+        day['revenue'] += order.total_amount
+
+    products = defaultdict(lambda: defaultdict(int))
+    for item in items:
+        if not isinstance(item, dict):
+            item = {'product_id': item.product_id, 'quantity': item.quantity, 'price': item.price}
+        sales = products[item['product_id']]
+        sales['units_sold'] += item['quantity']
+        sales['revenue'] += Decimal(item['price']) * item['quantity']
+
+    RollupDelta.objects.bulk_create(
+        _queue('user', users, last_order_at) + _queue('day', days) + _queue('product', products)
+    )
+
+
+def record_status_changes(changes):
+    """Queue moves between the per-status counters; ``changes`` are (user_id, old, new)"""
+    users = defaultdict(lambda: defaultdict(int))
+    for user_id, previous_status, status in changes:
+        if previous_status == status:
+            continue
+        users[user_id][STATUS_COUNTERS[previous_status]] -= 1
+        users[user_id][STATUS_COUNTERS[status]] += 1
+    RollupDelta.objects.bulk_create(_queue('user', users))
+
+
+def record_total_changes(changes):
+    """Queue changes to order totals; ``changes`` are (user_id, created_at, amount added)"""
+    users = defaultdict(lambda: defaultdict(int))
+    days = defaultdict(lambda: defaultdict(int))
+    for user_id, created_at, amount in changes:
+        users[user_id]['total_spent'] += amount
+        days[timezone.localtime(created_at).date()]['revenue'] += amount
+    RollupDelta.objects.bulk_create(_queue('user', users) + _queue('day', days))
+
+
+def fold_deltas(batch_size=1000):
+    """Apply pending RollupDelta rows to the rollup tables; returns how many were folded
+
+    Each batch is claimed with SKIP LOCKED and deleted in the transaction
+    that applies it, so concurrent folds never apply a delta twice.
+    """
+    folded = 0
+    while True:
+        with transaction.atomic():
+            pending = list(RollupDelta.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+            if not pending:
+                return folded
+            deltas = {table: defaultdict(lambda: defaultdict(int)) for table in ROLLUP_MODELS}
+            latest = {table: {} for table in ROLLUP_MODELS}
+            for delta in pending:
+                model = ROLLUP_MODELS[delta.table]
+                pk = model._meta.pk.to_python(delta.key)
+                for field, value in delta.values.items():
+                    value = model._meta.get_field(field).to_python(value)
+                    if field == 'last_order_at':
+                        latest[delta.table][pk] = max(value, latest[delta.table].get(pk, value))
+                    else:
+                        deltas[delta.table][pk][field] += value
+            for table, model in ROLLUP_MODELS.items():
+                _increment(model, deltas[table],
+                           latest=('last_order_at', latest[table]) if latest[table] else None)
+            RollupDelta.objects.filter(id__in=[delta.id for delta in pending]).delete()
+        folded += len(pending)
@@ -0,0 +1,157 @@
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import connections
+from .cache_utils import CacheManager
+from .models import Product
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, List
+
+SEARCH_CONFIG = 'english'
+MAX_QUERY_LENGTH = 200
+
+# search_vector is a generated column on PostgreSQL, see 0008_product_search_vector.
+# Every match is ranked before LIMIT/OFFSET cut out the page, so a page holds
+# the best matches overall; the count runs as its own query.
+POSTGRES_SEARCH_SQL = """
+    SELECT id
+    FROM home_product, websearch_to_tsquery(%s, %s) AS query
+    WHERE search_vector @@ query
+    ORDER BY ts_rank_cd(search_vector, query) DESC, id
+    LIMIT %s OFFSET %s
+"""
+
+POSTGRES_COUNT_SQL = """
+    SELECT count(*)
+    FROM home_product, websearch_to_tsquery(%s, %s) AS query
+    WHERE search_vector @@ query
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word tokens with plural 's' stripped, roughly what to_tsvector keeps"""
+    tokens = []
+    for token in re.findall(r'\w+', (text or '').lower()):
+        if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class InvertedIndex:
+    """In-process token -> {product_id: weight} index over product names and descriptions
+
+    The fallback for databases without full-text search (SQLite dev and test
+    runs). It is rebuilt on the first search after the search index version
+    moves, i.e. after a product or category edit, but not after the stock
+    updates of checkout and flash-sale flushes.
+    """
+
+    # Same relative weights as ts_rank's default for the A and B labels
+    NAME_WEIGHT = 1.0
+    DESCRIPTION_WEIGHT = 0.4
+
+    _lock = threading.Lock()
+    _version = None
+    _postings: Dict[str, Dict[int, float]] = {}
+
+    @classmethod
+    def _get_postings(cls) -> Dict[str, Dict[int, float]]:
+        version = CacheManager.get_version(CacheManager.SEARCH_INDEX_VERSION_KEY)
+        if cls._version != version:
+            with cls._lock:
+                if cls._version != version:
+                    cls._postings = cls._build()
+                    cls._version = version
+        return cls._postings
+
+    @classmethod
+    def _build(cls) -> Dict[str, Dict[int, float]]:
+        postings = defaultdict(lambda: defaultdict(float))
+        rows = Product.objects.order_by().values_list('id', 'name', 'description').iterator(chunk_size=2000)
+        for product_id, name, description in rows:
+            for token in tokenize(name):
+                postings[token][product_id] += cls.NAME_WEIGHT
+            for token in tokenize(description):
+                postings[token][product_id] += cls.DESCRIPTION_WEIGHT
+        return {token: dict(matches) for token, matches in postings.items()}
+
+    @classmethod
+    def search(cls, query: str) -> List[int]:
+        """Ids of products matching every query term, best first"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        postings = cls._get_postings()
+        scores = None
+        for term in dict.fromkeys(terms):
+            matches = postings.get(term, {})
+            if scores is None:
+                scores = dict(matches)
+            else:
+                scores = {product_id: score + matches[product_id]
+                          for product_id, score in scores.items() if product_id in matches}
+            if not scores:
+                return []
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [product_id for product_id, _ in ranked]
+
+
+class PostgresRankedIds:
+    """Ids of the products matching a query, best first, fetched a slice at a time
+
+    Paginator calls count() once and slices out one page, so a search runs
+    one count and one ranked, limited query whatever the number of matches.
+    """
+
+    def __init__(self, query: str, alias: str):
+        self.query = query
+        self.alias = alias
+
+    def _fetch(self, sql: str, params: List) -> List:
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute(sql, [SEARCH_CONFIG, self.query] + params)
+            return cursor.fetchall()
+
+    def count(self) -> int:
+        return self._fetch(POSTGRES_COUNT_SQL, [])[0][0]
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice) or index.step is not None:
+            raise TypeError("PostgresRankedIds only supports slicing without a step")
+        start = index.start or 0
+        if index.stop is not None and index.stop <= start:
+            return []
+        limit = None if index.stop is None else index.stop - start
+        return [row[0] for row in self._fetch(POSTGRES_SEARCH_SQL, [limit, start])]
+
+
+def ranked_product_ids(query: str):
+    """Ids of the products matching ``query``, best match first, as a sliceable sequence"""
+    alias = Product.objects.db
+    if connections[alias].vendor != 'postgresql':
+        return InvertedIndex.search(query)
+    return PostgresRankedIds(query, alias)
+
+
+def search_products_page(query: str, page_number: int, page_size: int, get_serializer) -> Dict:
+    """One page of ranked search results, shaped like the product listing payload"""
+    paginator = Paginator(ranked_product_ids(query), page_size)
+    try:
+        results_page = paginator.page(page_number)
+    except (EmptyPage, PageNotAnInteger):
+        results_page = paginator.page(1)
+
+    product_ids = list(results_page.object_list)
+    products = Product.objects.select_related('category').in_bulk(product_ids)
+    serializer = get_serializer([products[i] for i in product_ids if i in products], many=True)
+    return {
+        'count': paginator.count,
+        'next': results_page.has_next(),
+        'previous': results_page.has_previous(),
+        'page': results_page.number,
+        'results': serializer.data,
+    }
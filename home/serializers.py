@@ -3,6 +3,84 @@ from .models import *
 from .models import Product, Category
 
 
+class SparseFieldsMixin:
+    """Serializer mixin taking ``fields=[...]`` to keep only those fields (None keeps all)"""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class ValuesSerializer:
+    """Read-only fast path that serializes queryset.values() rows without model instances
+
+    Compiled once per (serializer class, fields) from the serializer's own
+    readable fields: each becomes a values() lookup plus a mapper giving the
+    same output as its to_representation. compile() returns None when a
+    field can't be read straight from a column (e.g. SerializerMethodField),
+    and callers fall back to the serializer, as they do for a dotted source
+    across a nullable relation, which DRF leaves out of the output when the
+    relation is empty.
+    """
+
+    # Fields that represent a column value as the value itself
+    PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.PrimaryKeyRelatedField)
+    MAPPED_FIELDS = (serializers.DecimalField, serializers.DateTimeField, serializers.DateField)
+
+    _compiled = {}
+
+    def __init__(self, columns):
+        # (output name, values() lookup, mapper or None)
+        self.columns = columns
+        self.lookups = list(dict.fromkeys(lookup for _, lookup, _ in columns))
+
+    @classmethod
+    def compile(cls, serializer_class, fields=None):
+        key = (serializer_class, tuple(fields) if fields is not None else None)
+        if key not in cls._compiled:
+            cls._compiled[key] = cls._build(serializer_class, fields)
+        return cls._compiled[key]
+
+    @classmethod
+    def _build(cls, serializer_class, fields):
+        columns = []
+        for name, field in serializer_class().fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if field.source == '*' or not isinstance(field, cls.PASSTHROUGH_FIELDS + cls.MAPPED_FIELDS):
+                return None
+            if cls._crosses_nullable_relation(serializer_class.Meta.model, field.source_attrs):
+                return None
+            mapper = field.to_representation if isinstance(field, cls.MAPPED_FIELDS) else None
+            columns.append((name, field.source.replace('.', '__'), mapper))
+        return cls(columns)
+
+    @staticmethod
+    def _crosses_nullable_relation(model, source_attrs):
+        for attr in source_attrs[:-1]:
+            relation = model._meta.get_field(attr)
+            if relation.null:
+                return True
+            model = relation.related_model
+        return False
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def serialize(self, rows):
+        columns = self.columns
+        data = []
+        for row in rows:
+            item = {}
+            for name, lookup, mapper in columns:
+                value = row[lookup]
+                item[name] = value if mapper is None or value is None else mapper(value)
+            data.append(item)
+        return data
+
+
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
@@ -60,7 +138,7 @@ class ProfileSerializer(serializers.ModelSerializer):
         read_only_fields = ['username', 'email']
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
@@ -76,7 +154,7 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     category_name = serializers.CharField(write_only=True)
     category = serializers.CharField(source='category.name', read_only=True)
 
@@ -87,7 +165,7 @@ class ProductSerializer(serializers.ModelSerializer):
     def validate_name(self, value):
         # Only apply uniqueness check on create or if name is changed
         product_id = self.instance.id if self.instance else None
-        qs = Product.objects.filter(name__iexact=value)
+        qs = Product.objects.filter(name__lower=value.lower())
         if product_id:
             qs = qs.exclude(id=product_id)
         if qs.exists():
@@ -95,19 +173,19 @@ class ProductSerializer(serializers.ModelSerializer):
         return value
 
     def validate_category_name(self, value):
-        if not Category.objects.filter(name__iexact=value).exists():
+        if not Category.objects.filter(name__lower=value.lower()).exists():
             raise serializers.ValidationError("Category with this name does not exist.")
         return value
 
     def create(self, validated_data):
         category_name = validated_data.pop('category_name')
-        category = Category.objects.get(name__iexact=category_name)
+        category = Category.objects.get(name__lower=category_name.lower())
         return Product.objects.create(category=category, **validated_data)
 
     def update(self, instance, validated_data):
         category_name = validated_data.pop('category_name', None)
         if category_name:
-            category = Category.objects.get(name__iexact=category_name)
+            category = Category.objects.get(name__lower=category_name.lower())
             instance.category = category
 
         for attr, value in validated_data.items():
@@ -120,7 +198,7 @@ class ProductSerializer(serializers.ModelSerializer):
 
 
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     class Meta:
         model = CartItem
@@ -178,3 +256,63 @@ class OrderSerializer(serializers.ModelSerializer):
         order.save()
 
         return order
+
+
+class ArchivedOrderItemSerializer(serializers.ModelSerializer):
+    product = serializers.SerializerMethodField()
+    class Meta:
+        model = ArchivedOrderItem
+        fields = ['product', 'quantity', 'price']
+
+    def get_product(self, obj):
+        return {
+            'name': obj.product_name,
+        }
+
+class ArchivedOrderSerializer(serializers.ModelSerializer):
+    """Same shape as OrderSerializer, so clients can't tell archived orders apart"""
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = ArchivedOrder
+        fields = ['id', 'user', 'created_at', 'total_amount', 'items', 'status']
+
+
+# Same representations as OrderSerializer's total_amount/price and created_at
+_amount_field = serializers.DecimalField(max_digits=10, decimal_places=2)
+_datetime_field = serializers.DateTimeField()
+
+
+def order_snapshot(total_amount, items, product_names):
+    """Total and lines of a new order as OrderSerializer shows them, for Order.snapshot
+
+    ``items`` are dicts with product_id, quantity and price; ``product_names``
+    maps product ids to names. Names are copied so later renames leave the
+    order history alone.
+    """
+    return {
+        'total_amount': _amount_field.to_representation(total_amount),
+        'items': [
+            {
+                'product': {'name': product_names.get(item['product_id'])},
+                'quantity': item['quantity'],
+                'price': _amount_field.to_representation(item['price']),
+            }
+            for item in items
+        ],
+    }
+
+
+def order_history_row(row):
+    """OrderSerializer output rebuilt from values('id', 'user_id', 'created_at', 'status', 'snapshot')
+
+    Status lives in its own column, so status changes never touch the snapshot.
+    """
+    return {
+        'id': row['id'],
+        'user': row['user_id'],
+        'created_at': _datetime_field.to_representation(row['created_at']),
+        'total_amount': row['snapshot']['total_amount'],
+        'items': row['snapshot']['items'],
+        'status': row['status'],
+    }
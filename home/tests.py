@@ -1,3 +1,1321 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+    override_settings, skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+from . import exports
+from .db_router import ReadReplicaMiddleware, ReplicaHealth, ReplicaRouter, _replica_reads, use_replicas
+from .flash_sale import FlashSaleError, FlashSaleManager
+from .checkout import CheckoutError, decrement_stock, enqueue_order, lock_products, place_order, place_queued_orders
+from .notifications import NotificationDispatcher, notify_user
+from .models import (
+    ArchivedOrder, Category, Product, CustomUser, Order, OrderItem, CartItem, OrderRequest, UserOrderSummary,
+    DailyRevenue, ProductSales, RollupDelta,
+)
+from .cache_codecs import (
+    COMPRESSED, HEADER, UNCOMPRESSED, decode_entry, encode_entry, pack_tables, unpack_tables,
+)
+from .cache_metrics import CacheMetrics
+from .cache_utils import CacheManager
+from .catalog import upsert_products
+from .rollups import fold_deltas, record_status_changes
+from .search import MAX_QUERY_LENGTH, InvertedIndex, PostgresRankedIds, ranked_product_ids
+from .serializers import (
+    CartItemSerializer, CategorySerializer, ProductSerializer, SparseFieldsMixin, ValuesSerializer,
+)
+from .views import MyOrdersAPIView, ProductViewSet
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class QueryPlanTests(TestCase):
+    """The hot read paths must be served by the indexes from 0006_query_indexes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        categories = Category.objects.bulk_create([
+            Category(name=f'Category {i}') for i in range(20)
+        ])
+        Product.objects.bulk_create([
+            Product(
+                name=f'Product {i}',
+                price=Decimal(i % 500) + Decimal('0.99'),
+                stock=100,
+                category=categories[i % len(categories)],
+            )
+            for i in range(2000)
+        ])
+        users = CustomUser.objects.bulk_create([
+            CustomUser(username=f'user{i}', email=f'user{i}@example.com') for i in range(20)
+        ])
+        Order.objects.bulk_create([
+            Order(user=users[i % len(users)], total_amount=Decimal(i)) for i in range(2000)
+        ])
+        products = list(Product.objects.order_by('id')[:50])
+        CartItem.objects.bulk_create([
+            CartItem(user=user, product=product, price=product.price, quantity=1, total_price=product.price)
+            for user in users for product in products[:25]
+        ])
+        cls.category = categories[3]
+        cls.user = users[7]
+
+    def assertUsesIndex(self, queryset, *index_names, ordered=False):
+        """The plan reads through one of ``index_names``; with ``ordered``, it needs no separate sort"""
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny; make the planner show which index it would use
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        plan = queryset.explain()
+        self.assertTrue(any(name in plan for name in index_names), f'{index_names} not used:\n{plan}')
+        if ordered:
+            self.assertNotIn('TEMP B-TREE', plan)
+            self.assertNotRegex(plan, r'(?m)^\s*(->\s*)?Sort\b')
+
+    def test_product_listing_by_category_and_price(self):
+        queryset = Product.objects.filter(
+            category=self.category, price__gte=Decimal('10'), price__lte=Decimal('200'),
+        ).order_by('id')
+        self.assertUsesIndex(queryset, 'product_category_price_idx')
+
+    def test_product_name_lookup(self):
+        self.assertUsesIndex(Product.objects.filter(name__lower='product 42'), 'product_name_lower_idx')
+
+    def test_category_name_lookup(self):
+        self.assertUsesIndex(Category.objects.filter(name__lower='category 3'), 'category_name_lower_idx')
+
+    def test_orders_by_user(self):
+        self.assertUsesIndex(Order.objects.filter(user=self.user).order_by('-created_at', '-id'),
+                             'order_user_created_idx', ordered=True)
+        self.assertUsesIndex(ArchivedOrder.objects.filter(user=self.user).order_by('-created_at', '-id'),
+                             ArchivedOrder._meta.indexes[0].name, ordered=True)
+
+    def test_cart_items_by_user(self):
+        # SQLite indexes end with the rowid, so its plain user_id FK index is equivalent there
+        self.assertUsesIndex(
+            CartItem.objects.filter(user=self.user).order_by('-id'),
+            'cartitem_user_id_idx', *(['home_cartitem_user_id'] if connection.vendor == 'sqlite' else []),
+            ordered=True,
+        )
+
+
+class RollupTests(TestCase):
+    """Rollups follow every order change, and checkouts never lock the shared rollup rows"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Rollups')
+        cls.products = [
+            Product.objects.create(name=f'Rollup product {i}', price=Decimal('5.00') + i, stock=100, category=category)
+            for i in range(3)
+        ]
+        cls.user = CustomUser.objects.create(username='rollups', email='rollups@example.com')
+
+    def rollups(self):
+        fold_deltas()
+        return (
+            list(UserOrderSummary.objects.order_by('user_id').values()),
+            list(DailyRevenue.objects.order_by('date').values()),
+            list(ProductSales.objects.order_by('product_id').values()),
+        )
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups()
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(incremental, self.rollups())
+
+    def test_checkout_only_appends_deltas(self):
+        CartItem.objects.create(user=self.user, product=self.products[0], price=self.products[0].price, quantity=2)
+        with CaptureQueriesContext(connection) as queries, transaction.atomic():
+            place_order(self.user)
+        rollup_tables = [model._meta.db_table for model in (UserOrderSummary, DailyRevenue, ProductSales)]
+        touched = [query['sql'] for query in queries if any(table in query['sql'] for table in rollup_tables)]
+        self.assertEqual(touched, [])
+        self.assertTrue(RollupDelta.objects.exists())
+        self.assertMatchesRebuild()
+
+    def test_orders_created_outside_checkout_are_counted(self):
+        # The admin and OrderSerializer.create save orders and items one by one
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, product=self.products[1], quantity=3, price=self.products[1].price)
+        order.total_amount = self.products[1].price * 3
+        order.save()
+        item = OrderItem.objects.get(order=order)
+        item.quantity = 1
+        item.save()
+
+        Order.objects.filter(id=order.id).transition('shipped')
+        order = Order.objects.get(id=order.id)
+        order.status = 'delivered'
+        order.save()
+
+        summary = self.rollups()[0][0]
+        self.assertEqual((summary['order_count'], summary['pending_count'], summary['delivered_count']), (1, 0, 1))
+        self.assertMatchesRebuild()
+
+    def test_analytics_reads_do_not_fold(self):
+        admin = CustomUser.objects.create(username='rollup-admin', email='rollup-admin@example.com', is_staff=True)
+        record_status_changes([(self.user.id, 'pending', 'shipped')])
+        token = RefreshToken.for_user(admin).access_token
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/analytics/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        writes = [query['sql'] for query in queries if query['sql'].split()[0] in ('INSERT', 'UPDATE', 'DELETE')]
+        self.assertEqual(writes, [])
+        self.assertTrue(RollupDelta.objects.exists())
+
+    def test_counters_never_go_negative(self):
+        # e.g. an order that predates the rollups moving out of pending
+        record_status_changes([(self.user.id, 'pending', 'shipped')])
+        summary = self.rollups()[0][0]
+        self.assertEqual((summary['pending_count'], summary['shipped_count']), (0, 1))
+
+
+class ExportStreamingTests(TestCase):
+    """Under ASGI exports are sent chunk by chunk, not built in memory first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Exports')
+        Product.objects.bulk_create([
+            Product(name=f'Export product {i}', price=Decimal('1.00'), stock=1, category=category) for i in range(5)
+        ])
+        cls.admin = CustomUser.objects.create(username='exporter', email='exporter@example.com', is_staff=True)
+
+    async def test_first_chunk_is_sent_before_the_export_finishes(self):
+        rows_read = []
+
+        def export_products(category_id=None):
+            for row in exports.export_products(category_id):
+                rows_read.append(row['id'])
+                yield row
+
+        token = RefreshToken.for_user(self.admin).access_token
+        with mock.patch.object(exports, 'EXPORT_CHUNK_SIZE', 2), \
+                mock.patch('home.views.export_products', export_products):
+            response = await AsyncClient().get('/export/products/', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.is_async)
+
+            content = aiter(response.streaming_content)
+            first_chunk = await anext(content)
+            self.assertEqual(len(first_chunk.splitlines()), 2)
+            self.assertEqual(len(rows_read), 2)
+
+            rest = [chunk async for chunk in content]
+        self.assertEqual(len(b''.join([first_chunk] + rest).splitlines()), 5)
+        self.assertEqual(len(rows_read), 5)
+
+
+class NotificationTests(TestCase):
+    async def test_request_notifications_wake_in_memory_consumers(self):
+        # The consumer is idle on the server loop when the worker thread sends
+        send_batch = NotificationDispatcher._send_batch
+
+        async def delayed_send_batch(batch):
+            await asyncio.sleep(0.1)
+            await send_batch(batch)
+
+        channel_layer = get_channel_layer()
+        channel = await channel_layer.new_channel()
+        await channel_layer.group_add('user_42', channel)
+        with mock.patch.object(NotificationDispatcher, '_send_batch', delayed_send_batch):
+            await sync_to_async(notify_user)(42, 'Order shipped')
+            start_time = time.monotonic()
+            message = await asyncio.wait_for(channel_layer.receive(channel), timeout=5)
+        self.assertEqual(message, {'type': 'send_notification', 'message': 'Order shipped'})
+        self.assertLess(time.monotonic() - start_time, 1)
+
+
+class OrderQueueTests(TestCase):
+    """process_order_queue rejects requests on their own and never places a cart twice"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Queue')
+        cls.product = Product.objects.create(name='Queued product', price=Decimal('10.00'), stock=3, category=category)
+        cls.users = [CustomUser.objects.create(username=f'queue{i}', email=f'queue{i}@example.com') for i in range(3)]
+
+    def add_to_cart(self, user, quantity):
+        CartItem.objects.create(user=user, product=self.product, price=self.product.price, quantity=quantity)
+
+    def process_queue(self):
+        with transaction.atomic():
+            return place_queued_orders(list(OrderRequest.objects.filter(status='queued').order_by('id')))
+
+    def test_batch_rejects_only_the_requests_that_cannot_be_filled(self):
+        for user, quantity in zip(self.users, [2, 2, 1]):
+            self.add_to_cart(user, quantity)
+            enqueue_order(user)
+
+        placed, rejected = self.process_queue()
+
+        self.assertEqual([request.user_id for request in placed], [self.users[0].id, self.users[2].id])
+        self.assertEqual([request.user_id for request in rejected], [self.users[1].id])
+        self.assertIn('Not enough stock', OrderRequest.objects.get(user=self.users[1]).error)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 0)
+        self.assertEqual(Order.objects.count(), 2)
+        # The rejected user's cart is left alone
+        self.assertTrue(CartItem.objects.filter(user=self.users[1]).exists())
+
+    def test_cart_ordered_after_queueing_is_not_charged_twice(self):
+        user = self.users[0]
+        self.add_to_cart(user, 1)
+        enqueue_order(user)
+        with transaction.atomic():
+            place_order(user)
+
+        placed, rejected = self.process_queue()
+
+        self.assertEqual((placed, len(rejected)), ([], 1))
+        self.assertEqual(Order.objects.filter(user=user).count(), 1)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 2)
+
+    def test_sync_checkout_of_an_ordered_cart_fails(self):
+        user = self.users[0]
+        self.add_to_cart(user, 1)
+        enqueue_order(user)
+        self.process_queue()
+
+        with self.assertRaisesMessage(CheckoutError, 'Cart is empty'), transaction.atomic():
+            place_order(user)
+        self.assertEqual(Order.objects.filter(user=user).count(), 1)
+
+
+@skipUnless(fakeredis, 'flash-sale tests need fakeredis (with lupa for the Lua scripts)')
+class FlashSaleTests(TestCase):
+    """Reservations against the Redis counters, settled on commit and flushed to Product.stock"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Flash')
+        cls.product, cls.other = [
+            Product.objects.create(name=f'Flash product {i}', price=Decimal('3.00'), stock=10, category=category)
+            for i in range(2)
+        ]
+        cls.user = CustomUser.objects.create(username='flash', email='flash@example.com')
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.object(FlashSaleManager, '_client', lambda: self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Registered scripts are bound to the client that registered them
+        FlashSaleManager._scripts = {}
+        self.addCleanup(delattr, FlashSaleManager, '_scripts')
+        FlashSaleManager.enable(self.product.id)
+        FlashSaleManager.enable(self.other.id)
+
+    def stock(self, product):
+        return Product.objects.get(id=product.id).stock
+
+    def test_reserve_commit_and_flush(self):
+        token = FlashSaleManager.reserve({self.product.id: 3, self.other.id: 1})
+        self.assertEqual((FlashSaleManager.available(self.product.id), FlashSaleManager.available(self.other.id)), (7, 9))
+
+        FlashSaleManager.commit(token)
+        self.assertEqual(self.stock(self.product), 10)
+        self.assertEqual(FlashSaleManager.flush(), {self.product.id: 3, self.other.id: 1})
+        self.assertEqual((self.stock(self.product), self.stock(self.other)), (7, 9))
+        self.assertEqual(FlashSaleManager.available(self.product.id), 7)
+
+    def test_shortfall_reserves_nothing(self):
+        with self.assertRaises(FlashSaleError) as raised:
+            FlashSaleManager.reserve({self.product.id: 1, self.other.id: 11})
+        self.assertEqual(raised.exception.product_id, self.other.id)
+        self.assertEqual(FlashSaleManager.available(self.product.id), 10)
+
+    def test_release_and_sweep_return_units(self):
+        FlashSaleManager.release(FlashSaleManager.reserve({self.product.id: 4}))
+        self.assertEqual(FlashSaleManager.available(self.product.id), 10)
+
+        FlashSaleManager.reserve({self.product.id: 2})
+        self.assertEqual(FlashSaleManager.sweep_expired(), 0)
+        self.assertEqual(FlashSaleManager.sweep_expired(now=time.time() + FlashSaleManager.RESERVATION_TIMEOUT + 1), 1)
+        self.assertEqual(FlashSaleManager.available(self.product.id), 10)
+
+    def test_disable_settles_only_this_product(self):
+        FlashSaleManager.commit(FlashSaleManager.reserve({self.product.id: 2}))
+        live = FlashSaleManager.reserve({self.other.id: 1})
+        with mock.patch('time.time', return_value=time.time() - FlashSaleManager.RESERVATION_TIMEOUT - 1):
+            FlashSaleManager.reserve({self.other.id: 3})
+            FlashSaleManager.reserve({self.product.id: 1})
+
+        FlashSaleManager.disable(self.product.id)
+
+        self.assertEqual(FlashSaleManager.enabled_products(), [self.other.id])
+        self.assertIsNone(FlashSaleManager.available(self.product.id))
+        self.assertEqual(self.stock(self.product), 8)
+        # The other product's reservations, expired or not, are left for its own checkouts and sweeps
+        self.assertEqual(FlashSaleManager.available(self.other.id), 6)
+        FlashSaleManager.commit(live)
+        self.assertEqual(FlashSaleManager.sweep_expired(), 1)
+        self.assertEqual(FlashSaleManager.available(self.other.id), 9)
+
+    def test_checkout_survives_a_failed_commit(self):
+        CartItem.objects.create(user=self.user, product=self.product, price=self.product.price, quantity=2)
+        with mock.patch.object(FlashSaleManager, 'commit', side_effect=ConnectionError('Redis is down')), \
+                self.assertLogs('home.checkout', 'ERROR'), \
+                self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            order = place_order(self.user)
+        self.assertTrue(Order.objects.filter(id=order.id).exists())
+
+    def test_disable_counts_live_reservations_as_sold(self):
+        live = FlashSaleManager.reserve({self.product.id: 3, self.other.id: 1})
+        rolled_back = FlashSaleManager.reserve({self.product.id: 2})
+
+        self.assertEqual(FlashSaleManager.disable(self.product.id), 2)
+        self.assertEqual(self.stock(self.product), 5)
+
+        # Settling later touches neither the dropped counter nor the product's stock again
+        FlashSaleManager.release(rolled_back)
+        FlashSaleManager.commit(live)
+        self.assertIsNone(FlashSaleManager.available(self.product.id))
+        self.assertEqual(FlashSaleManager.flush(), {self.other.id: 1})
+        self.assertEqual((self.stock(self.product), self.stock(self.other)), (5, 9))
+
+    def test_checkout_reads_the_enabled_set_once(self):
+        CartItem.objects.create(user=self.user, product=self.product, price=self.product.price, quantity=2)
+        CartItem.objects.create(user=self.user, product=self.other, price=self.other.price, quantity=1)
+        FlashSaleManager.disable(self.other.id)
+        with mock.patch.object(FlashSaleManager, 'enabled_products', wraps=FlashSaleManager.enabled_products) as enabled, \
+                self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            place_order(self.user)
+        self.assertEqual(enabled.call_count, 1)
+        self.assertEqual((self.stock(self.other), FlashSaleManager.available(self.product.id)), (9, 8))
+
+    def test_checkout_fails_if_flash_mode_changes_before_the_row_lock(self):
+        # The product is switched to flash-sale mode between the check and the row lock
+        FlashSaleManager.disable(self.product.id)
+        enabled_products = FlashSaleManager.enabled_products
+
+        def enable_after_check(product_ids=None):
+            result = enabled_products(product_ids)
+            FlashSaleManager.enable(self.product.id)
+            return result
+
+        CartItem.objects.create(user=self.user, product=self.product, price=self.product.price, quantity=2)
+        with mock.patch.object(FlashSaleManager, 'enabled_products', side_effect=enable_after_check), \
+                self.assertRaisesMessage(CheckoutError, 'changed while the order was being placed'), \
+                transaction.atomic():
+            place_order(self.user)
+        self.assertEqual(self.stock(self.product), 10)
+        self.assertEqual(FlashSaleManager.available(self.product.id), 10)
+
+    def test_queued_orders_reject_products_switched_before_the_row_lock(self):
+        FlashSaleManager.disable(self.product.id)
+        CartItem.objects.create(user=self.user, product=self.product, price=self.product.price, quantity=2)
+        order_request = enqueue_order(self.user)
+        FlashSaleManager.enable(self.product.id)
+
+        with mock.patch.object(FlashSaleManager, 'enabled_products', return_value=[]), transaction.atomic():
+            placed, rejected = place_queued_orders([order_request])
+        self.assertEqual((placed, rejected), ([], [order_request]))
+        self.assertIn('changed while the order was being placed', order_request.error)
+        self.assertEqual((self.stock(self.product), FlashSaleManager.available(self.product.id)), (10, 10))
+
+
+class MyOrdersTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='history', email='history@example.com')
+        Order.objects.bulk_create([Order(user=cls.user, total_amount=Decimal(i)) for i in range(25)])
+
+    def get_orders(self, query=''):
+        token = RefreshToken.for_user(self.user).access_token
+        response = self.client.get(f'/my-orders/{query}', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_history_is_paged_by_default(self):
+        first_page = self.get_orders()
+        self.assertEqual(len(first_page), MyOrdersAPIView.DEFAULT_LIMIT)
+        rest = self.get_orders(f'?offset={len(first_page)}')
+        self.assertEqual(len(rest), 5)
+        self.assertFalse({order['id'] for order in first_page} & {order['id'] for order in rest})
+
+    def test_same_timestamp_orders_page_in_id_order(self):
+        Order.objects.update(created_at=timezone.now())
+        with CaptureQueriesContext(connection) as queries:
+            pages = [self.get_orders(f'?limit=10&offset={offset}') for offset in (0, 10, 20)]
+        ids = [order['id'] for page in pages for order in page]
+        self.assertEqual(ids, sorted(Order.objects.values_list('id', flat=True), reverse=True))
+        # SQLite happens to return ties in id order anyway; the tie-break must be in the query
+        history_queries = [query['sql'] for query in queries if 'FROM "home_order"' in query['sql'] and 'LIMIT' in query['sql']]
+        self.assertTrue(history_queries)
+        for sql in history_queries:
+            self.assertRegex(sql, r'ORDER BY \S+ DESC, \S+ DESC')
+
+    def test_history_keeps_the_placed_names_and_prices(self):
+        category = Category.objects.create(name='Snapshot')
+        product = Product.objects.create(name='Original name', price=Decimal('5.00'), stock=3, category=category)
+        CartItem.objects.create(user=self.user, product=product, price=product.price, quantity=2)
+        with transaction.atomic():
+            order = place_order(self.user)
+        before = next(row for row in self.get_orders() if row['id'] == order.id)
+        self.assertEqual(before['items'], [{'product': {'name': 'Original name'}, 'quantity': 2, 'price': '5.00'}])
+        self.assertEqual(before['total_amount'], '10.00')
+
+        product.name = 'Renamed'
+        product.price = Decimal('7.00')
+        product.save()
+        OrderItem.objects.filter(order=order).update(price=Decimal('7.00'))
+        after = next(row for row in self.get_orders() if row['id'] == order.id)
+        self.assertEqual(after, before)
+
+
+@override_settings(DATABASE_REPLICAS=['replica_1', 'replica_2'])
+class ReplicaRoutingTests(SimpleTestCase):
+    """Reads go to healthy replicas only when allowed; writers stay pinned to the primary"""
+
+    def setUp(self):
+        ReplicaHealth._status = {}
+        self.addCleanup(setattr, ReplicaHealth, '_status', {})
+        patcher = mock.patch.object(ReplicaHealth, '_probe', return_value=True)
+        self.probe = patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def test_reads_use_replicas_only_when_allowed(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), 'default')
+        with use_replicas():
+            self.assertEqual([router.db_for_read(Product) for _ in range(4)],
+                             ['replica_1', 'replica_2', 'replica_1', 'replica_2'])
+            self.assertEqual(router.db_for_write(Product), 'default')
+
+    def test_unhealthy_replicas_fall_back(self):
+        self.probe.side_effect = lambda alias: alias == 'replica_2'
+        router = ReplicaRouter()
+        with use_replicas():
+            self.assertEqual({router.db_for_read(Product) for _ in range(4)}, {'replica_2'})
+            self.probe.side_effect = None
+            self.probe.return_value = False
+            ReplicaHealth._status = {}
+            self.assertEqual(router.db_for_read(Product), 'default')
+
+    def test_health_is_probed_once_per_interval(self):
+        for _ in range(5):
+            self.assertTrue(ReplicaHealth.is_healthy('replica_1'))
+        self.assertEqual(self.probe.call_count, 1)
+        with mock.patch('time.monotonic', return_value=time.monotonic() + ReplicaHealth.CHECK_INTERVAL):
+            ReplicaHealth.is_healthy('replica_1')
+        self.assertEqual(self.probe.call_count, 2)
+
+    def test_probe_in_progress_does_not_block(self):
+        ReplicaHealth._status = {'replica_1': (False, None)}
+        with ReplicaHealth._lock:
+            self.assertFalse(ReplicaHealth.is_healthy('replica_1'))
+        self.probe.assert_not_called()
+
+    def test_writers_are_pinned_to_the_primary(self):
+        seen = []
+        middleware = ReadReplicaMiddleware(lambda request: seen.append(_replica_reads.get()))
+        factory = RequestFactory()
+        writer = {'HTTP_AUTHORIZATION': 'Bearer writer'}
+
+        middleware(factory.get('/products/', **writer))
+        middleware(factory.post('/cart/', **writer))
+        middleware(factory.get('/products/', **writer))
+        middleware(factory.get('/products/', HTTP_AUTHORIZATION='Bearer reader'))
+        self.assertEqual(seen, [True, False, False, True])
+
+        with mock.patch('time.time', return_value=time.time() + ReadReplicaMiddleware.PIN_SECONDS + 1):
+            middleware(factory.get('/products/', **writer))
+        self.assertEqual(seen[-1], True)
+
+
+class WarmCacheTests(TransactionTestCase):
+    """warm_cache reads from worker threads, so its rows must be committed"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Warm')
+        self.products = [
+            Product.objects.create(name=f'Warm product {i}', price=Decimal('2.00'), stock=5, category=self.category)
+            for i in range(3)
+        ]
+        ProductSales.objects.create(product=self.products[2], units_sold=7, revenue=Decimal('14.00'))
+        self.user = CustomUser.objects.create(username='warm', email='warm@example.com')
+        cache.clear()
+
+    def test_warms_the_keys_the_views_read(self):
+        call_command('warm_cache', '--top-products', '1', '--concurrency', '1', stdout=StringIO())
+
+        self.assertIsNotNone(cache.get(CacheManager.get_product_detail_cache_key(self.products[2].id)))
+        self.assertIsNone(cache.get(CacheManager.get_product_detail_cache_key(self.products[0].id)))
+
+        token = RefreshToken.for_user(self.user).access_token
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/products/?category={self.category.id}',
+                                       headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 3)
+        self.assertEqual([query['sql'] for query in queries if 'home_product' in query['sql']], [])
+
+
+class InvalidationBatchTests(TestCase):
+    def test_invalidations_after_an_early_flush_are_not_lost(self):
+        first_key = CacheManager.get_product_detail_cache_key(1)
+        second_key = CacheManager.get_product_detail_cache_key(2)
+        cache.set_many({first_key: 'stale', second_key: 'stale'})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CacheManager.invalidate_product_cache(1, category_id=1)
+        self.assertIsNone(cache.get(first_key))
+
+        # Same outer transaction: the first batch's callback has already run
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            CacheManager.invalidate_product_cache(2, category_id=1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertIsNone(cache.get(second_key))
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    """Buyers racing for the last units never oversell"""
+
+    BUYERS = 8
+
+    def setUp(self):
+        category = Category.objects.create(name='Concurrent')
+        self.product = Product.objects.create(name='Last units', price=Decimal('4.00'), stock=3, category=category)
+        self.users = [
+            CustomUser.objects.create(username=f'buyer{i}', email=f'buyer{i}@example.com') for i in range(self.BUYERS)
+        ]
+        CartItem.objects.bulk_create([
+            CartItem(user=user, product=self.product, price=self.product.price, quantity=1) for user in self.users
+        ])
+
+    def checkout(self, user, start):
+        start.wait()
+        try:
+            with transaction.atomic():
+                place_order(user)
+            return True
+        except CheckoutError:
+            return False
+        finally:
+            connection.close()
+
+    # SQLite's shared in-memory test database locks whole tables instead
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_checkouts_do_not_oversell(self):
+        start = threading.Barrier(self.BUYERS)
+        with ThreadPoolExecutor(max_workers=self.BUYERS) as executor:
+            results = list(executor.map(lambda user: self.checkout(user, start), self.users))
+
+        self.assertEqual(results.count(True), 3)
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 0)
+        self.assertEqual(OrderItem.objects.filter(product=self.product).count(), 3)
+
+    def test_stale_locked_rows_do_not_oversell(self):
+        # Where row locks are a no-op another buyer can take the stock after it was read
+        stale = {self.product.id: Product.objects.get(id=self.product.id)}
+        Product.objects.filter(id=self.product.id).update(stock=0)
+        with mock.patch('home.checkout.lock_products', return_value=stale), \
+                self.assertRaisesMessage(CheckoutError, 'Not enough stock'), transaction.atomic():
+            place_order(self.users[0])
+        self.assertEqual(Product.objects.get(id=self.product.id).stock, 0)
+        self.assertFalse(Order.objects.exists())
+
+
+class LegacyCacheEntryTests(TestCase):
+    """Values cached by code from before the envelope format read as misses, not errors"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Legacy')
+        cls.product = Product.objects.create(name='Legacy product', price=Decimal('1.50'), stock=2, category=category)
+        cls.user = CustomUser.objects.create(username='legacy', email='legacy@example.com')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_plain_serializer_dict_is_a_miss(self):
+        cache_key = CacheManager.get_product_detail_cache_key(self.product.id)
+        cache.set(cache_key, {'id': self.product.id, 'name': 'Old name'})
+        cache.set(CacheManager.get_rendered_cache_key(cache_key), b'{"id": 1}')
+        self.assertIsNone(CacheManager._get(cache_key))
+
+        token = RefreshToken.for_user(self.user).access_token
+        for url in (f'/products/{self.product.id}/', f'/products/batch/?ids={self.product.id}'):
+            response = self.client.get(url, headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('Legacy product', response.content.decode())
+
+
+
+class CacheVersioningTests(TestCase):
+    """A version bump orphans every listing key built from the old version"""
+
+    # Plain ids: saving rows would queue invalidations on the class-wide transaction, which never commits
+    product_id, category_id = 1, 1
+
+    def setUp(self):
+        CacheManager.clear_all_cache()
+
+    def test_product_change_misses_old_listing_keys(self):
+        pages = [({}, [], 1), ({'category': self.category_id}, ['-price', 'id'], 2)]
+        old_keys = [CacheManager.get_products_cache_key(filters, ordering, page) for filters, ordering, page in pages]
+        for filters, ordering, page in pages:
+            CacheManager.set_products(['cached'], filters, ordering, page)
+        CacheManager.set_products_by_category(self.category_id, ['cached'])
+        CacheManager.set_categories(['cached'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CacheManager.invalidate_product_cache(self.product_id, self.category_id)
+
+        for old_key, (filters, ordering, page) in zip(old_keys, pages):
+            self.assertNotEqual(CacheManager.get_products_cache_key(filters, ordering, page), old_key)
+            self.assertIsNone(CacheManager.get_products(filters, ordering, page))
+        self.assertIsNone(CacheManager.get_products_by_category(self.category_id))
+        # Product changes leave the categories list alone
+        self.assertEqual(CacheManager.get_categories(), ['cached'])
+
+    def test_category_change_misses_category_and_product_listings(self):
+        CacheManager.set_products(['cached'])
+        CacheManager.set_categories(['cached'])
+        CacheManager.set_category_detail(self.category_id, {'id': self.category_id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CacheManager.invalidate_category_cache(self.category_id)
+
+        self.assertIsNone(CacheManager.get_products())
+        self.assertIsNone(CacheManager.get_categories())
+        self.assertIsNone(CacheManager.get_category_detail(self.category_id))
+
+
+
+class ProductListingCacheTests(TestCase):
+    """Every page, page size and ordering of the listing is cached under its own key"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Listing')
+        Product.objects.bulk_create([
+            Product(name=f'Listing product {i}', price=Decimal(i), stock=1, category=category) for i in range(12)
+        ])
+        cls.user = CustomUser.objects.create(username='listing', email='listing@example.com')
+
+    def setUp(self):
+        CacheManager.clear_all_cache()
+
+    def get(self, query):
+        token = RefreshToken.for_user(self.user).access_token
+        response = self.client.get(f'/products/{query}', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def names(self, query):
+        return [product['name'] for product in self.get(query)['results']]
+
+    def test_each_page_size_and_ordering_is_cached_separately(self):
+        queries = ['', '?page=2', '?page_size=5', '?page=2&page_size=5', '?ordering=-price']
+        first = {query: self.names(query) for query in queries}
+        self.assertEqual(len({tuple(names) for names in first.values()}), len(queries))
+        self.assertEqual(first['?page=2'], [f'Listing product {i}' for i in range(10, 12)])
+        self.assertEqual(first['?ordering=-price'][0], 'Listing product 11')
+
+        # update() skips invalidation: cached combinations keep serving their own copy
+        Product.objects.update(name='Renamed')
+        for query in queries:
+            self.assertEqual(self.names(query), first[query])
+        self.assertEqual(self.names('?page_size=3'), ['Renamed'] * 3)
+
+    def test_out_of_range_page_is_not_cached(self):
+        payload = self.get('?page=5')
+        self.assertEqual(payload['page'], 1)
+        cache_key = CacheManager.get_products_cache_key(page=5)
+        self.assertIsNone(cache.get(cache_key))
+        self.assertIsNone(cache.get(CacheManager.get_rendered_cache_key(cache_key)))
+
+
+class SingleFlightTests(SimpleTestCase):
+    """get_or_compute recomputes in one caller and serves stale entries meanwhile"""
+
+    cache_key = 'product_detail_single_flight'
+
+    def setUp(self):
+        CacheManager.clear_all_cache()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+
+        def compute():
+            calls.append(threading.get_ident())
+            time.sleep(0.3)
+            return {'id': 1}
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: CacheManager.get_or_compute(self.cache_key, compute), range(8)))
+        self.assertEqual(results, [{'id': 1}] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_stale_entry_is_served_while_another_caller_recomputes(self):
+        def fail():
+            raise AssertionError("recomputed while the lock was held")
+
+        CacheManager._set(self.cache_key, 'old', soft_timeout=0)
+        cache.add(f'{self.cache_key}_lock', 'other worker', CacheManager.LOCK_TIMEOUT)
+        self.assertEqual(CacheManager.get_or_compute(self.cache_key, fail), 'old')
+
+        cache.delete(f'{self.cache_key}_lock')
+        self.assertEqual(CacheManager.get_or_compute(self.cache_key, lambda: 'new'), 'new')
+        self.assertEqual(CacheManager.get_or_compute(self.cache_key, fail), 'new')
+
+
+@skipUnless(fakeredis, 'L1 invalidation tests need fakeredis for pub/sub')
+@override_settings(CACHE_L1_ENABLED=True)
+class LocalCacheInvalidationTests(SimpleTestCase):
+    """L1 invalidations are published to, and applied by, every worker"""
+
+    def setUp(self):
+        self.server = fakeredis.FakeServer()
+        connection = mock.patch('django_redis.get_redis_connection', lambda alias='default': self.redis())
+        connection.start()
+        self.addCleanup(connection.stop)
+        for name, value in (('_local_cache', None), ('_pubsub_enabled', False)):
+            patcher = mock.patch.object(CacheManager, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.channel = CacheManager._invalidation_channel()
+        self.local_cache = CacheManager._get_local_cache()
+        # The listener thread subscribes in the background
+        self.wait_for(lambda: self.redis().pubsub_numsub(self.channel)[0][1])
+
+    def redis(self):
+        return fakeredis.FakeRedis(server=self.server)
+
+    def wait_for(self, condition, timeout=2.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, "timed out")
+            time.sleep(0.01)
+
+    def test_invalidation_is_published(self):
+        subscriber = self.redis().pubsub(ignore_subscribe_messages=True)
+        subscriber.subscribe(self.channel)
+        cache_key = CacheManager.get_product_detail_cache_key(1)
+
+        CacheManager.invalidate_product_details([1])
+
+        message = None
+        deadline = time.monotonic() + 2
+        while message is None and time.monotonic() < deadline:
+            message = subscriber.get_message(timeout=0.1)
+        self.assertEqual(json.loads(message['data']), [cache_key, CacheManager.get_rendered_cache_key(cache_key)])
+
+    def test_another_workers_invalidation_evicts_local_entries(self):
+        cache_key = CacheManager.get_product_detail_cache_key(1)
+        other_key = CacheManager.get_product_detail_cache_key(2)
+        self.local_cache.set(cache_key, {'value': 'stale', 'fresh_until': time.time() + 60})
+        self.local_cache.set(other_key, {'value': 'kept', 'fresh_until': time.time() + 60})
+
+        # What another worker's _broadcast_invalidation sends
+        self.redis().publish(self.channel, json.dumps([cache_key]))
+        self.wait_for(lambda: self.local_cache.get(cache_key) is None)
+        self.assertEqual(self.local_cache.get(other_key)['value'], 'kept')
+
+        self.redis().publish(self.channel, json.dumps(None))
+        self.wait_for(lambda: self.local_cache.get(other_key) is None)
+
+
+class RenderedResponseTests(TestCase):
+    """Cached pre-rendered bodies are byte-for-byte what the DRF renderer produces"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(name='Kaffee & Tee')
+        cls.product = Product.objects.create(name='Café crème', price=Decimal('12.50'), stock=3, category=cls.category)
+        cls.user = CustomUser.objects.create(username='rendered', email='rendered@example.com')
+
+    def setUp(self):
+        CacheManager.clear_all_cache()
+
+    def get_content(self, url):
+        token = RefreshToken.for_user(self.user).access_token
+        response = self.client.get(url, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response.content
+
+    def test_bodies_match_the_serializer_output(self):
+        cases = [
+            (f'/products/{self.product.id}/', CacheManager.get_product_detail_cache_key(self.product.id),
+             JSONRenderer().render(ProductSerializer(self.product).data)),
+            ('/categories/', CacheManager.get_categories_cache_key(),
+             JSONRenderer().render(CategorySerializer([self.category], many=True).data)),
+        ]
+        for url, cache_key, body in cases:
+            with self.subTest(url=url):
+                self.assertEqual(self.get_content(url), body)  # miss
+                self.assertIsNotNone(cache.get(CacheManager.get_rendered_cache_key(cache_key)))
+                self.assertEqual(self.get_content(url), body)  # hit
+                with override_settings(CACHE_RENDERED_RESPONSES=False):
+                    self.assertEqual(self.get_content(url), body)
+
+
+class ProductBatchTests(TestCase):
+    """/products/batch/ answers from one cache MGET and fills the misses from the DB"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Batch')
+        cls.cached, cls.uncached = [
+            Product.objects.create(name=f'Batch product {i}', price=Decimal('5.00'), stock=1, category=category)
+            for i in range(2)
+        ]
+        cls.user = CustomUser.objects.create(username='batch', email='batch@example.com')
+
+    def setUp(self):
+        CacheManager.clear_all_cache()
+        CacheManager.set_product_details({self.cached.id: {'id': self.cached.id, 'name': 'From cache'}})
+
+    def get(self, query):
+        token = RefreshToken.for_user(self.user).access_token
+        return self.client.get(f'/products/batch/{query}', headers={'Authorization': f'Bearer {token}'})
+
+    def test_hits_misses_and_unknown_ids(self):
+        unknown = self.uncached.id + 100
+        response = self.get(f'?ids={self.uncached.id},{self.cached.id},{unknown},{self.cached.id}')
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual([item['name'] for item in payload['results']], ['Batch product 1', 'From cache'])
+        self.assertEqual(payload['missing'], [unknown])
+        # The miss was written back for the next batch
+        self.assertEqual(set(CacheManager.get_product_details([self.uncached.id, unknown])), {self.uncached.id})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.get(f'?ids={self.cached.id},{self.uncached.id}').status_code, 200)
+        self.assertEqual([query['sql'] for query in queries if 'home_product' in query['sql']], [])
+
+    def test_sparse_fields(self):
+        payload = self.get(f'?ids={self.uncached.id}&fields=id,name').json()
+        self.assertEqual(payload['results'], [{'id': self.uncached.id, 'name': 'Batch product 1'}])
+        # Full details are cached whatever fields were asked for
+        self.assertIn('price', CacheManager.get_product_detail(self.uncached.id))
+        self.assertEqual(self.get('?ids=1&fields=nope').status_code, 400)
+
+    def test_rejects_bad_and_too_many_ids(self):
+        self.assertEqual(self.get('?ids=1,x').status_code, 400)
+        too_many = ','.join(str(i) for i in range(1, ProductViewSet.MAX_BATCH_SIZE + 2))
+        self.assertEqual(self.get(f'?ids={too_many}').status_code, 400)
+        at_cap = ','.join(str(i) for i in range(1, ProductViewSet.MAX_BATCH_SIZE + 1))
+        self.assertEqual(self.get(f'?ids={at_cap}').status_code, 200)
+
+
+class CacheMetricsTests(TestCase):
+    """Per-family counters and latency histograms, as reported by /cache-stats/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = CustomUser.objects.create(username='metrics-admin', email='metrics@example.com', is_staff=True)
+        cls.user = CustomUser.objects.create(username='metrics', email='metrics-user@example.com')
+
+    def setUp(self):
+        CacheManager.clear_all_cache()
+        CacheMetrics.reset()
+        self.addCleanup(CacheMetrics.reset)
+
+    def get_stats(self, user):
+        token = RefreshToken.for_user(user).access_token
+        return self.client.get('/cache-stats/', headers={'Authorization': f'Bearer {token}'})
+
+    def test_lookups_are_counted_per_family(self):
+        cache_key = CacheManager.get_product_detail_cache_key(1)
+        for _ in range(2):
+            CacheManager.get_or_compute(cache_key, lambda: {'id': 1})
+        CacheManager.get_categories()
+
+        response = self.get_stats(self.admin)
+        self.assertEqual(response.status_code, 200)
+        families = response.json()['families']
+        detail = families['product_detail']
+        self.assertEqual((detail['misses'], detail['hits'] + detail['l1_hits'], detail['sets']), (1, 1, 1))
+        self.assertEqual(detail['hit_rate'], 0.5)
+        self.assertGreater(detail['bytes_written'], 0)
+        # Every lookup that reached the shared cache has a latency sample
+        self.assertEqual(sum(detail['get_latency_ms'].values()), detail['hits'] + detail['misses'])
+        self.assertEqual(sum(detail['set_latency_ms'].values()), 1)
+        self.assertEqual(families['categories_list']['misses'], 1)
+
+    def test_stats_are_admin_only(self):
+        self.assertEqual(self.get_stats(self.user).status_code, 403)
+
+
+class CacheCodecTests(SimpleTestCase):
+    """Compact cache encoding, compression above a threshold and the size cap"""
+
+    rows = [{'id': i, 'name': f'Product {i}', 'price': '9.99', 'category': None} for i in range(50)]
+
+    def test_round_trip(self):
+        for codec, value in (('json', {'count': 50, 'results': self.rows}),
+                             ('pickle', {'price': Decimal('9.99'), 'rows': self.rows}),
+                             ('json', b'{"raw": true}')):
+            with self.subTest(codec=codec, value_type=type(value)):
+                entry = {'value': value, 'fresh_until': 1700000000.5}
+                self.assertEqual(decode_entry(encode_entry(entry, codec, 1024)), entry)
+
+    def test_json_rows_store_field_names_once(self):
+        encoded = encode_entry({'value': self.rows, 'fresh_until': 0}, 'json', None)
+        self.assertEqual(encoded.count(b'"name"'), 1)
+        self.assertEqual(unpack_tables(pack_tables(self.rows)), self.rows)
+
+    def test_compression_threshold(self):
+        entry = {'value': self.rows, 'fresh_until': 0}
+        size = len(encode_entry(entry, 'json', None)) - HEADER.size
+        self.assertEqual(encode_entry(entry, 'json', size + 1)[1:2], UNCOMPRESSED)
+        compressed = encode_entry(entry, 'json', size)
+        self.assertEqual(compressed[1:2], COMPRESSED)
+        self.assertLess(len(compressed), size)
+        # Incompressible payloads are stored as they are
+        noise = {'value': os.urandom(4096), 'fresh_until': 0}
+        self.assertEqual(encode_entry(noise, 'json', 1)[1:2], UNCOMPRESSED)
+
+    @override_settings(CACHE_MAX_VALUE_BYTES=512, CACHE_COMPRESS_MIN_BYTES=None)
+    def test_values_over_the_size_cap_are_not_cached(self):
+        CacheManager.clear_all_cache()
+        CacheMetrics.reset()
+        self.addCleanup(CacheMetrics.reset)
+        CacheManager.set_many({'product_detail_small': {'id': 1}, 'product_detail_large': self.rows})
+        self.assertEqual(CacheManager._get('product_detail_small'), {'id': 1})
+        self.assertIsNone(cache.get('product_detail_large'))
+        self.assertEqual(CacheMetrics.snapshot()['product_detail']['rejected'], 1)
+
+
+class BulkTransitionTests(TestCase):
+    """Order.objects.transition moves valid orders in one UPDATE and reports the rest"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = CustomUser.objects.create(username='alice', email='alice@example.com')
+        cls.bob = CustomUser.objects.create(username='bob', email='bob@example.com')
+        cls.admin = CustomUser.objects.create(username='orders-admin', email='orders-admin@example.com',
+                                              is_staff=True, is_superuser=True)
+        cls.pending, cls.other_pending, cls.delivered, cls.shipped = Order.objects.bulk_create([
+            Order(user=cls.alice, total_amount=Decimal('1.00')),
+            Order(user=cls.alice, total_amount=Decimal('2.00')),
+            Order(user=cls.alice, total_amount=Decimal('3.00'), status='delivered'),
+            Order(user=cls.bob, total_amount=Decimal('4.00'), status='shipped'),
+        ])
+
+    def statuses(self):
+        return dict(Order.objects.values_list('id', 'status'))
+
+    def test_mixed_transitions_and_grouped_notifications(self):
+        with mock.patch('home.models.notify_user') as notify, self.captureOnCommitCallbacks(execute=True):
+            rejected = Order.objects.all().transition('shipped')
+
+        # Delivered can't go back; already-shipped orders are skipped, not rejected
+        self.assertEqual(rejected, [self.delivered.id])
+        self.assertEqual(self.statuses(), {
+            self.pending.id: 'shipped', self.other_pending.id: 'shipped',
+            self.delivered.id: 'delivered', self.shipped.id: 'shipped',
+        })
+        notify.assert_called_once_with(
+            self.alice.id, f"Your orders #{self.pending.id}, #{self.other_pending.id} are now Shipped."
+        )
+
+        with mock.patch('home.models.notify_user') as notify, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(Order.objects.all().transition('delivered'), [])
+        self.assertEqual(set(self.statuses().values()), {'delivered'})
+        self.assertEqual(sorted(call.args for call in notify.call_args_list), sorted([
+            (self.alice.id, f"Your orders #{self.pending.id}, #{self.other_pending.id} are now Delivered."),
+            (self.bob.id, f"Your order #{self.shipped.id} status changed from Shipped to Delivered."),
+        ]))
+
+    def test_admin_action_reports_each_rejected_order(self):
+        self.client.force_login(self.admin)
+        response = self.client.post('/admin/home/order/', {
+            'action': 'mark_as_shipped',
+            '_selected_action': [self.pending.id, self.delivered.id, self.shipped.id],
+        }, follow=True)
+        messages = [str(message) for message in response.context['messages']]
+        self.assertEqual(messages, [
+            '2 order(s) marked as shipped.',
+            f'1 order(s) cannot move to shipped: {self.delivered.id}.',
+        ])
+        self.assertEqual(self.statuses()[self.pending.id], 'shipped')
+
+
+class ProductSearchTests(TestCase):
+    """Ranked search over names and descriptions, through the InvertedIndex fallback here"""
+
+    @classmethod
+    def setUpTestData(cls):
+        # bulk_create: saved rows would queue invalidations on the class-wide transaction
+        category, = Category.objects.bulk_create([Category(name='Kitchen')])
+        cls.described, cls.named = Product.objects.bulk_create([
+            Product(name='Teapot', description='Heats like a kettle', price=Decimal('9.00'), stock=5,
+                    category=category),
+            Product(name='Steel kettle', price=Decimal('19.00'), stock=5, category=category),
+        ])
+        Product.objects.bulk_create([
+            Product(name=f'Mug {i}', description='Goes with the teapot', price=Decimal('3.00'), stock=5,
+                    category=category)
+            for i in range(12)
+        ])
+        cls.user = CustomUser.objects.create(username='search', email='search@example.com')
+
+    def setUp(self):
+        CacheManager.clear_all_cache()
+        # Rows from other test classes may have been indexed under the same version
+        patcher = mock.patch.object(InvertedIndex, '_version', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def search(self, query):
+        token = RefreshToken.for_user(self.user).access_token
+        response = self.client.get('/products/search/', {'q': query}, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual([item['name'] for item in self.search('kettles')['results']], ['Steel kettle', 'Teapot'])
+
+    def test_count_and_pages(self):
+        payload = self.search('mug')
+        self.assertEqual((payload['count'], len(payload['results']), payload['next']), (12, 10, True))
+        token = RefreshToken.for_user(self.user).access_token
+        last = self.client.get('/products/search/', {'q': 'mug', 'page': 3, 'page_size': 5},
+                               headers={'Authorization': f'Bearer {token}'}).json()
+        self.assertEqual((last['count'], last['page'], len(last['results'])), (12, 3, 2))
+        self.assertEqual((last['next'], last['previous']), (False, True))
+
+    def test_query_is_capped(self):
+        # The term past MAX_QUERY_LENGTH is dropped, so it can't empty the results
+        query = 'kettle' + ' ' * MAX_QUERY_LENGTH + 'nowhere'
+        self.assertEqual(self.search(query)['count'], 2)
+
+    def test_fallback_is_used_off_postgres(self):
+        self.assertNotEqual(connection.vendor, 'postgresql')
+        self.assertEqual(ranked_product_ids('kettle'), [self.named.id, self.described.id])
+        with mock.patch.object(connections['default'], 'vendor', 'postgresql'):
+            self.assertIsInstance(ranked_product_ids('kettle'), PostgresRankedIds)
+
+    def test_index_is_rebuilt_for_content_changes_only(self):
+        with mock.patch.object(InvertedIndex, '_build', wraps=InvertedIndex._build) as build:
+            self.search('kettle')
+            with self.captureOnCommitCallbacks(execute=True):
+                decrement_stock({self.named.id: 1}, lock_products([self.named.id]))
+            self.assertEqual(self.search('kettle')['results'][0]['stock'], 4)
+            self.assertEqual(build.call_count, 1)
+
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.get(id=self.described.id).save()
+            self.search('kettle')
+            self.assertEqual(build.call_count, 2)
+
+
+class ProductUpsertTests(TestCase):
+    """upsert_products and /products/bulk/: one-pass validation with a per-row report"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tools, cls.garden = Category.objects.bulk_create([Category(name='Tools'), Category(name='Garden')])
+        cls.hammer, cls.spade = Product.objects.bulk_create([
+            Product(name='Hammer', description='Claw', price=Decimal('10.00'), stock=1, category=cls.tools),
+            Product(name='Spade', price=Decimal('20.00'), stock=2, category=cls.garden),
+        ])
+        cls.admin = CustomUser.objects.create(username='catalog-admin', email='catalog@example.com', is_staff=True)
+
+    def row(self, name, **values):
+        return dict({'name': name, 'price': '1.00', 'stock': 1, 'category_name': 'tools'}, **values)
+
+    def test_updates_are_written_by_the_values_update(self):
+        report = upsert_products([
+            self.row('Claw hammer', id=self.hammer.id, price='12.34', description='Steel', category_name='Garden'),
+            self.row('Spade', id=self.spade.id, price='0.99', description=''),
+            self.row('Rake', stock=7),
+        ])
+        self.assertEqual(report['errors'], [])
+        self.assertEqual([row['id'] for row in report['updated']], [self.hammer.id, self.spade.id])
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('name', 'description', 'price', 'stock', 'category_id')),
+            [('Claw hammer', 'Steel', Decimal('12.34'), 1, self.garden.id),
+             ('Spade', '', Decimal('0.99'), 1, self.tools.id),
+             ('Rake', '', Decimal('1.00'), 7, self.tools.id)],
+        )
+
+    def test_conflicting_rows_are_reported_per_row(self):
+        report = upsert_products([
+            self.row('Saw'),
+            self.row('saw'),
+            self.row('Hammer'),
+            self.row('Mallet', id=self.hammer.id),
+            self.row('Big mallet', id=self.hammer.id),
+            self.row('Ghost', id=self.spade.id + 100),
+            self.row('Shears', category_name='Nowhere'),
+        ])
+        self.assertEqual(report['created'], [{'index': 0, 'id': report['created'][0]['id']}])
+        self.assertEqual(report['updated'], [{'index': 3, 'id': self.hammer.id}])
+        self.assertEqual(report['errors'], [
+            {'index': 1, 'errors': {'name': ["Duplicate product name in this request."]}},
+            {'index': 2, 'errors': {'name': ["Product with this name already exists."]}},
+            {'index': 4, 'errors': {'id': ["Duplicate product id in this request."]}},
+            {'index': 5, 'errors': {'id': ["Product does not exist."]}},
+            {'index': 6, 'errors': {'category_name': ["Category with this name does not exist."]}},
+        ])
+        self.assertEqual(Product.objects.get(id=self.hammer.id).name, 'Mallet')
+
+    def test_endpoint_fails_when_nothing_is_applied(self):
+        token = RefreshToken.for_user(self.admin).access_token
+
+        def post(rows):
+            return self.client.post('/products/bulk/', rows, content_type='application/json',
+                                    headers={'Authorization': f'Bearer {token}'})
+
+        response = post([self.row('Hammer'), self.row('Bad price', price='-1')])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [0, 1])
+        response = post([self.row('Hammer'), self.row('Chisel')])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['created']), 1)
+
+
+class ImportCatalogTests(TransactionTestCase):
+    """import_catalog commits chunk by chunk, so its checkpoints and cache flush run for real"""
+
+    rows = [
+        {'name': f'Imported {i}', 'description': 'From file', 'price': f'{i}.50', 'stock': i, 'category': 'Imports'}
+        for i in range(4)
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        CacheManager.clear_all_cache()
+
+    def write(self, name, rows):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            if name.endswith('.jsonl'):
+                f.writelines(json.dumps(row) + '\n' for row in rows)
+            else:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+                writer.writeheader()
+                writer.writerows(rows)
+        return path
+
+    def import_catalog(self, path, *args):
+        call_command('import_catalog', path, '--chunk-size', '2', *args, stdout=StringIO(), stderr=StringIO())
+
+    def imported(self):
+        return list(Product.objects.order_by('name').values_list('name', 'price', 'stock', 'category__name'))
+
+    def test_csv_and_jsonl(self):
+        expected = [(f'Imported {i}', Decimal(f'{i}.50'), i, 'Imports') for i in range(4)]
+        for name in ('catalog.csv', 'catalog.jsonl'):
+            with self.subTest(name=name):
+                Product.objects.all().delete()
+                path = self.write(name, self.rows)
+                self.import_catalog(path)
+                self.assertEqual(self.imported(), expected)
+                self.assertFalse(os.path.exists(f'{path}.checkpoint'))
+
+        # Rows without an id update the product of the same name
+        self.import_catalog(self.write('update.jsonl', [dict(self.rows[0], stock=40)]))
+        self.assertEqual(Product.objects.get(name='Imported 0').stock, 40)
+        self.assertEqual(Product.objects.count(), 4)
+
+    def test_resume_skips_committed_rows(self):
+        path = self.write('catalog.csv', self.rows)
+        with open(f'{path}.checkpoint', 'w') as f:
+            json.dump({'path': path, 'size': os.path.getsize(path), 'rows': 2}, f)
+        self.import_catalog(path, '--resume')
+        self.assertEqual([name for name, *_ in self.imported()], ['Imported 2', 'Imported 3'])
+
+    def test_resume_refuses_a_changed_file(self):
+        path = self.write('catalog.csv', self.rows)
+        with open(f'{path}.checkpoint', 'w') as f:
+            json.dump({'path': path, 'size': os.path.getsize(path) - 1, 'rows': 2}, f)
+        with self.assertRaisesMessage(CommandError, 'changed since the checkpoint was written'):
+            self.import_catalog(path, '--resume')
+        self.assertEqual(Product.objects.count(), 0)
+
+    def test_list_caches_are_invalidated_once_at_the_end(self):
+        with mock.patch.object(CacheManager, 'bump_versions', wraps=CacheManager.bump_versions) as bump_versions:
+            self.import_catalog(self.write('catalog.jsonl', self.rows))
+        bump_versions.assert_called_once()
+        self.assertIn(CacheManager.PRODUCTS_VERSION_KEY, bump_versions.call_args.args[0])
+
+
+class ValuesSerializerTests(TestCase):
+    """The values() fast path gives exactly what the serializers give"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create(username='values', email='values@example.com')
+        category, = Category.objects.bulk_create([Category(name='Values', description='')])
+        cls.products = Product.objects.bulk_create([
+            Product(name='Plain', price=Decimal('0.10'), stock=0, category=category),
+            Product(name='Ünïcode', description='Long ' * 20, price=Decimal('99999999.99'), stock=5,
+                    category=category),
+        ])
+        # bulk_create skips CartItem.save, leaving total_price NULL
+        CartItem.objects.bulk_create([
+            CartItem(user=cls.user, product=cls.products[0], price=Decimal('0.10'), quantity=3),
+            CartItem(user=cls.user, product=cls.products[1], price=Decimal('2.50'), quantity=1,
+                     total_price=Decimal('2.50')),
+        ])
+        order = Order.objects.create(user=cls.user, total_amount=Decimal('1.00'))
+        OrderRequest.objects.create(user=cls.user, cart_items=[], order=order, processed_at=timezone.now())
+        OrderRequest.objects.create(user=cls.user, cart_items=[])
+
+    def assertSameOutput(self, serializer_class, queryset, fields=None):
+        values_serializer = ValuesSerializer.compile(serializer_class, fields)
+        self.assertIsNotNone(values_serializer)
+        self.assertEqual(values_serializer.serialize(values_serializer.values(queryset)),
+                         serializer_class(queryset, many=True, fields=fields).data)
+
+    def test_matches_the_model_serializers(self):
+        products = Product.objects.select_related('category').order_by('id')
+        self.assertSameOutput(ProductSerializer, products)
+        self.assertSameOutput(ProductSerializer, products, ['price', 'category'])
+        self.assertSameOutput(CategorySerializer, Category.objects.order_by('id'))
+        self.assertSameOutput(CartItemSerializer, CartItem.objects.select_related('product').order_by('id'))
+
+    def test_datetimes_nulls_and_nullable_relations(self):
+        class OrderRequestSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+            order_total = serializers.DecimalField(source='order.total_amount', max_digits=10, decimal_places=2,
+                                                   read_only=True)
+
+            class Meta:
+                model = OrderRequest
+                fields = ['id', 'user', 'order', 'error', 'created_at', 'processed_at', 'order_total']
+
+        requests = OrderRequest.objects.select_related('order').order_by('id')
+        self.assertSameOutput(OrderRequestSerializer, requests, ['id', 'user', 'order', 'error', 'created_at',
+                                                                 'processed_at'])
+        # DRF drops order_total for a request without an order; values() can't, so no fast path
+        self.assertIsNone(ValuesSerializer.compile(OrderRequestSerializer))
+
+    def test_unknown_fields_are_rejected(self):
+        token = RefreshToken.for_user(self.user).access_token
+        for url in ('/products/?fields=id,nope', '/categories/?fields=nope', '/cart/?fields=category_name'):
+            with self.subTest(url=url):
+                response = self.client.get(url, headers={'Authorization': f'Bearer {token}'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('fields', response.json())
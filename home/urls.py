@@ -24,12 +24,18 @@ urlpatterns = [
     path('profile/', ProfileView.as_view(), name='profile'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('place-order/', PlaceOrderView.as_view(), name='place-order'),
+    path('place-order/async/', QueueOrderView.as_view(), name='place-order-async'),
+    path('order-requests/<int:pk>/', OrderRequestStatusView.as_view(), name='order-request-status'),
   # Your urls.py
     path('user-profile/', UserProfileView.as_view(), name='user-profile'), 
     path('profile-page/', TemplateView.as_view(template_name='profile.html'), name='profile-page'),  # HTML page
 
     path("cart-page/", TemplateView.as_view(template_name="cart-page.html")),
     path('my-orders/', MyOrdersAPIView.as_view(), name='my-orders-api'),  # 👈 API (returns JSON)
+    path('cache-stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('analytics/', AnalyticsView.as_view(), name='analytics'),
+    path('export/products/', ProductExportView.as_view(), name='export-products'),
+    path('export/orders/', OrderExportView.as_view(), name='export-orders'),
     path('my-orders-page/', TemplateView.as_view(template_name='my-orders-page.html'), name='my-orders-page'),  # 👈 HTML Page
 
     path('', include(router.urls)),
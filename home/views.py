@@ -17,8 +17,21 @@ from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.viewsets import ModelViewSet
 from .cache_utils import CacheManager
+from .checkout import place_order, enqueue_order, CheckoutError
+from .search import search_products_page, MAX_QUERY_LENGTH
+from .catalog import upsert_products
+from .exports import (
+    export_products, export_orders, order_item_rows, ndjson_lines, csv_lines, async_lines,
+    PRODUCT_COLUMNS, ORDER_COLUMNS, ITEM_COLUMNS,
+)
 from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 
 
 class RegisterView(APIView):
@@ -127,48 +140,111 @@ class IsAdminOrReadOnly(BasePermission):
             return True
         return request.user and request.user.is_staff
 
-class CategoryViewSet(ModelViewSet):
+class CachedResponseMixin:
+    """Serve cached read endpoints, optionally as pre-rendered JSON bytes"""
+
+    def can_serve_rendered(self):
+        # Browsable API and other formats still go through the DRF renderer
+        renderer = getattr(self.request, 'accepted_renderer', None)
+        return getattr(settings, 'CACHE_RENDERED_RESPONSES', False) and isinstance(renderer, JSONRenderer)
+
+    def cached_response(self, cache_key, compute, cacheable=None):
+        """Get or compute a payload through CacheManager and wrap it in a response
+
+        In rendered mode the final UTF-8 JSON body is what gets cached, so a
+        hit costs a cache GET and a socket write with no unpickling of
+        serializer data and no re-rendering.
+        """
+        if not self.can_serve_rendered():
+            return Response(CacheManager.get_or_compute(cache_key, compute, cacheable=cacheable))
+
+        computed = {}
+
+        def compute_rendered():
+            computed['data'] = compute()
+            return JSONRenderer().render(computed['data'])
+
+        body = CacheManager.get_or_compute(
+            CacheManager.get_rendered_cache_key(cache_key), compute_rendered,
+            cacheable=(lambda body: cacheable(computed['data'])) if cacheable else None,
+        )
+        return HttpResponse(body, content_type='application/json')
+
+
+class SparseFieldsetMixin:
+    """``?fields=id,name`` on reads: only those fields are serialized
+
+    List requests also take the values() fast path (ValuesSerializer) when
+    the serializer's fields allow it. Detail payloads are cached in full and
+    trimmed on the way out, since their cache keys are deleted, not versioned.
+    """
+
+    def get_requested_fields(self):
+        """Requested field names in serializer order, or None for all of them"""
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = self.parse_requested_fields()
+        return self._requested_fields
+
+    def parse_requested_fields(self):
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        requested = {name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()}
+        if not requested:
+            return None
+        readable = [name for name, field in self.get_serializer_class()().fields.items() if not field.write_only]
+        unknown = requested.difference(readable)
+        if unknown:
+            raise ValidationError({'fields': [f"Unknown fields: {', '.join(sorted(unknown))}"]})
+        return [name for name in readable if name in requested]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def get_values_serializer(self):
+        return ValuesSerializer.compile(self.get_serializer_class(), self.get_requested_fields())
+
+    def trim_fields(self, data):
+        fields = self.get_requested_fields()
+        return data if fields is None else {name: data[name] for name in fields}
+
+    def cached_detail_response(self, cache_key, compute):
+        """Cached full representation, trimmed to ?fields= when given"""
+        if self.get_requested_fields() is None:
+            return self.cached_response(cache_key, compute)
+        return Response(self.trim_fields(CacheManager.get_or_compute(cache_key, compute)))
+
+
+class CategoryViewSet(SparseFieldsetMixin, CachedResponseMixin, ModelViewSet):
     queryset = Category.objects.all().order_by('id')
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated, IsAdminOrReadOnly]
 
     def list(self, request, *args, **kwargs):
         """Get categories with caching"""
-        # Try to get from cache first
-        cached_categories = CacheManager.get_categories()
-        if cached_categories:
-            print("Serving categories from cache")
-            return Response(cached_categories)
-        
-        # If not in cache, get from database
-        categories = self.get_queryset()
-        serializer = self.get_serializer(categories, many=True)
-        data = serializer.data
-        
-        # Cache the result
-        CacheManager.set_categories(data)
-        
-        return Response(data)
+        fields = self.get_requested_fields()
+
+        def compute():
+            categories = self.get_queryset()
+            values_serializer = self.get_values_serializer()
+            if values_serializer is not None:
+                return values_serializer.serialize(values_serializer.values(categories))
+            serializer = self.get_serializer(categories, many=True)
+            return serializer.data
+
+        return self.cached_response(CacheManager.get_categories_cache_key(fields), compute)
 
     def retrieve(self, request, *args, **kwargs):
         """Get single category with caching"""
         category_id = kwargs.get('pk')
-        
-        # Try to get from cache first
-        cached_category = CacheManager.get_category_detail(category_id)
-        if cached_category:
-            print(f"Serving category {category_id} from cache")
-            return Response(cached_category)
-        
-        # If not in cache, get from database
-        category = self.get_object()
-        serializer = self.get_serializer(category)
-        data = serializer.data
-        
-        # Cache the result
-        CacheManager.set_category_detail(category_id, data)
-        
-        return Response(data)
+
+        def compute():
+            category = self.get_object()
+            serializer = self.get_serializer(category, fields=None)
+            return serializer.data
+
+        return self.cached_detail_response(CacheManager.get_category_detail_cache_key(category_id), compute)
 
 class ReadOnlyOrAdmin(BasePermission):
     def has_permission(self, request, view):
@@ -180,12 +256,49 @@ class ReadOnlyOrAdmin(BasePermission):
 
 
 
-class ProductViewSet(ModelViewSet):
+def build_products_page(queryset, page_number, page_size, get_serializer=ProductSerializer, fields=None):
+    """Paginate a product queryset into the payload cached for the listing
+
+    Rows are read with values() through ValuesSerializer when ProductSerializer
+    allows it, and go through ``get_serializer`` otherwise.
+    """
+    values_serializer = ValuesSerializer.compile(ProductSerializer, fields)
+    if values_serializer is not None:
+        queryset = values_serializer.values(queryset)
+    paginator = Paginator(queryset, page_size)
+
+    try:
+        products_page = paginator.page(page_number)
+    except:
+        products_page = paginator.page(1)
+
+    if values_serializer is not None:
+        results = values_serializer.serialize(products_page.object_list)
+    else:
+        results = get_serializer(products_page.object_list, many=True).data
+
+    # Prepare response data
+    return {
+        'count': paginator.count,
+        'next': products_page.has_next(),
+        'previous': products_page.has_previous(),
+        'page': products_page.number,
+        'results': results
+    }
+
+
+class ProductViewSet(SparseFieldsetMixin, CachedResponseMixin, ModelViewSet):
     serializer_class = ProductSerializer
     permission_classes = [ReadOnlyOrAdmin, IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['category', 'price']  # category ID and price filter
 
+    # Query params that narrow the product listing, in cache-key order
+    CACHE_FILTER_PARAMS = ['category', 'min_price', 'max_price', 'price']
+    MAX_PAGE_SIZE = 100
+    MAX_BATCH_SIZE = 100
+    MAX_BULK_SIZE = 5000
+
     def get_queryset(self):
         queryset = Product.objects.select_related('category').order_by('id')
 
@@ -203,75 +316,250 @@ class ProductViewSet(ModelViewSet):
 
         return queryset
 
+    def get_cache_filters(self):
+        """Normalized filter set used for the listing cache key"""
+        cache_filters = {}
+        for param in self.CACHE_FILTER_PARAMS:
+            value = (self.request.query_params.get(param) or '').strip()
+            if value:
+                cache_filters[param] = value
+        return cache_filters
+
+    def get_page_size(self):
+        page_size = self.request.query_params.get('page_size')
+        try:
+            page_size = int(page_size)
+        except (TypeError, ValueError):
+            return CacheManager.PRODUCTS_PAGE_SIZE
+        return max(1, min(page_size, self.MAX_PAGE_SIZE))
+
+    def get_page_number(self):
+        try:
+            return max(1, int(self.request.query_params.get('page', 1)))
+        except (TypeError, ValueError):
+            return 1
+
     def list(self, request, *args, **kwargs):
         """Get products with caching"""
-        # Build filters for cache key
-        filters = {}
-        if request.query_params.get('category'):
-            filters['category'] = request.query_params.get('category')
-        if request.query_params.get('min_price'):
-            filters['min_price'] = request.query_params.get('min_price')
-        if request.query_params.get('max_price'):
-            filters['max_price'] = request.query_params.get('max_price')
-        
-        # Try to get from cache first
-        cached_products = CacheManager.get_products(filters)
-        if cached_products:
-            print("Serving products from cache")
-            return Response(cached_products)
-        
-        # If not in cache, get from database
-        queryset = self.get_queryset()
-        
-        # Handle pagination
-        page = request.query_params.get('page', 1)
-        page_size = 10
-        paginator = Paginator(queryset, page_size)
-        
-        try:
-            products_page = paginator.page(page)
-        except:
-            products_page = paginator.page(1)
-        
-        serializer = self.get_serializer(products_page.object_list, many=True)
-        
-        # Prepare response data
-        data = {
-            'count': paginator.count,
-            'next': products_page.has_next(),
-            'previous': products_page.has_previous(),
-            'results': serializer.data
-        }
-        
-        # Cache the result (only for first page to avoid cache bloat)
-        if page == 1 or not page:
-            CacheManager.set_products(data, filters)
-        
-        return Response(data)
+        cache_filters = self.get_cache_filters()
+        ordering = filters.OrderingFilter().get_ordering(request, self.get_queryset(), self) or []
+        ordering = list(ordering)
+        # Tie-break on id so pages stay stable under non-unique orderings
+        if ordering and 'id' not in ordering and '-id' not in ordering:
+            ordering.append('id')
+        page_number = self.get_page_number()
+        page_size = self.get_page_size()
+        fields = self.get_requested_fields()
+
+        def compute():
+            # Apply DjangoFilterBackend/OrderingFilter, then our stable ordering
+            queryset = self.filter_queryset(self.get_queryset())
+            if ordering:
+                queryset = queryset.order_by(*ordering)
+
+            return build_products_page(queryset, page_number, page_size, self.get_serializer, fields)
+
+        if page_number > CacheManager.PRODUCTS_MAX_CACHED_PAGES:
+            return Response(compute())
+
+        cache_key = CacheManager.get_products_cache_key(cache_filters, ordering, page_number, page_size, fields)
+        # Don't cache an out-of-range page that fell back to page 1
+        return self.cached_response(cache_key, compute, cacheable=lambda data: data['page'] == page_number)
 
     def retrieve(self, request, *args, **kwargs):
         """Get single product with caching"""
         product_id = kwargs.get('pk')
-        
-        # Try to get from cache first
-        cached_product = CacheManager.get_product_detail(product_id)
-        if cached_product:
-            print(f"Serving product {product_id} from cache")
-            return Response(cached_product)
-        
-        # If not in cache, get from database
-        product = self.get_object()
-        serializer = self.get_serializer(product)
-        data = serializer.data
-        
-        # Cache the result
-        CacheManager.set_product_detail(product_id, data)
-        
-        return Response(data)
+
+        def compute():
+            product = self.get_object()
+            serializer = self.get_serializer(product, fields=None)
+            return serializer.data
+
+        return self.cached_detail_response(CacheManager.get_product_detail_cache_key(product_id), compute)
+
+    @action(detail=False, methods=['get'], url_path='batch')
+    def batch(self, request):
+        """Get many products at once: one cache MGET plus one query for the misses"""
+        try:
+            product_ids = [int(i) for i in request.query_params.get('ids', '').split(',') if i.strip()]
+        except ValueError:
+            return Response({"detail": "ids must be a comma-separated list of integers"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        product_ids = list(dict.fromkeys(product_ids))
+        if len(product_ids) > self.MAX_BATCH_SIZE:
+            return Response({"detail": f"At most {self.MAX_BATCH_SIZE} ids per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        products = CacheManager.get_product_details(product_ids)
+        missing_ids = [product_id for product_id in product_ids if product_id not in products]
+        if missing_ids:
+            queryset = Product.objects.select_related('category').filter(id__in=missing_ids)
+            fetched = {item['id']: item for item in self.get_serializer(queryset, many=True, fields=None).data}
+            if fetched:
+                CacheManager.set_product_details(fetched)
+            products.update(fetched)
+
+        return Response({
+            'results': [self.trim_fields(products[product_id]) for product_id in product_ids if product_id in products],
+            'missing': [product_id for product_id in product_ids if product_id not in products],
+        })
+
+    @action(detail=False, methods=['get'], url_path='search')
+    def search(self, request):
+        """Full-text search over product names and descriptions, best match first"""
+        query = (request.query_params.get('q') or '').strip()[:MAX_QUERY_LENGTH]
+        if not query:
+            return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+        page_number = self.get_page_number()
+        page_size = self.get_page_size()
+
+        def compute():
+            return search_products_page(query, page_number, page_size, self.get_serializer)
+
+        if page_number > CacheManager.PRODUCTS_MAX_CACHED_PAGES:
+            return Response(compute())
+
+        cache_key = CacheManager.get_product_search_cache_key(query, page_number, page_size,
+                                                              self.get_requested_fields())
+        return self.cached_response(cache_key, compute, cacheable=lambda data: data['page'] == page_number)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """Create/update many products in one request with a per-row error report
+
+        Body: a list of products, or {"products": [...], "match_by_name": bool,
+        "create_categories": bool}. Rows with an id update that product.
+        Valid rows are applied even when others fail.
+        """
+        data = request.data
+        options = data if isinstance(data, dict) else {}
+        rows = data.get('products') if isinstance(data, dict) else data
+        if not isinstance(rows, list) or not rows:
+            return Response({"detail": "Expected a non-empty list of products"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.MAX_BULK_SIZE:
+            return Response({"detail": f"At most {self.MAX_BULK_SIZE} products per request"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        report = upsert_products(
+            rows,
+            match_by_name=bool(options.get('match_by_name')),
+            create_categories=bool(options.get('create_categories')),
+        )
+        applied = report['created'] or report['updated']
+        return Response(report, status=status.HTTP_200_OK if applied else status.HTTP_400_BAD_REQUEST)
     
 
 
-class CartItemViewSet(ModelViewSet):
+class CacheStatsView(APIView):
+    """Cache hit/miss/latency metrics per key family, summed over all workers"""
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return Response(CacheManager.get_cache_stats())
+
+
+class ExportView(APIView):
+    """Base for admin dumps streamed as NDJSON (default) or CSV with ?output=csv
+
+    Rows come from a chunked cursor and are written out as they are read,
+    so memory stays flat whatever the table size.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    export_name = None
+
+    def get_rows(self, request, output):
+        """Return (row iterator, CSV columns)"""
+        raise NotImplementedError
+
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in ('ndjson', 'csv'):
+            return Response({"detail": "output must be ndjson or csv"}, status=status.HTTP_400_BAD_REQUEST)
+        rows, columns = self.get_rows(request, output)
+        lines = csv_lines(rows, columns) if output == 'csv' else ndjson_lines(rows)
+        # Under ASGI (daphne) the response must be async or it is built in memory first
+        if isinstance(request._request, ASGIRequest):
+            lines = async_lines(lines)
+        response = StreamingHttpResponse(
+            lines, content_type='text/csv' if output == 'csv' else 'application/x-ndjson')
+        filename = f"{self.export_name}-{timezone.now():%Y%m%d-%H%M%S}.{output}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class ProductExportView(ExportView):
+    """All products, optionally narrowed with ?category=<id>"""
+    export_name = 'products'
+
+    def get_rows(self, request, output):
+        category_id = request.query_params.get('category')
+        return export_products(category_id if category_id and category_id.isdigit() else None), PRODUCT_COLUMNS
+
+
+class OrderExportView(ExportView):
+    """All orders with their items; ?status= filters, ?archived=1 exports the archive instead
+
+    NDJSON nests the items in each order; CSV has one row per item.
+    """
+    export_name = 'orders'
+
+    def get_rows(self, request, output):
+        archived = request.query_params.get('archived') in ('1', 'true')
+        orders = export_orders(request.query_params.get('status'), archived=archived)
+        if output == 'csv':
+            return order_item_rows(orders), ORDER_COLUMNS + ITEM_COLUMNS
+        return orders, None
+
+
+class AnalyticsView(APIView):
+    """Sales dashboard figures read from the rollup tables, never from orders
+
+    ?days= sets the daily revenue window (default 30), ?limit= the size of
+    the top products/customers lists (default 10) and ?user= adds one
+    user's summary. The figures trail orders by up to one
+    `manage.py fold_rollups --loop` interval; reads never fold deltas
+    themselves.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+    MAX_DAYS = 366
+    MAX_LIMIT = 100
+
+    def get_int_param(self, name, default, maximum):
+        try:
+            return max(1, min(int(self.request.query_params.get(name, default)), maximum))
+        except (TypeError, ValueError):
+            return default
+
+    def get(self, request):
+        days = self.get_int_param('days', 30, self.MAX_DAYS)
+        limit = self.get_int_param('limit', 10, self.MAX_LIMIT)
+
+        daily = list(DailyRevenue.objects.order_by('-date').values('date', 'order_count', 'revenue')[:days])
+        data = {
+            'daily_revenue': daily,
+            'period': {
+                'days': days,
+                'order_count': sum(day['order_count'] for day in daily),
+                'revenue': sum((day['revenue'] for day in daily), Decimal(0)),
+            },
+            'top_products': list(
+                ProductSales.objects.order_by('-units_sold')
+                .values('product_id', 'product__name', 'units_sold', 'revenue')[:limit]
+            ),
+            'top_customers': list(
+                UserOrderSummary.objects.order_by('-total_spent')
+                .values('user_id', 'user__username', 'order_count', 'total_spent')[:limit]
+            ),
+        }
+
+        user_id = request.query_params.get('user', '')
+        if user_id.isdigit():
+            data['user'] = UserOrderSummary.objects.filter(user_id=user_id).values().first()
+        return Response(data)
+
+
+class CartItemViewSet(SparseFieldsetMixin, ModelViewSet):
     serializer_class = CartItemSerializer
     permission_classes = [IsAuthenticated]
 
@@ -281,6 +569,16 @@ class CartItemViewSet(ModelViewSet):
         .select_related('product')\
         .order_by('-id')
 
+    def list(self, request, *args, **kwargs):
+        values_serializer = self.get_values_serializer()
+        if values_serializer is None:
+            return super().list(request, *args, **kwargs)
+        queryset = values_serializer.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            return Response(values_serializer.serialize(queryset))
+        return self.get_paginated_response(values_serializer.serialize(page))
+
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -293,62 +591,99 @@ class PlaceOrderView(APIView):
 
     @transaction.atomic
     def post(self, request):
-        user = request.user
-        cart_items = CartItem.objects.filter(user=user)
-
-        if not cart_items.exists():
-            return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order = place_order(request.user)
+        except CheckoutError as e:
+            transaction.set_rollback(True)
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        total_amount = Decimal(0)
-        order = Order.objects.create(user=user, total_amount=0)
+        return Response({"message": "✅ Order has been placed!", "order_id": order.id}, status=status.HTTP_201_CREATED)
 
-        for item in cart_items:
-            product = item.product
 
-            if product.stock < item.quantity:
-                transaction.set_rollback(True)
-                return Response({
-                    "detail": f"Not enough stock for {product.name}"
-                }, status=status.HTTP_400_BAD_REQUEST)
+class QueueOrderView(APIView):
+    """Queue the cart for the order worker and return a ticket right away"""
+    permission_classes = [IsAuthenticated]
 
-            # Decrease stock
-            product.stock -= item.quantity
-            product.save()
+    def post(self, request):
+        try:
+            order_request = enqueue_order(request.user)
+        except CheckoutError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Create OrderItem
-            OrderItem.objects.create(
-                order=order,
-                product=product,
-                quantity=item.quantity,
-                price=item.price
-            )
+        return Response({
+            "message": "⏳ Your order is being placed",
+            "ticket": order_request.id,
+            "status": order_request.status,
+        }, status=status.HTTP_202_ACCEPTED)
 
-            total_amount += item.total_price
 
-        order.total_amount = total_amount
-        order.save()
+class OrderRequestStatusView(APIView):
+    permission_classes = [IsAuthenticated]
 
-        # Clear cart
-        cart_items.delete()
+    def get(self, request, pk):
+        order_request = OrderRequest.objects.filter(user=request.user, pk=pk)\
+            .values('id', 'status', 'order_id', 'error').first()
+        if order_request is None:
+            return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        return Response({"message": "✅ Order has been placed!"}, status=status.HTTP_201_CREATED)
+        return Response({
+            "ticket": order_request['id'],
+            "status": order_request['status'],
+            "order_id": order_request['order_id'],
+            "error": order_request['error'],
+        })
 
 
 from rest_framework import generics
 
 
 class MyOrdersAPIView(APIView):
+    """The user's orders, newest first, continuing into archived orders
+
+    ?limit= (default 20) and ?offset= page through the hot orders first;
+    the archive is only queried once a page reaches past them. Orders are
+    built from their snapshot column in one query per table; orders placed
+    before snapshots existed go through the serializer.
+    """
     permission_classes = [IsAuthenticated]
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 100
+    HISTORY_FIELDS = ('id', 'user_id', 'created_at', 'status', 'snapshot')
+
+    def get_limit(self):
+        try:
+            return max(1, min(int(self.request.query_params['limit']), self.MAX_LIMIT))
+        except (KeyError, TypeError, ValueError):
+            return self.DEFAULT_LIMIT
+
+    def get_offset(self):
+        try:
+            return max(0, int(self.request.query_params.get('offset', 0)))
+        except (TypeError, ValueError):
+            return 0
+
+    def history(self, rows, legacy_queryset, serializer_class):
+        missing = [row['id'] for row in rows if row['snapshot'] is None]
+        legacy = {}
+        if missing:
+            legacy = {order['id']: order
+                      for order in serializer_class(legacy_queryset.filter(id__in=missing), many=True).data}
+        return [order_history_row(row) if row['snapshot'] is not None else legacy[row['id']] for row in rows]
 
     def get(self, request):
-        # orders = Order.objects.filter(user=request.user).order_by('-created_at')
-
-        orders = Order.objects.filter(user=request.user)\
-            .prefetch_related(
-                'items',                      # Order -> OrderItem (reverse FK)
-                'items__product'              # OrderItem -> Product
-            )\
-            .select_related()\
-            .order_by('-created_at')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        limit, offset = self.get_limit(), self.get_offset()
+
+        # id breaks created_at ties so offset pages never repeat or skip an order
+        orders = Order.objects.filter(user=request.user).order_by('-created_at', '-id')
+        page = list(orders[offset:offset + limit].values(*self.HISTORY_FIELDS))
+        data = self.history(page, Order.objects.prefetch_related('items', 'items__product'), OrderSerializer)
+
+        if len(page) < limit:
+            # Ran out of hot orders: continue with the archive
+            hot_count = offset + len(page) if page or not offset else orders.count()
+            archive_offset = max(offset - hot_count, 0)
+            archived = ArchivedOrder.objects.filter(user=request.user).order_by('-created_at', '-id')
+            archived = archived[archive_offset:archive_offset + limit - len(page)]
+            data += self.history(list(archived.values(*self.HISTORY_FIELDS)),
+                                 ArchivedOrder.objects.prefetch_related('items'), ArchivedOrderSerializer)
+        return Response(data)